@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+バッチ実行モジュール
+
+JSONLファイルから読み込んだ複数のタスクを、1つのプロセスで並行して実行します。
+タスクごとに作業ディレクトリとログファイルを分け、結果・所要時間・トークン使用量を
+1つの結果ファイル（JSONL）に書き込みます。プロセスを共有するため、ファイル内容キャッシュや
+ワークスペースインデックスはタスク間で共有されます。
+
+入力ファイルの各行:
+    {"id": "task-1", "task": "タスクの内容", "workdir": "作業ディレクトリ（省略可）", "max_turns": 20}
+
+使用例:
+    python batch.py tasks.jsonl --concurrency 8 --output results.jsonl
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import datetime
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# sys.pathにプロジェクトのルートディレクトリを追加
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agents import Agent, Runner
+
+from config import settings
+from log_manager import logger
+from log_manager import tracer
+from utils import helpers
+from utils import shell_session
+from utils import artifact_store
+from utils import scheduler
+from utils.task_context import TaskContext, task_scope
+from utils.usage import UsageHooks, TokenBudgetExceeded
+from main import initialize_agent
+
+# 作業ディレクトリを指定しないタスクは、このディレクトリの下にタスクIDのディレクトリを作成する
+DEFAULT_WORKDIR_ROOT = Path("batch_runs")
+
+@dataclass
+class BatchTask:
+    """入力ファイルの1行分のタスク"""
+    task_id: str
+    task: str
+    workdir: Optional[Path] = None
+    max_turns: Optional[int] = None
+
+def load_tasks(path: Path) -> List[BatchTask]:
+    """入力ファイルからタスクを読み込む
+
+    Args:
+        path: JSONLファイルのパス
+
+    Returns:
+        タスクのリスト
+
+    Raises:
+        ValueError: 行の形式が正しくない場合、またはタスクIDが重複している場合
+    """
+    tasks = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{number}: JSONとして解釈できません: {e}")
+            if not isinstance(entry, dict) or not entry.get("task"):
+                raise ValueError(f"{path}:{number}: \"task\" がありません")
+
+            # タスクIDはファイル名に使うため、使えない文字を置き換える
+            task_id = re.sub(r"[^\w.-]", "_", str(entry.get("id") or f"task-{number:04d}"))
+            if task_id in seen:
+                raise ValueError(f"{path}:{number}: タスクID '{task_id}' が重複しています")
+            seen.add(task_id)
+
+            tasks.append(BatchTask(
+                task_id=task_id,
+                task=str(entry["task"]),
+                workdir=Path(entry["workdir"]) if entry.get("workdir") else None,
+                max_turns=int(entry["max_turns"]) if entry.get("max_turns") else None
+            ))
+    return tasks
+
+class BatchRunner:
+    """タスクを同時実行数の上限まで並行して実行するランナー"""
+
+    def __init__(self, agent: Agent, output_path: Path, log_dir: Path, concurrency: int,
+                 workdir_root: Path = DEFAULT_WORKDIR_ROOT, auto_approve: bool = False):
+        """ランナーの初期化
+
+        Args:
+            agent: 全タスクで共有するエージェント
+            output_path: 結果ファイルのパス
+            log_dir: タスクごとのログを書き込むディレクトリ
+            concurrency: 同時に実行するタスク数
+            workdir_root: 作業ディレクトリを指定しないタスクの作業ディレクトリを作成する場所
+            auto_approve: 承認が必要なコマンドを確認せずに実行するかどうか
+        """
+        self.agent = agent
+        self.output_path = output_path
+        self.log_dir = log_dir
+        self.concurrency = max(1, concurrency)
+        self.workdir_root = workdir_root
+        self.auto_approve = auto_approve
+        self._output = None
+        self._done = 0
+        self._total = 0
+
+    async def run(self, tasks: List[BatchTask]) -> List[Dict[str, Any]]:
+        """すべてのタスクを実行
+
+        結果は完了した順に結果ファイルへ書き込むため、途中で中断しても完了した分は残ります。
+
+        Args:
+            tasks: 実行するタスク
+
+        Returns:
+            タスクごとの結果（入力の順）
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._total = len(tasks)
+        self._done = 0
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.output_path, "a", encoding="utf-8") as output:
+            self._output = output
+            try:
+                # asyncio のタスクごとにコンテキストがコピーされるため、作業ディレクトリとログは混ざらない
+                return await asyncio.gather(*(self._run_with_limit(semaphore, task) for task in tasks))
+            finally:
+                self._output = None
+
+    async def _run_with_limit(self, semaphore: asyncio.Semaphore, task: BatchTask) -> Dict[str, Any]:
+        async with semaphore:
+            result = await self._run_task(task)
+        self._write_result(result)
+        return result
+
+    async def _run_task(self, task: BatchTask) -> Dict[str, Any]:
+        workdir = (task.workdir or self.workdir_root / task.task_id).resolve()
+        log_path = (self.log_dir / f"{task.task_id}.jsonl").resolve()
+        record: Dict[str, Any] = {
+            "id": task.task_id,
+            "workdir": str(workdir),
+            "log": str(log_path),
+            "status": "success",
+            "final_output": None,
+            "error": None,
+            "usage": None
+        }
+
+        context = TaskContext(task.task_id, workdir, log_path, auto_approve=self.auto_approve)
+        # トークン使用量の集計と上限はタスクごと
+        usage_hooks = UsageHooks(settings.get_session_token_budget())
+        start = time.monotonic()
+        with task_scope(context):
+            try:
+                helpers.ensure_directory(workdir)
+                logger.log_event("task_start", {"id": task.task_id, "task": task.task, "workdir": str(workdir)})
+
+                kwargs = {"max_turns": task.max_turns} if task.max_turns else {}
+                with tracer.span("task", "task", {"id": task.task_id}):
+                    result = await Runner.run(self.agent, task.task, hooks=usage_hooks, **kwargs)
+
+                record["final_output"] = result.final_output
+            except TokenBudgetExceeded as e:
+                record["status"] = "budget_exceeded"
+                record["error"] = str(e)
+            except asyncio.CancelledError:
+                record["status"] = "cancelled"
+                raise
+            except Exception as e:
+                record["status"] = "error"
+                record["error"] = f"{type(e).__name__}: {str(e)}"
+                logger.log_error(f"タスク {task.task_id} の実行中にエラーが発生しました", e)
+            finally:
+                record["usage"] = usage_hooks.summary()
+                record["duration"] = round(time.monotonic() - start, 3)
+                logger.log_event("task_end", {
+                    "id": task.task_id,
+                    "status": record["status"],
+                    "duration": record["duration"],
+                    "usage": record["usage"]
+                })
+                # タスクのシェルセッションを終了（SHELL_SESSION=true の場合のみ起動しています）
+                await shell_session.close_session(task.task_id)
+                logger.close_task_log(log_path)
+        return record
+
+    def _write_result(self, record: Dict[str, Any]) -> None:
+        self._done += 1
+        if self._output is not None:
+            self._output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            self._output.flush()
+        status = "成功" if record["status"] == "success" else f"失敗（{record['error']}）"
+        print(f"[{self._done}/{self._total}] {record['id']}: {status} {record['duration']:.1f}秒")
+
+def summarize(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """バッチ全体の集計
+
+    Args:
+        results: タスクごとの結果
+        elapsed: バッチ全体の所要時間（秒）
+
+    Returns:
+        集計結果
+    """
+    summary = {
+        "tasks": len(results),
+        "succeeded": sum(1 for r in results if r["status"] == "success"),
+        "failed": sum(1 for r in results if r["status"] != "success"),
+        "elapsed": round(elapsed, 3),
+        "task_seconds": round(sum(r["duration"] for r in results), 3),
+        "input_tokens": 0,
+        "cached_tokens": 0,
+        "output_tokens": 0,
+        "total_tokens": 0
+    }
+    for result in results:
+        usage = result.get("usage") or {}
+        for key in ("input_tokens", "cached_tokens", "output_tokens", "total_tokens"):
+            summary[key] += usage.get(key, 0)
+    return summary
+
+async def run_batch_async(args: argparse.Namespace) -> None:
+    """バッチ実行の非同期メイン関数"""
+    logger.setup_logging()
+
+    tasks = load_tasks(Path(args.tasks))
+    started = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_dir = logger.LOG_DIR / f"batch_{started}"
+    output_path = Path(args.output) if args.output else log_dir / "results.jsonl"
+    concurrency = args.concurrency or settings.get_batch_concurrency()
+
+    agent = initialize_agent()
+    runner = BatchRunner(
+        agent, output_path, log_dir, concurrency,
+        workdir_root=Path(args.workdir_root), auto_approve=args.auto_approve
+    )
+
+    print(f"{len(tasks)}件のタスクを同時実行数 {concurrency} で実行します。")
+    logger.log_event("batch_start", {"tasks": len(tasks), "concurrency": concurrency, "output": str(output_path)})
+    start = time.monotonic()
+    try:
+        results = await runner.run(tasks)
+        summary = summarize(results, time.monotonic() - start)
+        logger.log_event("batch_end", summary)
+        print(f"\n成功: {summary['succeeded']}件, 失敗: {summary['failed']}件, "
+              f"所要時間: {summary['elapsed']:.1f}秒, トークン: {summary['total_tokens']}")
+        print(f"結果: {output_path}")
+    finally:
+        await shell_session.close_all()
+        # アーティファクトに保存したツールの結果を記録
+        artifact_stats = artifact_store.stats()
+        if artifact_stats and artifact_stats["stored"]:
+            logger.log_event("artifacts", artifact_stats)
+        # レート制限による待ち時間と再試行を記録（すべてのタスクの合計）
+        scheduler_stats = scheduler.stats()
+        if scheduler_stats and scheduler_stats["requests"]:
+            logger.log_event("scheduler", scheduler_stats)
+        # ファイル内容キャッシュの効果を記録
+        logger.log_event("file_cache", helpers.file_cache.stats())
+        # 記録したスパンを書き出す（SPAN_TRACE_FILE を指定した場合のみ）
+        tracer.save()
+        logger.shutdown_logging()
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="JSONLファイルのタスクを並行して実行します。")
+    parser.add_argument("tasks", help="タスクのJSONLファイル")
+    parser.add_argument("-o", "--output", help="結果ファイル（省略時は logs/batch_<日時>/results.jsonl）")
+    parser.add_argument("-c", "--concurrency", type=int, default=0,
+                        help="同時に実行するタスク数（省略時は BATCH_CONCURRENCY）")
+    parser.add_argument("--workdir-root", default=str(DEFAULT_WORKDIR_ROOT),
+                        help="作業ディレクトリを指定しないタスクの作業ディレクトリを作成する場所")
+    parser.add_argument("--auto-approve", action="store_true",
+                        help="承認が必要なコマンドを確認せずに実行する（禁止コマンドのチェックは行う）")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_batch_async(args))
+    except KeyboardInterrupt:
+        print("\n\nユーザーによって処理が中断されました。完了したタスクの結果は結果ファイルに書き込まれています。")
+    except ValueError as e:
+        print(f"エラー: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
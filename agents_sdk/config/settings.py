@@ -9,13 +9,39 @@
 
 import os
 from typing import Dict, Any, Optional
-from dotenv import load_dotenv
 
 # デフォルト設定
 DEFAULT_SETTINGS = {
     "MODEL_NAME": "gpt-4",
     "LOG_LEVEL": "INFO",
     "ENABLE_TRACING": "true",
+    "LOG_WRITER_MODE": "buffered",
+    "LOG_FLUSH_INTERVAL": "1.0",
+    "LOG_FLUSH_SIZE": "100",
+    "COMMAND_TIMEOUT": "300",
+    "COMMAND_OUTPUT_LIMIT": "1048576",
+    "FILE_CACHE_MAX_BYTES": "67108864",
+    "READ_MAX_BYTES": "262144",
+    "MMAP_THRESHOLD": "8388608",
+    "WORKSPACE_INDEX": "true",
+    "SEARCH_MAX_RESULTS": "100",
+    "SEARCH_WORKERS": "0",
+    "BATCH_CONCURRENCY": "4",
+    "SPAN_TRACE_FILE": "",
+    "SESSION_TOKEN_BUDGET": "0",
+    "SHELL_SESSION": "false",
+    "SHELL_POOL_SIZE": "4",
+    "ARTIFACT_THRESHOLD": "16384",
+    "ARTIFACT_PREVIEW_BYTES": "2048",
+    "ARTIFACT_DIR": ".agent_cache/artifacts",
+    "ARTIFACT_MAX_BYTES": "268435456",
+    "CHECKPOINT": "true",
+    "CHECKPOINT_DIR": ".agent_cache/sessions",
+    "RATE_LIMIT_RPM": "0",
+    "RATE_LIMIT_TPM": "0",
+    "MAX_RETRIES": "5",
+    "RETRY_BASE_DELAY": "1.0",
+    "RETRY_MAX_DELAY": "60.0",
 }
 
 class Settings:
@@ -26,7 +52,8 @@ class Settings:
     
     def __init__(self):
         """設定の初期化"""
-        # 環境変数をロード
+        # 環境変数をロード（インポートしただけでは .env を読まないよう、ここで読み込む）
+        from dotenv import load_dotenv
         load_dotenv()
         
         # 設定値の初期化
@@ -85,6 +112,223 @@ class Settings:
         """
         return self.get("LOG_LEVEL")
     
+    def get_log_writer_mode(self) -> str:
+        """ログの書き込みモードを取得
+        
+        Returns:
+            "buffered"（バックグラウンドでまとめて書き込む）または "sync"（都度書き込む）
+        """
+        return self.get("LOG_WRITER_MODE", "buffered").lower()
+    
+    def get_log_flush_interval(self) -> float:
+        """バッファしたログを書き出す間隔（秒）を取得
+        
+        Returns:
+            書き出し間隔（秒）
+        """
+        return float(self.get("LOG_FLUSH_INTERVAL", "1.0"))
+    
+    def get_log_flush_size(self) -> int:
+        """バッファしたログを書き出す件数を取得
+        
+        Returns:
+            書き出し件数
+        """
+        return int(self.get("LOG_FLUSH_SIZE", "100"))
+    
+    def get_command_timeout(self) -> float:
+        """コマンド実行のタイムアウト（秒）を取得
+        
+        Returns:
+            タイムアウト（秒）。0以下の場合は無制限
+        """
+        return float(self.get("COMMAND_TIMEOUT", "300"))
+    
+    def get_command_output_limit(self) -> int:
+        """コマンド出力の最大取得バイト数を取得
+        
+        Returns:
+            標準出力・標準エラーそれぞれの最大取得バイト数
+        """
+        return int(self.get("COMMAND_OUTPUT_LIMIT", "1048576"))
+    
+    def get_file_cache_max_bytes(self) -> int:
+        """ファイル内容キャッシュの上限（バイト）を取得
+        
+        Returns:
+            キャッシュ全体の上限（バイト）
+        """
+        return int(self.get("FILE_CACHE_MAX_BYTES", "67108864"))
+    
+    def get_read_max_bytes(self) -> int:
+        """read_file で1回に返す最大バイト数を取得
+        
+        Returns:
+            最大バイト数（超える場合は先頭部分だけを返す）
+        """
+        return int(self.get("READ_MAX_BYTES", "262144"))
+    
+    def get_mmap_threshold(self) -> int:
+        """範囲指定の読み取りを mmap と行インデックスで行うファイルの大きさを取得
+        
+        Returns:
+            この大きさ以上のファイルは mmap で読み取る（バイト）
+        """
+        return max(0, int(self.get("MMAP_THRESHOLD", "8388608")))
+    
+    def is_workspace_index_enabled(self) -> bool:
+        """ワークスペースインデックスが有効かどうかを取得
+        
+        Returns:
+            list_file でディスクに保存したインデックスを使用するかどうか
+        """
+        return self.get("WORKSPACE_INDEX", "true").lower() == "true"
+    
+    def get_search_max_results(self) -> int:
+        """検索で返す一致行数の上限を取得
+        
+        Returns:
+            一致行数の上限
+        """
+        return int(self.get("SEARCH_MAX_RESULTS", "100"))
+    
+    def get_search_workers(self) -> int:
+        """検索に使うプロセス数を取得
+        
+        Returns:
+            プロセス数（0の場合はCPUコア数）
+        """
+        workers = int(self.get("SEARCH_WORKERS", "0"))
+        return workers if workers > 0 else (os.cpu_count() or 1)
+    
+    def get_batch_concurrency(self) -> int:
+        """バッチモードで同時に実行するタスク数を取得
+        
+        Returns:
+            同時に実行するタスク数
+        """
+        return max(1, int(self.get("BATCH_CONCURRENCY", "4")))
+    
+    def get_span_trace_file(self) -> str:
+        """スパンのトレース（Chrome のトレースイベント形式）の書き出し先を取得
+        
+        Returns:
+            書き出し先のファイル（空の場合は記録しない）
+        """
+        return self.get("SPAN_TRACE_FILE", "")
+    
+    def get_session_token_budget(self) -> int:
+        """1回の実行（セッション）で使用できるトークン数の上限を取得
+        
+        Returns:
+            トークン数の上限（0の場合は無制限）
+        """
+        return max(0, int(self.get("SESSION_TOKEN_BUDGET", "0")))
+    
+    def is_shell_session_enabled(self) -> bool:
+        """execute_command を永続的なシェルセッションで実行するかどうかを取得
+        
+        Returns:
+            永続的なシェルセッションを使用する場合は True
+        """
+        return self.get("SHELL_SESSION", "false").lower() == "true"
+    
+    def get_shell_pool_size(self) -> int:
+        """同時に保持するシェルセッションの最大数を取得
+        
+        Returns:
+            シェルセッションの最大数
+        """
+        return max(1, int(self.get("SHELL_POOL_SIZE", "4")))
+    
+    def get_artifact_threshold(self) -> int:
+        """ツールの結果をアーティファクトに保存する大きさの下限を取得
+        
+        Returns:
+            これを超える大きさ（バイト）の結果を保存（0の場合は保存しない）
+        """
+        return max(0, int(self.get("ARTIFACT_THRESHOLD", "16384")))
+    
+    def get_artifact_preview_bytes(self) -> int:
+        """アーティファクトのプレビューに含める大きさを取得
+        
+        Returns:
+            先頭と末尾のそれぞれのバイト数
+        """
+        return max(0, int(self.get("ARTIFACT_PREVIEW_BYTES", "2048")))
+    
+    def get_artifact_dir(self) -> str:
+        """アーティファクトの保存先を取得
+        
+        Returns:
+            保存先のディレクトリ
+        """
+        return self.get("ARTIFACT_DIR", ".agent_cache/artifacts")
+    
+    def get_artifact_max_bytes(self) -> int:
+        """すべての実行のアーティファクトの合計の上限を取得
+        
+        Returns:
+            合計の上限（バイト。0の場合は無制限）
+        """
+        return max(0, int(self.get("ARTIFACT_MAX_BYTES", "268435456")))
+    
+    def is_checkpoint_enabled(self) -> bool:
+        """セッションのチェックポイントを記録するかどうかを取得
+        
+        Returns:
+            チェックポイントを記録する場合は True
+        """
+        return self.get("CHECKPOINT", "true").lower() == "true"
+    
+    def get_checkpoint_dir(self) -> str:
+        """チェックポイントの保存先を取得
+        
+        Returns:
+            保存先のディレクトリ
+        """
+        return self.get("CHECKPOINT_DIR", ".agent_cache/sessions")
+    
+    def get_rate_limit_rpm(self) -> float:
+        """1分あたりのリクエスト数の上限を取得
+        
+        Returns:
+            リクエスト数の上限（0の場合は無制限）
+        """
+        return max(0.0, float(self.get("RATE_LIMIT_RPM", "0")))
+    
+    def get_rate_limit_tpm(self) -> float:
+        """1分あたりのトークン数の上限を取得
+        
+        Returns:
+            トークン数の上限（0の場合は無制限）
+        """
+        return max(0.0, float(self.get("RATE_LIMIT_TPM", "0")))
+    
+    def get_max_retries(self) -> int:
+        """レート制限や一時的なエラーで送り直す最大回数を取得
+        
+        Returns:
+            送り直す最大回数
+        """
+        return max(0, int(self.get("MAX_RETRIES", "5")))
+    
+    def get_retry_base_delay(self) -> float:
+        """指数バックオフの最初の待ち時間を取得
+        
+        Returns:
+            待ち時間（秒）
+        """
+        return max(0.0, float(self.get("RETRY_BASE_DELAY", "1.0")))
+    
+    def get_retry_max_delay(self) -> float:
+        """指数バックオフの待ち時間の上限を取得
+        
+        Returns:
+            待ち時間の上限（秒）
+        """
+        return max(0.0, float(self.get("RETRY_MAX_DELAY", "60.0")))
+    
     def get_all(self) -> Dict[str, Any]:
         """すべての設定値を取得
         
@@ -93,31 +337,145 @@ class Settings:
         """
         return self._settings.copy()
 
-# シングルトンインスタンス
-_settings = Settings()
+# シングルトンインスタンス（最初に設定値を参照したときに作成）
+_settings: Optional[Settings] = None
+
+def _get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
 
 # モジュールレベルの関数
 
 def get_api_key() -> Optional[str]:
     """OpenAI APIキーを取得"""
-    return _settings.get_api_key()
+    return _get_settings().get_api_key()
 
 def get_model_name() -> str:
     """使用するモデル名を取得"""
-    return _settings.get_model_name()
+    return _get_settings().get_model_name()
 
 def is_tracing_enabled() -> bool:
     """トレース機能が有効かどうかを取得"""
-    return _settings.is_tracing_enabled()
+    return _get_settings().is_tracing_enabled()
 
 def get_log_level() -> str:
     """ログレベルを取得"""
-    return _settings.get_log_level()
+    return _get_settings().get_log_level()
+
+def get_log_writer_mode() -> str:
+    """ログの書き込みモードを取得"""
+    return _get_settings().get_log_writer_mode()
+
+def get_log_flush_interval() -> float:
+    """バッファしたログを書き出す間隔（秒）を取得"""
+    return _get_settings().get_log_flush_interval()
+
+def get_log_flush_size() -> int:
+    """バッファしたログを書き出す件数を取得"""
+    return _get_settings().get_log_flush_size()
+
+def get_command_timeout() -> float:
+    """コマンド実行のタイムアウト（秒）を取得"""
+    return _get_settings().get_command_timeout()
+
+def get_command_output_limit() -> int:
+    """コマンド出力の最大取得バイト数を取得"""
+    return _get_settings().get_command_output_limit()
+
+def get_file_cache_max_bytes() -> int:
+    """ファイル内容キャッシュの上限（バイト）を取得"""
+    return _get_settings().get_file_cache_max_bytes()
+
+def get_read_max_bytes() -> int:
+    """read_file で1回に返す最大バイト数を取得"""
+    return _get_settings().get_read_max_bytes()
+
+def get_mmap_threshold() -> int:
+    """mmap で読み取るファイルの大きさを取得"""
+    return _get_settings().get_mmap_threshold()
+
+def is_workspace_index_enabled() -> bool:
+    """ワークスペースインデックスが有効かどうかを取得"""
+    return _get_settings().is_workspace_index_enabled()
+
+def get_search_max_results() -> int:
+    """検索で返す一致行数の上限を取得"""
+    return _get_settings().get_search_max_results()
+
+def get_search_workers() -> int:
+    """検索に使うプロセス数を取得"""
+    return _get_settings().get_search_workers()
+
+def get_batch_concurrency() -> int:
+    """バッチモードで同時に実行するタスク数を取得"""
+    return _get_settings().get_batch_concurrency()
+
+def get_span_trace_file() -> str:
+    """スパンのトレースの書き出し先を取得"""
+    return _get_settings().get_span_trace_file()
+
+def get_session_token_budget() -> int:
+    """セッションのトークン数の上限を取得"""
+    return _get_settings().get_session_token_budget()
+
+def is_shell_session_enabled() -> bool:
+    """永続的なシェルセッションを使用するかどうかを取得"""
+    return _get_settings().is_shell_session_enabled()
+
+def get_shell_pool_size() -> int:
+    """シェルセッションの最大数を取得"""
+    return _get_settings().get_shell_pool_size()
+
+def get_artifact_threshold() -> int:
+    """アーティファクトに保存する大きさの下限を取得"""
+    return _get_settings().get_artifact_threshold()
+
+def get_artifact_preview_bytes() -> int:
+    """アーティファクトのプレビューの大きさを取得"""
+    return _get_settings().get_artifact_preview_bytes()
+
+def get_artifact_dir() -> str:
+    """アーティファクトの保存先を取得"""
+    return _get_settings().get_artifact_dir()
+
+def get_artifact_max_bytes() -> int:
+    """アーティファクトの合計の上限を取得"""
+    return _get_settings().get_artifact_max_bytes()
+
+def is_checkpoint_enabled() -> bool:
+    """チェックポイントを記録するかどうかを取得"""
+    return _get_settings().is_checkpoint_enabled()
+
+def get_checkpoint_dir() -> str:
+    """チェックポイントの保存先を取得"""
+    return _get_settings().get_checkpoint_dir()
+
+def get_rate_limit_rpm() -> float:
+    """1分あたりのリクエスト数の上限を取得"""
+    return _get_settings().get_rate_limit_rpm()
+
+def get_rate_limit_tpm() -> float:
+    """1分あたりのトークン数の上限を取得"""
+    return _get_settings().get_rate_limit_tpm()
+
+def get_max_retries() -> int:
+    """送り直す最大回数を取得"""
+    return _get_settings().get_max_retries()
+
+def get_retry_base_delay() -> float:
+    """指数バックオフの最初の待ち時間を取得"""
+    return _get_settings().get_retry_base_delay()
+
+def get_retry_max_delay() -> float:
+    """指数バックオフの待ち時間の上限を取得"""
+    return _get_settings().get_retry_max_delay()
 
 def get(key: str, default: Any = None) -> Any:
     """設定値を取得"""
-    return _settings.get(key, default)
+    return _get_settings().get(key, default)
 
 def get_all() -> Dict[str, Any]:
     """すべての設定値を取得"""
-    return _settings.get_all() 
\ No newline at end of file
+    return _get_settings().get_all() 
\ No newline at end of file
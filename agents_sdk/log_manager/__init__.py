@@ -4,4 +4,5 @@
 このパッケージには、ログ記録と追跡機能が含まれています。
 """
 
-from . import logger 
\ No newline at end of file
+from . import logger
+from . import tracer 
\ No newline at end of file
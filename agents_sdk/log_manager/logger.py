@@ -9,21 +9,20 @@
 
 import os
 import json
+import time
+import queue
+import atexit
 import datetime
 import logging
-from typing import Any, Dict, Optional
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 from pathlib import Path
 
-try:
-    from agents.tracing import enable_tracing
-    TRACING_AVAILABLE = True
-except ImportError:
-    TRACING_AVAILABLE = False
-
 # 絶対インポートに変更
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import settings
+from utils.task_context import current_task
 
 # ロガーの設定
 logging.basicConfig(
@@ -36,31 +35,249 @@ logger = logging.getLogger("ai_coding_agent")
 # ログディレクトリのパス
 LOG_DIR = Path("logs")
 
-def setup_logging() -> None:
-    """ロギング機能のセットアップ"""
+def setup_logging(tracing: bool = True) -> None:
+    """ロギング機能のセットアップ
+    
+    Args:
+        tracing: トレース機能も有効化するかどうか（False の場合は後で setup_tracing を呼び出します）
+    """
     # ログディレクトリの作成
     LOG_DIR.mkdir(exist_ok=True)
     
-    # トレース機能の有効化（利用可能な場合）
-    if TRACING_AVAILABLE and settings.is_tracing_enabled():
-        # 日付を含むトレースファイル名のプレフィックス
-        today = datetime.datetime.now().strftime("%Y%m%d")
-        trace_prefix = f"agent_trace_{today}"
-        
-        try:
-            enable_tracing(
-                directory=str(LOG_DIR),
-                file_prefix=trace_prefix
-            )
-            logger.info(f"トレース機能を有効化しました: {LOG_DIR}/{trace_prefix}")
-        except Exception as e:
-            logger.error(f"トレース機能の有効化に失敗しました: {str(e)}")
+    if tracing:
+        setup_tracing()
+
+def setup_tracing() -> None:
+    """OpenAI Agents SDKのトレース機能の有効化（利用可能な場合）
+    
+    agents の読み込みには時間がかかるため、モジュールのインポート時ではなくここで読み込みます。
+    """
+    if not settings.is_tracing_enabled():
+        return
+    try:
+        from agents.tracing import enable_tracing
+    except ImportError:
+        return
+    
+    # 日付を含むトレースファイル名のプレフィックス
+    today = datetime.datetime.now().strftime("%Y%m%d")
+    trace_prefix = f"agent_trace_{today}"
+    
+    try:
+        enable_tracing(
+            directory=str(LOG_DIR),
+            file_prefix=trace_prefix
+        )
+        logger.info(f"トレース機能を有効化しました: {LOG_DIR}/{trace_prefix}")
+    except Exception as e:
+        logger.error(f"トレース機能の有効化に失敗しました: {str(e)}")
 
 def get_log_file() -> Path:
     """現在の日付に基づくログファイルパスを取得"""
     today = datetime.datetime.now().strftime("%Y%m%d")
     return LOG_DIR / f"agent_log_{today}.jsonl"
 
+class BufferedLogWriter:
+    """ログをバックグラウンドスレッドでまとめて書き込むライター
+    
+    呼び出し側はキューにログ行を積むだけで、ファイルへの書き込みは
+    バックグラウンドスレッドが開いたままのファイルハンドルに対して行います。
+    flush_size 件たまるか、最初の1件から flush_interval 秒経過した時点で
+    書き出し、日付が変わると新しい日付のファイルに切り替えます。
+    出力先を指定したログ（バッチモードのタスクごとのログ）は、close_stream が
+    呼ばれるまでそのファイルを開いたままにします。
+    """
+    
+    _FLUSH = "flush"
+    _STOP = "stop"
+    _CLOSE_STREAM = "close_stream"
+    
+    def __init__(self, log_dir: Path, flush_interval: float = 1.0, flush_size: int = 100):
+        """ライターの初期化
+        
+        Args:
+            log_dir: ログディレクトリ
+            flush_interval: 書き出し間隔（秒）
+            flush_size: 書き出し件数
+        """
+        self.log_dir = log_dir
+        self.flush_interval = flush_interval
+        self.flush_size = max(1, flush_size)
+        self._queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        self._file = None
+        self._file_date: Optional[str] = None
+        self._streams: Dict[Path, Any] = {}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+    
+    def write(self, date: str, line: str, path: Optional[Path] = None) -> None:
+        """ログ行を書き込みキューに積む
+        
+        Args:
+            date: ログの日付（YYYYMMDD）。書き込み先ファイルの決定に使用
+            line: 書き込む1行（改行を含む）
+            path: 書き込み先ファイル。指定した場合は日付ごとのファイルの代わりに使用
+        """
+        self._queue.put((date, (line, path)))
+    
+    def close_stream(self, path: Path) -> None:
+        """出力先を指定したログを書き出してファイルを閉じる
+        
+        Args:
+            path: write で指定した書き込み先ファイル
+        """
+        if not self._closed:
+            self._queue.put((self._CLOSE_STREAM, path))
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """キューに積まれたログをすべて書き出すまで待つ
+        
+        Args:
+            timeout: 待機する最大秒数
+            
+        Returns:
+            時間内に書き出しが完了した場合True
+        """
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put((self._FLUSH, done))
+        return done.wait(timeout)
+    
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """残りのログを書き出してライターを停止
+        
+        Args:
+            timeout: 待機する最大秒数
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((self._STOP, None))
+        self._thread.join(timeout)
+    
+    def _run(self) -> None:
+        pending: List[Tuple[str, Tuple[str, Optional[Path]]]] = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if pending else None
+            try:
+                kind, payload = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._write_batch(pending)
+                continue
+            
+            if kind == self._FLUSH:
+                self._write_batch(pending)
+                payload.set()
+            elif kind == self._CLOSE_STREAM:
+                self._write_batch(pending)
+                self._close_stream(payload)
+            elif kind == self._STOP:
+                self._write_batch(pending)
+                self._close_file()
+                for path in list(self._streams):
+                    self._close_stream(path)
+                return
+            else:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append((kind, payload))
+                if len(pending) >= self.flush_size:
+                    self._write_batch(pending)
+    
+    def _write_batch(self, pending: List[Tuple[str, Tuple[str, Optional[Path]]]]) -> None:
+        try:
+            for date, (line, path) in pending:
+                target = self._get_stream(path) if path is not None else self._get_file(date)
+                target.write(line)
+            if self._file is not None:
+                self._file.flush()
+            for stream in self._streams.values():
+                stream.flush()
+        except Exception as e:
+            logger.error(f"ログの書き込み中にエラーが発生しました: {str(e)}")
+        finally:
+            pending.clear()
+    
+    def _get_file(self, date: str):
+        # 日付が変わったらファイルを切り替える
+        if self._file is None or self._file_date != date:
+            self._close_file()
+            self.log_dir.mkdir(exist_ok=True)
+            self._file = open(self.log_dir / f"agent_log_{date}.jsonl", "a", encoding="utf-8")
+            self._file_date = date
+        return self._file
+    
+    def _get_stream(self, path: Path):
+        stream = self._streams.get(path)
+        if stream is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            stream = self._streams[path] = open(path, "a", encoding="utf-8")
+        return stream
+    
+    def _close_stream(self, path: Path) -> None:
+        stream = self._streams.pop(path, None)
+        if stream is not None:
+            stream.close()
+    
+    def _close_file(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            finally:
+                self._file = None
+                self._file_date = None
+
+_writer: Optional[BufferedLogWriter] = None
+_writer_lock = threading.Lock()
+_writer_shutdown = False
+
+def _get_writer() -> Optional[BufferedLogWriter]:
+    """バッファ付きライターを取得（sync モードの場合は None）"""
+    global _writer
+    if _writer is None:
+        # 終了処理後は同期書き込みに切り替える
+        if _writer_shutdown or settings.get_log_writer_mode() != "buffered":
+            return None
+        with _writer_lock:
+            if _writer is None:
+                _writer = BufferedLogWriter(
+                    LOG_DIR,
+                    flush_interval=settings.get_log_flush_interval(),
+                    flush_size=settings.get_log_flush_size()
+                )
+                atexit.register(shutdown_logging)
+    return _writer
+
+def flush_logs(timeout: Optional[float] = None) -> None:
+    """バッファされたログをすべて書き出す
+    
+    Args:
+        timeout: 待機する最大秒数
+    """
+    if _writer is not None:
+        _writer.flush(timeout)
+
+def close_task_log(path: Path) -> None:
+    """タスクのログを書き出してファイルを閉じる
+    
+    Args:
+        path: タスクのログファイル
+    """
+    if _writer is not None:
+        _writer.close_stream(path)
+
+def shutdown_logging() -> None:
+    """バッファされたログを書き出してライターを停止"""
+    global _writer, _writer_shutdown
+    with _writer_lock:
+        _writer_shutdown = True
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
 def log_event(event_type: str, data: Any) -> None:
     """イベントをログファイルに記録
     
@@ -69,25 +286,33 @@ def log_event(event_type: str, data: Any) -> None:
         data: イベントデータ
     """
     try:
-        # ログディレクトリの作成（存在しない場合）
-        LOG_DIR.mkdir(exist_ok=True)
-        
-        # ログファイルの取得
-        log_file = get_log_file()
-        
         # タイムスタンプの生成
-        timestamp = datetime.datetime.now().isoformat()
+        now = datetime.datetime.now()
         
         # ログエントリの作成
         log_entry = {
-            "timestamp": timestamp,
+            "timestamp": now.isoformat(),
             "event_type": event_type,
             "data": data
         }
+        line = json.dumps(log_entry, ensure_ascii=False, default=_json_serializer) + "\n"
+        
+        # バッチモードで実行中のタスクのログはタスクごとのファイルに書き込む
+        task = current_task()
+        task_log = task.log_path if task is not None else None
         
-        # JSONLファイルへの書き込み
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False, default=_json_serializer) + "\n")
+        writer = _get_writer()
+        if writer is not None:
+            # バックグラウンドスレッドでまとめて書き込む
+            writer.write(now.strftime("%Y%m%d"), line, task_log)
+        else:
+            # ログディレクトリの作成（存在しない場合）
+            log_file = task_log or get_log_file()
+            log_file.parent.mkdir(parents=True, exist_ok=True)
+            
+            # JSONLファイルへの書き込み
+            with open(log_file, "a", encoding="utf-8") as f:
+                f.write(line)
         
         # ロガーにも記録
         logger.debug(f"イベント記録: {event_type}")
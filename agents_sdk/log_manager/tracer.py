@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+処理時間のスパンの記録
+
+ツールの実行やタスク全体の区間（スパン）を記録し、Chrome のトレースイベント形式（JSON）で
+書き出します。書き出したファイルは Perfetto（https://ui.perfetto.dev）や chrome://tracing で開けます。
+
+.env の SPAN_TRACE_FILE に書き出し先を指定した場合だけ記録します。指定しない場合、
+traced_tool は関数をそのまま返し、span は何もしない共有のオブジェクトを返すため、
+計測のための処理はほとんど発生しません。
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import asyncio
+import functools
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 絶対インポートに変更
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from utils.patcher import atomic_write
+from utils.task_context import current_task
+
+class _NullSpan:
+    """記録しないときに返すスパン（何もしません）"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: Optional[Dict[str, Any]]):
+        self._tracer = tracer
+        self._name = name
+        self._category = category
+        self._args = args
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.set(error=exc_type.__name__)
+        self._tracer.add(self._name, self._category, self._start, end - self._start, self._args)
+        return False
+
+    def set(self, **args):
+        """スパンに引数（トレースの表示で確認できる値）を追加"""
+        if self._args is None:
+            self._args = {}
+        self._args.update(args)
+
+class Tracer:
+    """スパンをメモリに記録し、終了時に Chrome のトレースイベント形式で書き出すクラス
+
+    ツールは asyncio のタスクの中で並行して実行されるため、スパンはスレッドではなく
+    asyncio のタスクごとの行（tid）に表示されます。バッチモードでは行の名前がタスクIDになります。
+    """
+
+    def __init__(self, path: str):
+        """初期化
+
+        Args:
+            path: 書き出し先のファイル
+        """
+        self.path = path
+        self._origin = time.perf_counter_ns()
+        self._pid = os.getpid()
+        self._events: List[Dict[str, Any]] = []
+        self._lanes: Dict[int, Tuple[int, str]] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, category: str = "", args: Optional[Dict[str, Any]] = None) -> _Span:
+        return _Span(self, name, category, args)
+
+    def _lane(self) -> int:
+        """現在の asyncio のタスク（タスクの外ではスレッド）に対応する tid を取得"""
+        try:
+            owner = asyncio.current_task()
+        except RuntimeError:
+            owner = None
+        key = id(owner) if owner is not None else threading.get_ident()
+        lane = self._lanes.get(key)
+        if lane is None:
+            task = current_task()
+            if task is not None:
+                name = task.task_id
+            elif owner is not None:
+                name = owner.get_name()
+            else:
+                name = threading.current_thread().name
+            lane = (len(self._lanes) + 1, name)
+            self._lanes[key] = lane
+        return lane[0]
+
+    def add(self, name: str, category: str, start_ns: int, duration_ns: int, args: Optional[Dict[str, Any]] = None):
+        """完了したスパンを記録
+
+        Args:
+            name: スパンの名前
+            category: 分類
+            start_ns: 開始時刻（time.perf_counter_ns() の値）
+            duration_ns: 経過時間（ナノ秒）
+            args: トレースの表示で確認できる値
+        """
+        with self._lock:
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start_ns - self._origin) / 1000,
+                "dur": duration_ns / 1000,
+                "pid": self._pid,
+                "tid": self._lane(),
+            }
+            if args:
+                event["args"] = args
+            self._events.append(event)
+
+    def save(self):
+        """記録したスパンをファイルに書き出し（一時ファイルを経由して置き換えます）"""
+        with self._lock:
+            metadata = [
+                {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+                for tid, name in self._lanes.values()
+            ]
+            data = {"traceEvents": metadata + self._events, "displayTimeUnit": "ms"}
+        atomic_write(self.path, json.dumps(data, ensure_ascii=False, default=str))
+
+def _create_tracer() -> Optional[Tracer]:
+    path = settings.get_span_trace_file()
+    if not path:
+        return None
+    tracer = Tracer(path)
+    atexit.register(tracer.save)
+    return tracer
+
+_tracer = _create_tracer()
+
+def is_enabled() -> bool:
+    """スパンを記録しているかどうか
+
+    Returns:
+        SPAN_TRACE_FILE が指定されている場合は True
+    """
+    return _tracer is not None
+
+def get_path() -> Optional[str]:
+    """書き出し先のファイルを取得
+
+    Returns:
+        書き出し先のファイル（記録していない場合は None）
+    """
+    return _tracer.path if _tracer is not None else None
+
+def span(name: str, category: str = "", args: Optional[Dict[str, Any]] = None):
+    """区間を記録するコンテキストマネージャーを取得
+
+    Args:
+        name: スパンの名前
+        category: 分類（tool / task など）
+        args: トレースの表示で確認できる値
+
+    Returns:
+        with 文で使うスパン（記録しない場合は何もしないオブジェクト）
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, category, args)
+
+def traced_tool(func: Callable) -> Callable:
+    """ツール関数の呼び出しをスパンとして記録するデコレーター
+
+    @function_tool の下に付けます。functools.wraps で引数と docstring を引き継ぐため、
+    ツールのスキーマは変わりません。記録しない場合は関数をそのまま返します。
+
+    Args:
+        func: ツールのコルーチン関数
+
+    Returns:
+        スパンを記録するコルーチン関数
+    """
+    if _tracer is None:
+        return func
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with _tracer.span(func.__name__, "tool"):
+            return await func(*args, **kwargs)
+    return wrapper
+
+def save():
+    """記録したスパンを書き出し（記録していない場合は何もしません）"""
+    if _tracer is not None:
+        _tracer.save()
@@ -10,19 +10,27 @@ OpenAI Agents SDKを使用したAI Coding Agentのメインモジュールです
 import os
 import sys
 import asyncio
+import argparse
 from pathlib import Path
 
 # sys.pathにプロジェクトのルートディレクトリを追加
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# OpenAI Agents SDKのインポート
-from agents import Agent, Runner
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Union
 
 # 内部モジュールのインポート
+# OpenAI Agents SDK（agents）とそれを使うツールの読み込みには時間がかかるため、
+# タスクの入力を待つ間にバックグラウンドで読み込み、使用する関数の中でインポートする
 from config import settings
 from log_manager import logger
-from tools import file_tools, command_tools, interaction_tools
+from log_manager import tracer
+from utils import helpers
+from utils import shell_session
+from utils import artifact_store
+from utils import checkpoint
+
+# タスクの入力を待つ間に読み込むモジュール
+PRELOAD_MODULES = ("agents", "tools", "utils.usage")
 
 # システムプロンプトを外部ファイルから読み込む
 def load_system_prompt():
@@ -57,16 +65,52 @@ async def list_file(ctx: RunContextWrapper[Any], path: str, recursive: str) -> s
 ファイルの内容を読み取ります。
 ```python
 @function_tool
-async def read_file(ctx: RunContextWrapper[Any], path: str) -> str:
-    \"\"\"ファイルの内容を読み取ります。\"\"\"
+async def read_file(ctx: RunContextWrapper[Any], path: str, start_line: int = 0, end_line: int = 0,
+                    byte_offset: int = 0, byte_length: int = 0) -> str:
+    \"\"\"ファイルの内容を読み取ります。大きなファイルは行（1始まり、終了行を含む）またはバイトの範囲を指定して読み取れます。\"\"\"
 ```
 
 # WriteFile
 ファイルに内容を書き込みます。
 ```python
 @function_tool
-async def write_file(ctx: RunContextWrapper[Any], path: str, content: str) -> str:
-    \"\"\"ファイルに内容を書き込みます。\"\"\"
+async def write_file(ctx: RunContextWrapper[Any], path: str, content: str = "", edit: str = "") -> str:
+    \"\"\"ファイルに内容を書き込みます。既存ファイルの一部だけを変更する場合は content の代わりに edit を指定します。\"\"\"
+```
+edit には次の形式の SEARCH/REPLACE ブロックを1つ以上、または unified diff（@@ -開始行,行数 +開始行,行数 @@）を指定します。
+SEARCH にはファイル内の記述と完全に一致し、1箇所だけに一致する行を書いてください。結果には適用できたハンクと失敗したハンクが表示されます。
+```
+<<<<<<< SEARCH
+変更前の行
+=======
+変更後の行
+>>>>>>> REPLACE
+```
+
+# Search
+ワークスペースのファイルを正規表現で検索します。コードの場所を探すときは、ファイルを1つずつ読む代わりにこのツールを使用してください。
+```python
+@function_tool
+async def search(ctx: RunContextWrapper[Any], pattern: str, path: str = ".", file_pattern: str = "",
+                 ignore_case: bool = False, context_lines: int = 2, max_results: int = 0) -> str:
+    \"\"\"ワークスペースのファイルを正規表現で検索し、一致した行を行番号と前後の行とともに返します。\"\"\"
+```
+
+# FindDefinition
+Pythonのクラス・関数などの定義を探します。定義の場所を探すときは、ファイルを読む代わりにこのツールを使用してください。
+```python
+@function_tool
+async def find_definition(ctx: RunContextWrapper[Any], name: str, references: bool = False) -> str:
+    \"\"\"Pythonのクラス・関数・メソッド・モジュール直下の変数の定義を探し、定義の行をそのまま返します。\"\"\"
+```
+
+# ReadArtifact
+結果が大きいツールの結果は全体がアーティファクトに保存され、先頭と末尾のプレビューとIDだけが返されます。全体が必要な場合はこのツールで範囲を指定して読み取ってください。
+```python
+@function_tool
+async def read_artifact(ctx: RunContextWrapper[Any], artifact_id: str, start_line: int = 0, end_line: int = 0,
+                        byte_offset: int = 0, byte_length: int = 0) -> str:
+    \"\"\"アーティファクトに保存した大きなツールの結果を、行またはバイトの範囲を指定して読み取ります。\"\"\"
 ```
 
 # AskQuestion
@@ -108,18 +152,28 @@ async def complete(ctx: RunContextWrapper[Any], result: str) -> str:
     with open(path, "w", encoding="utf-8") as f:
         f.write(prompt)
 
-def initialize_agent():
+def check_api_key():
+    """APIキーが設定されていなければ終了"""
+    if not settings.get_api_key():
+        print("エラー: OPENAI_API_KEYが設定されていません。")
+        print(".envファイルにAPIキーを設定するか、環境変数として設定してください。")
+        sys.exit(1)
+
+def initialize_agent(session: Optional[checkpoint.CheckpointSession] = None):
     """エージェントの初期化
     
+    Args:
+        session: ターンごとにチェックポイントを記録するセッション（省略時は記録しない）
+        
     Returns:
         Agent: 初期化されたエージェント
     """
-    # APIキーの取得
-    api_key = settings.get_api_key()
-    if not api_key:
-        print("エラー: OPENAI_API_KEYが設定されていません。")
-        print(".envファイルにAPIキーを設定するか、環境変数として設定してください。")
-        sys.exit(1)
+    from agents import Agent
+    from tools import file_tools, command_tools, interaction_tools, search_tools
+    from utils import scheduler
+    
+    # APIキーの確認
+    check_api_key()
     
     # システムプロンプトを読み込む
     system_prompt = load_system_prompt()
@@ -129,48 +183,136 @@ def initialize_agent():
         file_tools.list_file,
         file_tools.read_file,
         file_tools.write_file,
+        file_tools.read_artifact,
+        search_tools.search,
+        search_tools.find_definition,
         command_tools.execute_command,
         interaction_tools.ask_question,
         interaction_tools.complete
     ]
     
+    # モデルの呼び出しはスケジューラーで待たせ、レート制限の場合は送り直す
+    model = scheduler.scheduled_model(settings.get_model_name())
+    if session is not None:
+        # モデルを呼び出すたびに、前のターンまでをチェックポイントに記録する
+        from utils.checkpoint_model import CheckpointModel
+        model = CheckpointModel(model, session)
+    
     # エージェントの作成
     agent = Agent(
         name="AI Coding Agent",
         tools=tools,
         instructions=system_prompt,
-        model=settings.get_model_name()
+        model=model
     )
     
     return agent
 
-async def main_async():
-    """非同期メイン関数"""
-    # ロギングの初期化
-    logger.setup_logging()
+def resume_input(session: checkpoint.CheckpointSession) -> Union[str, List[Dict[str, Any]]]:
+    """再開したセッションに続けて送る入力を作成
+    
+    Args:
+        session: 読み込んだセッション
+        
+    Returns:
+        Runner.run の入力。記録した会話履歴に、再開したことを伝えるユーザーのメッセージ
+        （チェックポイントの後に変更されたファイルを含む）を加えたもの。
+        完了したターンがない場合は最初のタスク
+    """
+    # 完了したターンがない場合は最初のタスクから始め直す
+    if session.turn == 0:
+        session.clear()
+        return session.task
+    message = "[Resume] セッションを再開しました。中断したところからタスクを続けてください。"
+    changed = session.changed_files()
+    if changed:
+        print("\nチェックポイントの後に次のファイルが変更されています:")
+        for path in changed:
+            print(f"  {path}")
+        message += ("\nチェックポイントの後に次のファイルが変更されているため、"
+                    "必要に応じて内容を確認してから続けてください:\n" + "\n".join(changed))
+    return session.run_input(message)
+
+async def main_async(resume: Optional[str] = None):
+    """非同期メイン関数
+    
+    Args:
+        resume: 再開するセッションID（省略時は新しいタスクを入力）
+    """
+    # ロギングの初期化（SDKのトレース機能は agents の読み込み後に有効化する）
+    logger.setup_logging(tracing=False)
     logger.logger.info("AI Coding Agentを起動しています...")
+    check_api_key()
+    
+    # ユーザーがタスクを入力している間に agents とツールを読み込む
+    helpers.preload_modules(*PRELOAD_MODULES)
+    
+    # トークン使用量の集計とスケジューラー（agents の読み込み後に作成）
+    usage_hooks = None
+    request_scheduler = None
+    
+    # チェックポイントを記録するセッション（CHECKPOINT=false の場合は None）
+    session = None
+    completed = False
     
     try:
-        # エージェントの初期化
-        agent = initialize_agent()
-        logger.logger.info("エージェントの初期化が完了しました。")
-        
-        # ユーザーからのタスク入力
         print("===== AI Coding Agent =====")
-        print("コーディングエージェントにタスクを入力してください:")
-        user_task = input()
+        if resume:
+            # チェックポイントから最後に完了したターンの状態を復元
+            try:
+                session = checkpoint.CheckpointSession.load(resume)
+            except FileNotFoundError:
+                print(f"セッション {resume} のチェックポイントが見つかりません")
+                return
+            if session.status == checkpoint.STATUS_COMPLETE:
+                print(f"セッション {resume} は完了しています")
+                session = None
+                return
+            run_input = resume_input(session)
+            print(f"セッション {resume} をターン {session.turn} の次から再開します")
+            print(f"タスク: {session.task}")
+        else:
+            # ユーザーからのタスク入力
+            print("コーディングエージェントにタスクを入力してください:")
+            user_task = input()
+            run_input = user_task
+            if settings.is_checkpoint_enabled():
+                session = checkpoint.CheckpointSession.create(user_task, settings.get_model_name())
+        if session is not None:
+            print(f"セッションID: {session.session_id}")
+            # アーティファクトもセッションごとに保存（再開時は同じディレクトリの続きから）
+            artifact_store.open_store(session.session_id)
         
         print("\nAI Coding Agentを初期化しています...")
         print("このエージェントは与えられたタスクを解決するためにツールを使用します。")
         print("処理には少し時間がかかる場合があります。しばらくお待ちください。\n")
         
-        # タスク実行
-        result = await Runner.run(agent, user_task)
+        from agents import Runner
+        from utils.usage import UsageHooks, TokenBudgetExceeded
+        from utils import scheduler
         
-        # 最終出力の表示
-        print(f"\n\n最終結果: {result.final_output}\n")
+        # エージェントの初期化
+        logger.setup_tracing()
+        agent = initialize_agent(session)
+        logger.logger.info("エージェントの初期化が完了しました。")
+        request_scheduler = scheduler.get_scheduler()
+        
+        # トークン使用量の集計とセッションの上限
+        usage_hooks = UsageHooks(settings.get_session_token_budget())
         
-        print("\n\nAI Coding Agentのタスクが完了しました。")
+        # タスク実行
+        try:
+            with tracer.span("task", "task"):
+                result = await Runner.run(agent, run_input, hooks=usage_hooks)
+        except TokenBudgetExceeded as e:
+            print(f"\n\n{str(e)}。処理を終了します。")
+            logger.log_event("budget_exceeded", {"total_tokens": e.total_tokens, "token_budget": e.token_budget})
+        else:
+            # 最終出力の表示
+            print(f"\n\n最終結果: {result.final_output}\n")
+            completed = True
+            
+            print("\n\nAI Coding Agentのタスクが完了しました。")
     
     except KeyboardInterrupt:
         print("\n\nユーザーによって処理が中断されました。")
@@ -179,12 +321,67 @@ async def main_async():
         logger.log_error("プログラム実行中にエラーが発生しました", e)
     
     finally:
+        # セッションの終了をチェックポイントに記録（完了していなければ --resume で再開できる）
+        if session is not None:
+            session.end(checkpoint.STATUS_COMPLETE if completed else checkpoint.STATUS_STOPPED)
+            if not completed:
+                print(f"\n続きは python main.py --resume {session.session_id} で再開できます")
+        
+        # トークン使用量の集計を記録
+        if usage_hooks is not None:
+            usage_summary = usage_hooks.summary()
+            logger.log_event("usage_summary", usage_summary)
+            print(f"\nトークン使用量: 入力 {usage_summary['input_tokens']} (キャッシュ {usage_summary['cached_tokens']}) / "
+                  f"出力 {usage_summary['output_tokens']} / 合計 {usage_summary['total_tokens']} "
+                  f"({usage_summary['requests']}リクエスト)")
+            for name, tool_usage in usage_summary["tools"].items():
+                print(f"  {name}: {tool_usage['calls']}回, 出力 {tool_usage['output_tokens']}トークン, "
+                      f"結果 {tool_usage['result_chars']}文字")
+        
+        # アーティファクトに保存したツールの結果を記録
+        artifact_stats = artifact_store.stats()
+        if artifact_stats and artifact_stats["stored"]:
+            logger.log_event("artifacts", artifact_stats)
+            print(f"\nアーティファクト: {artifact_stats['stored']}件 ({artifact_stats['stored_bytes']}バイト)")
+        
+        # レート制限による待ち時間と再試行を記録（エージェントを初期化した場合のみ）
+        if request_scheduler is not None:
+            scheduler_stats = request_scheduler.stats()
+            if scheduler_stats["requests"]:
+                logger.log_event("scheduler", scheduler_stats)
+                if scheduler_stats["retries"] or scheduler_stats["max_wait_seconds"]:
+                    print(f"\nスケジューラー: 再試行 {scheduler_stats['retries']}回 "
+                          f"(レート制限 {scheduler_stats['rate_limited']}回) / "
+                          f"待ち時間 合計 {scheduler_stats['wait_seconds']:.1f}秒 "
+                          f"(最大 {scheduler_stats['max_wait_seconds']:.1f}秒)")
+        
+        # 永続的なシェルセッションを終了（SHELL_SESSION=true の場合のみ起動しています）
+        await shell_session.close_all()
+        
+        # ファイル内容キャッシュの効果を記録
+        logger.log_event("file_cache", helpers.file_cache.stats())
+        
+        # 記録したスパンを書き出す（SPAN_TRACE_FILE を指定した場合のみ）
+        if tracer.is_enabled():
+            tracer.save()
+            print(f"\nスパンのトレース: {tracer.get_path()}")
+        
+        # バッファされたログを確実に書き出す
+        logger.shutdown_logging()
         print("\n===== 終了 =====")
 
-def main():
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="AI Coding Agent")
+    parser.add_argument("--resume", metavar="SESSION_ID",
+                        help="チェックポイントから最後に完了したターンの次から再開するセッションID")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
     """メイン関数"""
+    args = parse_args(argv)
     # asyncioでasyncのmain関数を実行
-    asyncio.run(main_async())
+    asyncio.run(main_async(args.resume))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
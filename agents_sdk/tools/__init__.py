@@ -6,4 +6,5 @@
 
 from . import file_tools
 from . import command_tools
-from . import interaction_tools 
\ No newline at end of file
+from . import interaction_tools
+from . import search_tools 
\ No newline at end of file
@@ -9,16 +9,23 @@
 
 import os
 import sys
-import subprocess
+import asyncio
 from typing import List, Dict, Any
 from agents import function_tool, RunContextWrapper
 
 # 相対インポートを絶対インポートに変更
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
 from log_manager import logger
+from log_manager.tracer import traced_tool
+from utils.artifact_store import offload_output
 from utils import helpers
+from utils import task_context
+from utils import shell_session
 
 @function_tool
+@traced_tool
+@offload_output
 async def execute_command(ctx: RunContextWrapper[Any], command: str, requires_approval: str) -> str:
     """コマンドを実行します。
     
@@ -42,25 +49,47 @@ async def execute_command(ctx: RunContextWrapper[Any], command: str, requires_ap
             return error_message
         
         # ユーザー承認が必要な場合
-        if needs_approval:
-            approve = input(f"次のコマンドを実行してもよろしいですか？\n{command}\n(y/n): ")
+        task = task_context.current_task()
+        if needs_approval and task is not None:
+            # バッチモードでは標準入力で確認できないため、設定に従って実行するか拒否する
+            if not task.auto_approve:
+                return "バッチモードで実行中のため、承認が必要なコマンドは実行できません。"
+        elif needs_approval:
+            # 入力待ちの間も他のコルーチンを止めないようにスレッドで待つ
+            loop = asyncio.get_running_loop()
+            approve = await loop.run_in_executor(
+                None, input, f"次のコマンドを実行してもよろしいですか？\n{command}\n(y/n): "
+            )
             if approve.lower() != 'y':
                 return "コマンドの実行はユーザーによって拒否されました。"
         
-        # コマンド実行
-        result = subprocess.run(
-            command,
-            shell=True,
-            capture_output=True,
-            text=True,
-            encoding='utf-8'
-        )
+        # コマンド実行（タイムアウト・キャンセル時はプロセスツリーごと終了）
+        timeout = settings.get_command_timeout()
+        output_limit = settings.get_command_output_limit()
+        use_session = settings.is_shell_session_enabled()
+        if use_session:
+            # 永続的なシェルセッション（バッチモードではタスクごと）で実行し、cd や環境変数を引き継ぐ
+            result = await shell_session.run_command(
+                command, key=task.task_id if task is not None else "default",
+                cwd=task_context.get_workdir(), timeout=timeout, output_limit=output_limit
+            )
+        else:
+            result = await helpers.run_command_async(
+                command, timeout=timeout, output_limit=output_limit, cwd=task_context.get_workdir()
+            )
         
         # 結果の構築
-        output = result.stdout or ""
-        errors = result.stderr or ""
+        output = result.stdout
+        errors = result.stderr
         
-        if result.returncode == 0:
+        if result.timed_out:
+            status = f"コマンド '{command}' は {timeout:g} 秒でタイムアウトしたため強制終了しました。"
+            if use_session:
+                status += "\n次のコマンドは新しいシェルで実行します（作業ディレクトリと環境変数は初期状態に戻ります）。"
+        elif result.shell_exited:
+            status = (f"コマンド '{command}' の実行中にシェルが終了しました。(戻り値: {result.returncode})\n"
+                      "次のコマンドは新しいシェルで実行します（作業ディレクトリと環境変数は初期状態に戻ります）。")
+        elif result.returncode == 0:
             status = f"コマンド '{command}' は正常に完了しました。(戻り値: {result.returncode})"
         else:
             status = f"コマンド '{command}' は戻り値 {result.returncode} で終了しました。"
@@ -69,8 +98,13 @@ async def execute_command(ctx: RunContextWrapper[Any], command: str, requires_ap
         logger.log_tool_result("execute_command", {
             "command": command,
             "exit_code": result.returncode,
-            "output_length": len(output),
-            "error_length": len(errors)
+            "output_length": result.stdout_bytes,
+            "error_length": result.stderr_bytes,
+            "truncated": result.truncated,
+            "timed_out": result.timed_out,
+            "shell_session": use_session,
+            "shell_exited": result.shell_exited,
+            "duration": round(result.duration, 3)
         })
         
         # 結果の整形
@@ -82,6 +116,12 @@ async def execute_command(ctx: RunContextWrapper[Any], command: str, requires_ap
         if errors:
             command_result += f"エラー:\n{errors}\n"
         
+        if result.truncated:
+            command_result += (
+                f"\n(出力が上限 {output_limit} バイトを超えたため以降を省略しました。"
+                f"出力: {result.stdout_bytes} バイト, エラー: {result.stderr_bytes} バイト)\n"
+            )
+        
         return command_result
     
     except Exception as e:
@@ -16,10 +16,19 @@ from agents import function_tool, RunContextWrapper
 
 # 相対インポートを絶対インポートに変更
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
 from log_manager import logger
+from log_manager.tracer import traced_tool
+from utils.artifact_store import offload_output
 from utils import helpers
+from utils import patcher
+from utils import workspace_index
+from utils import task_context
+from utils import artifact_store
 
 @function_tool
+@traced_tool
+@offload_output
 async def list_file(ctx: RunContextWrapper[Any], path: str, recursive: str) -> str:
     """ディレクトリ内のファイル一覧を取得します。
     
@@ -37,17 +46,12 @@ async def list_file(ctx: RunContextWrapper[Any], path: str, recursive: str) -> s
         # 再帰的フラグの変換
         is_recursive = helpers.to_bool(recursive)
         
-        files = []
-        if is_recursive:
-            # 再帰的に検索
-            for file_path in norm_path.rglob("*"):
-                if file_path.is_file():
-                    files.append(str(file_path))
-        else:
-            # 非再帰的に検索
-            for file_path in norm_path.glob("*"):
-                if file_path.is_file():
-                    files.append(str(file_path))
+        # 作業ディレクトリ以下はインデックスから取得（.gitignore で除外されたものは含まない）
+        _, relative_files = workspace_index.list_directory(
+            norm_path, is_recursive, use_index=settings.is_workspace_index_enabled(),
+            root=task_context.get_workdir()
+        )
+        files = [str(norm_path / file) for file in relative_files]
         
         # 結果をフォーマット
         if files:
@@ -72,14 +76,21 @@ async def list_file(ctx: RunContextWrapper[Any], path: str, recursive: str) -> s
         return error_message
 
 @function_tool
-async def read_file(ctx: RunContextWrapper[Any], path: str) -> str:
-    """ファイルの内容を読み取ります。
+@traced_tool
+@offload_output
+async def read_file(ctx: RunContextWrapper[Any], path: str, start_line: int = 0, end_line: int = 0,
+                    byte_offset: int = 0, byte_length: int = 0) -> str:
+    """ファイルの内容を読み取ります。大きなファイルは行またはバイトの範囲を指定して読み取れます。
     
     Args:
         path: ファイルのパス
+        start_line: 開始行（1始まり）。0の場合は指定なし
+        end_line: 終了行（この行を含む）。0の場合は指定なし
+        byte_offset: 開始位置（バイト）。byte_lengthと組み合わせて使用
+        byte_length: 読み取るバイト数。1以上の場合はバイト単位で読み取る
         
     Returns:
-        ファイルの内容
+        ファイルの内容（範囲を指定した場合は総行数・総バイト数を先頭に表示）
     """
     try:
         # パスの正規化
@@ -91,13 +102,48 @@ async def read_file(ctx: RunContextWrapper[Any], path: str) -> str:
             logger.log_error(error_message)
             return error_message
         
-        # ファイルの読み取り
-        content = helpers.read_file_safe(norm_path)
+        # バイト単位の範囲指定（1回に返す大きさは READ_MAX_BYTES まで）
+        read_max_bytes = settings.get_read_max_bytes()
+        if byte_length > 0:
+            length = min(byte_length, read_max_bytes)
+            piece = helpers.file_cache.read_bytes(norm_path, byte_offset, length)
+            end = min(byte_offset + length, piece.total_bytes)
+            logger.log_tool_result("read_file", {"path": path, "byte_offset": byte_offset, "byte_length": length})
+            header = f"ファイル '{path}' の {byte_offset}-{end}バイト目（全{piece.total_bytes}バイト）"
+            if byte_length > read_max_bytes:
+                header += f"。{read_max_bytes}バイトまでを表示しています"
+            return f"{header}:\n{piece.text}"
         
-        # ログに記録
-        logger.log_tool_result("read_file", {"path": path})
+        # 範囲指定が無く、大きすぎないファイルは全体を返す
+        if start_line <= 0 and end_line <= 0 and norm_path.stat().st_size <= read_max_bytes:
+            # ファイルの読み取り
+            content = helpers.read_file_safe(norm_path)
+            
+            # ログに記録
+            logger.log_tool_result("read_file", {"path": path})
+            
+            return content if content else f"ファイル '{path}' は空です。"
         
-        return content if content else f"ファイル '{path}' は空です。"
+        # 行単位の範囲指定（範囲指定が無い大きなファイルは先頭から。どちらも上限バイト数まで）
+        piece = helpers.file_cache.read_lines(norm_path, start_line or 1, end_line, max_bytes=read_max_bytes)
+        logger.log_tool_result("read_file", {
+            "path": path,
+            "start_line": piece.start_line,
+            "end_line": piece.end_line,
+            "total_lines": piece.total_lines
+        })
+        if piece.end_line < piece.start_line:
+            return f"開始行 {piece.start_line} はファイル '{path}' の行数（{piece.total_lines}行）を超えています。"
+        
+        header = f"ファイル '{path}' の {piece.start_line}-{piece.end_line}行目（全{piece.total_lines}行）"
+        text = piece.text
+        if len(text) * 4 > read_max_bytes and len(text.encode("utf-8")) > read_max_bytes:
+            # 1行だけで上限を超える場合は、行の途中までを返す
+            text = text.encode("utf-8")[:read_max_bytes].decode("utf-8", errors="ignore")
+            header += f"。行が長いため先頭の{read_max_bytes}バイトまでを表示しています。続きは byte_offset と byte_length を指定して読み取ってください"
+        elif piece.truncated:
+            header += f"。大きいため {piece.end_line}行目までを表示しています。続きは start_line と end_line を指定して読み取ってください"
+        return f"{header}:\n{text}"
     
     except Exception as e:
         error_message = f"ファイルの読み取り中にエラーが発生しました: {str(e)}"
@@ -105,24 +151,25 @@ async def read_file(ctx: RunContextWrapper[Any], path: str) -> str:
         return error_message
 
 @function_tool
-async def write_file(ctx: RunContextWrapper[Any], path: str, content: str) -> str:
-    """ファイルに内容を書き込みます。
+@traced_tool
+async def write_file(ctx: RunContextWrapper[Any], path: str, content: str = "", edit: str = "") -> str:
+    """ファイルに内容を書き込みます。既存ファイルの一部だけを変更する場合は edit を指定します。
     
     Args:
         path: ファイルのパス
-        content: 書き込む内容
+        content: 書き込む内容（ファイル全体）
+        edit: 既存ファイルに適用する SEARCH/REPLACE ブロックまたは unified diff。指定した場合は content を使用しない
         
     Returns:
-        結果メッセージ
+        結果メッセージ（編集の場合は適用できたハンクと失敗したハンク）
     """
+    if edit:
+        return _edit_file(path, edit)
     try:
         # パスの正規化
         norm_path = helpers.normalize_path(path)
         
-        # 親ディレクトリの作成
-        norm_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        # ファイルの書き込み
+        # ファイルの書き込み（親ディレクトリの作成と一時ファイルからの置き換えを含む）
         success = helpers.write_file_safe(norm_path, content)
         
         if success:
@@ -142,4 +189,113 @@ async def write_file(ctx: RunContextWrapper[Any], path: str, content: str) -> st
     except Exception as e:
         error_message = f"ファイルの書き込み中にエラーが発生しました: {str(e)}"
         logger.log_error(error_message, e)
-        return error_message 
\ No newline at end of file
+        return error_message
+
+def _edit_file(path: str, edit: str) -> str:
+    """既存ファイルに編集を適用し、適用できたハンクだけを書き込みます。
+    
+    Args:
+        path: ファイルのパス
+        edit: SEARCH/REPLACE ブロックまたは unified diff
+        
+    Returns:
+        結果メッセージ
+    """
+    try:
+        norm_path = helpers.normalize_path(path)
+        if not norm_path.is_file():
+            error_message = f"ファイル '{path}' が見つかりません。新規作成には content を使用してください。"
+            logger.log_error(error_message)
+            return error_message
+        
+        original, newline = patcher.read_text_preserving_newlines(norm_path)
+        patch = patcher.apply_edit(original, edit)
+        if patch.error and not patch.hunks:
+            error_message = f"編集内容を解釈できません: {patch.error}"
+            logger.log_error(error_message)
+            return error_message
+        
+        summary = patch.summary()
+        if patch.error:
+            summary += f"\n警告: {patch.error}"
+        if patch.applied:
+            patcher.atomic_write(norm_path, patch.content, newline=newline)
+            helpers.file_cache.invalidate(norm_path)
+            result = f"ファイル '{path}' を編集しました。\n{summary}"
+        else:
+            result = f"ファイル '{path}' を編集できませんでした（変更なし）。\n{summary}"
+        
+        # ログに記録
+        logger.log_tool_result("write_file", {
+            "path": path,
+            "mode": "edit",
+            "success": not patch.failed,
+            "hunks_applied": len(patch.applied),
+            "hunks_failed": len(patch.failed)
+        })
+        
+        return result
+    
+    except Exception as e:
+        error_message = f"ファイルの編集中にエラーが発生しました: {str(e)}"
+        logger.log_error(error_message, e)
+        return error_message
+
+@function_tool
+@traced_tool
+async def read_artifact(ctx: RunContextWrapper[Any], artifact_id: str, start_line: int = 0, end_line: int = 0,
+                        byte_offset: int = 0, byte_length: int = 0) -> str:
+    """アーティファクトに保存した大きなツールの結果を、行またはバイトの範囲を指定して読み取ります。
+    
+    Args:
+        artifact_id: アーティファクトの ID（ツールの結果のプレビューに表示されます）
+        start_line: 開始行（1始まり）。0の場合は先頭から
+        end_line: 終了行（この行を含む）。0の場合は指定なし
+        byte_offset: 開始位置（バイト）。byte_lengthと組み合わせて使用
+        byte_length: 読み取るバイト数。1以上の場合はバイト単位で読み取る
+        
+    Returns:
+        指定した範囲の内容（総行数・総バイト数を先頭に表示）
+    """
+    try:
+        store = artifact_store.get_store()
+        path = store.path(artifact_id)
+        if path is None:
+            return f"アーティファクト '{artifact_id}' が見つかりません。"
+        # 1回に返す大きさはアーティファクトに保存する上限まで（結果がまたアーティファクトにならないように）
+        max_bytes = store.threshold or settings.get_read_max_bytes()
+        
+        if byte_length > 0:
+            length = min(byte_length, max_bytes)
+            piece = helpers.file_cache.read_bytes(path, byte_offset, length)
+            end = min(byte_offset + length, piece.total_bytes)
+            logger.log_tool_result("read_artifact", {"id": artifact_id, "byte_offset": byte_offset, "byte_length": length})
+            header = f"アーティファクト '{artifact_id}' の {byte_offset}-{end}バイト目（全{piece.total_bytes}バイト）"
+            if byte_length > max_bytes:
+                header += f"。{max_bytes}バイトまでを表示しています"
+            return f"{header}:\n{piece.text}"
+        
+        piece = helpers.file_cache.read_lines(path, start_line or 1, end_line, max_bytes=max_bytes)
+        logger.log_tool_result("read_artifact", {
+            "id": artifact_id,
+            "start_line": piece.start_line,
+            "end_line": piece.end_line,
+            "total_lines": piece.total_lines
+        })
+        if piece.end_line < piece.start_line:
+            return f"開始行 {piece.start_line} はアーティファクト '{artifact_id}' の行数（{piece.total_lines}行）を超えています。"
+        
+        header = f"アーティファクト '{artifact_id}' の {piece.start_line}-{piece.end_line}行目（全{piece.total_lines}行）"
+        text = piece.text
+        if len(text) * 4 > max_bytes and len(text.encode("utf-8")) > max_bytes:
+            # 1行だけで上限を超える場合は、行の途中までを返す
+            text = text.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")
+            header += f"。行が長いため先頭の{max_bytes}バイトまでを表示しています。続きは byte_offset と byte_length を指定して読み取ってください"
+        elif piece.truncated:
+            header += f"。大きいため {piece.end_line}行目までを表示しています。続きは start_line と end_line を指定して読み取ってください"
+        return f"{header}:\n{text}"
+    
+    except Exception as e:
+        error_message = f"アーティファクトの読み取り中にエラーが発生しました: {str(e)}"
+        logger.log_error(error_message, e)
+        return error_message
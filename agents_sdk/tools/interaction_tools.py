@@ -15,8 +15,11 @@ from agents import function_tool, RunContextWrapper
 # 相対インポートを絶対インポートに変更
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from log_manager import logger
+from log_manager.tracer import traced_tool
+from utils import task_context
 
 @function_tool
+@traced_tool
 async def ask_question(ctx: RunContextWrapper[Any], question: str) -> str:
     """ユーザーに質問します。
     
@@ -27,6 +30,14 @@ async def ask_question(ctx: RunContextWrapper[Any], question: str) -> str:
         ユーザーの回答
     """
     try:
+        # バッチモードでは回答できるユーザーがいない
+        if task_context.current_task() is not None:
+            logger.log_tool_result("ask_question", {
+                "question": question,
+                "answered": False
+            })
+            return "バッチモードで実行中のため質問には回答できません。タスクの内容から判断して作業を続けてください。"
+        
         # 質問を表示してユーザー入力を取得
         print(f"\n質問: {question}")
         print("回答: ", end="")
@@ -46,6 +57,7 @@ async def ask_question(ctx: RunContextWrapper[Any], question: str) -> str:
         return error_message
 
 @function_tool
+@traced_tool
 async def complete(ctx: RunContextWrapper[Any], result: str) -> str:
     """タスクの完了を示します。
     
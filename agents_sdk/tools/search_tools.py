@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+検索ツール
+
+このモジュールには、ワークスペースの検索に関連するツール関数が含まれています。
+"""
+
+import os
+import re
+import sys
+import asyncio
+import functools
+from typing import Any
+from pathlib import Path
+from agents import function_tool, RunContextWrapper
+
+# 相対インポートを絶対インポートに変更
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from log_manager import logger
+from log_manager.tracer import traced_tool
+from utils.artifact_store import offload_output
+from utils import helpers
+from utils import search as workspace_search
+from utils import symbol_index
+from utils import task_context
+
+# find_definition で返す定義の数と、1つの定義で返す最大行数
+MAX_DEFINITIONS = 10
+MAX_DEFINITION_LINES = 200
+# find_definition で返す参照箇所の最大数
+MAX_REFERENCES = 50
+
+@function_tool
+@traced_tool
+@offload_output
+async def search(ctx: RunContextWrapper[Any], pattern: str, path: str = ".", file_pattern: str = "",
+                 ignore_case: bool = False, context_lines: int = 2, max_results: int = 0) -> str:
+    """ワークスペースのファイルを正規表現で検索し、一致した行を行番号と前後の行とともに返します。
+    
+    Args:
+        pattern: 正規表現
+        path: 検索するディレクトリ
+        file_pattern: 対象ファイル名のパターン（例: "*.py"。カンマ区切りで複数指定可能）
+        ignore_case: 大文字と小文字を区別しないかどうか
+        context_lines: 一致した行の前後に表示する行数
+        max_results: 一致した行数の上限。0の場合は設定値
+        
+    Returns:
+        検索結果（一致行は "パス:行番号:"、前後の行は "パス-行番号-" で始まる）
+    """
+    try:
+        # パスの正規化
+        norm_path = helpers.normalize_path(path)
+        
+        # 検索はプロセスプールで行い、結果を待つ間も他のコルーチンを止めないようにスレッドで待つ
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, functools.partial(
+            workspace_search.search,
+            pattern,
+            norm_path,
+            file_pattern=file_pattern,
+            ignore_case=ignore_case,
+            context=max(0, context_lines),
+            limit=max_results if max_results > 0 else settings.get_search_max_results(),
+            workers=settings.get_search_workers(),
+            use_index=settings.is_workspace_index_enabled(),
+            # スレッドにはタスクのコンテキストが引き継がれないため、作業ディレクトリを渡す
+            root=task_context.get_workdir()
+        ))
+        
+        # ログに記録
+        logger.log_tool_result("search", {
+            "pattern": pattern,
+            "path": path,
+            "files_searched": result.files_searched,
+            "file_count": len(result.files),
+            "match_count": result.total_matches,
+            "truncated": result.truncated
+        })
+        
+        return result.format(pattern)
+    
+    except re.error as e:
+        error_message = f"正規表現が正しくありません: {str(e)}"
+        logger.log_error(error_message)
+        return error_message
+    
+    except Exception as e:
+        error_message = f"検索中にエラーが発生しました: {str(e)}"
+        logger.log_error(error_message, e)
+        return error_message
+
+@function_tool
+@traced_tool
+@offload_output
+async def find_definition(ctx: RunContextWrapper[Any], name: str, references: bool = False) -> str:
+    """Pythonのクラス・関数・メソッド・モジュール直下の変数の定義を探し、定義の行をそのまま返します。
+    
+    Args:
+        name: シンボル名（"関数名" または "クラス名.メソッド名"）
+        references: 呼び出し箇所とimportの行も返すかどうか
+        
+    Returns:
+        定義の行（先頭に "パス:開始行-終了行" を表示）
+    """
+    try:
+        name = name.strip()
+        if not name:
+            return "シンボル名を指定してください。"
+        
+        # 変更されたファイルの解析はプロセスプールで行うため、スレッドで待つ
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, _find_definition, name, references, task_context.get_workdir())
+        return result
+    
+    except Exception as e:
+        error_message = f"定義の検索中にエラーが発生しました: {str(e)}"
+        logger.log_error(error_message, e)
+        return error_message
+
+def _find_definition(name: str, references: bool, root: Path) -> str:
+    """定義（と参照箇所）を検索して結果を整形します。"""
+    index = symbol_index.get_symbol_index(
+        workers=settings.get_search_workers(), use_index=settings.is_workspace_index_enabled(), root=root
+    )
+    definitions = index.find_definitions(name)
+    if not definitions:
+        result = f"'{name}' の定義は見つかりませんでした（{index.file_count}ファイルを検索）。"
+    else:
+        parts = [f"'{name}' の定義: {len(definitions)}件"]
+        for definition in definitions[:MAX_DEFINITIONS]:
+            end_line = min(definition.end_line, definition.start_line + MAX_DEFINITION_LINES - 1)
+            piece = helpers.file_cache.read_lines(
+                os.path.join(index.root, definition.path), definition.start_line, end_line
+            )
+            header = f"## {definition.path}:{definition.start_line}-{definition.end_line} ({definition.kind} {definition.qualname})"
+            parts.append(f"{header}\n{piece.text.rstrip()}")
+            if end_line < definition.end_line:
+                parts.append(f"(先頭の{MAX_DEFINITION_LINES}行のみ表示しました。続きはread_fileで範囲を指定して読み取ってください)")
+        if len(definitions) > MAX_DEFINITIONS:
+            parts.append(f"(ほかに{len(definitions) - MAX_DEFINITIONS}件の定義があります。修飾名（例: Class.method）で絞り込んでください)")
+        result = "\n\n".join(parts)
+    
+    reference_count = 0
+    if references:
+        found = index.find_references(name)
+        reference_count = len(found)
+        if not found:
+            result += f"\n\n'{name}' の呼び出し・importは見つかりませんでした。"
+        else:
+            lines = [f"'{name}' の呼び出し・import: {len(found)}件"]
+            for reference in found[:MAX_REFERENCES]:
+                piece = helpers.file_cache.read_lines(os.path.join(index.root, reference.path), reference.line, reference.line)
+                lines.append(f"{reference.path}:{reference.line}: {piece.text.strip()}")
+            if len(found) > MAX_REFERENCES:
+                lines.append(f"(ほかに{len(found) - MAX_REFERENCES}件あります)")
+            result += "\n\n" + "\n".join(lines)
+    
+    # ログに記録
+    logger.log_tool_result("find_definition", {
+        "name": name,
+        "definition_count": len(definitions),
+        "reference_count": reference_count,
+        "files_indexed": index.file_count,
+        "files_parsed": index.parsed
+    })
+    
+    return result
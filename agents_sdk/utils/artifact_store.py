@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+大きなツール結果の保存（アーティファクト）
+
+ツールの結果が上限（.env の ARTIFACT_THRESHOLD バイト）を超える場合は、全体をディスクに保存し、
+モデルには先頭と末尾のプレビュー・全体の大きさ・アーティファクトの ID だけを返します。
+全体は read_artifact ツールで行またはバイトの範囲を指定して読み取ります。
+
+アーティファクトはセッションごとのディレクトリ（.agent_cache/artifacts/<セッションID>/）に保存し、
+合計が ARTIFACT_MAX_BYTES を超えた場合は古いセッションのディレクトリから削除します。
+--resume で再開したセッションは同じディレクトリを使い、通し番号を続きから振ります。
+チェックポイントを記録しない実行（CHECKPOINT=false やバッチモード）では <日時>_<プロセスID> を使います。
+"""
+
+import os
+import re
+import sys
+import shutil
+import datetime
+import functools
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 絶対インポートに変更
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from log_manager import logger
+
+# アーティファクトの ID（<ツール名>-<通し番号>）
+_ARTIFACT_ID_PATTERN = re.compile(r"^[a-z_]+-\d+$")
+
+@dataclass
+class Artifact:
+    """保存したアーティファクト"""
+    artifact_id: str
+    path: Path
+    total_bytes: int
+    total_lines: int
+
+def _head(data: bytes, limit: int) -> bytes:
+    """先頭 limit バイトまでを返す（途中に改行があれば最後の改行まで）"""
+    if len(data) <= limit:
+        return data
+    piece = data[:limit]
+    newline = piece.rfind(b"\n")
+    return piece[:newline + 1] if newline > 0 else piece
+
+def _tail(data: bytes, limit: int) -> bytes:
+    """末尾 limit バイトまでを返す（途中に改行があれば最初の改行の次から）"""
+    if len(data) <= limit:
+        return data
+    piece = data[-limit:]
+    newline = piece.find(b"\n")
+    return piece[newline + 1:] if 0 <= newline < len(piece) - 1 else piece
+
+class ArtifactStore:
+    """アーティファクトの保存先クラス
+
+    セッションごとのディレクトリにツールの結果を保存し、ID からファイルを引きます。
+    """
+
+    def __init__(self, directory: Path, session_id: str, threshold: int, preview_bytes: int, max_bytes: int):
+        """初期化
+
+        Args:
+            directory: アーティファクトの保存先
+            session_id: セッションの ID（保存先の下のディレクトリ名）
+            threshold: これを超える大きさ（バイト）の結果を保存（0 の場合は保存しません）
+            preview_bytes: プレビューに含める先頭と末尾のそれぞれのバイト数
+            max_bytes: すべての実行のアーティファクトの合計の上限（バイト）
+        """
+        self.directory = Path(directory)
+        self.session_dir = self.directory / session_id
+        self.threshold = threshold
+        self.preview_bytes = preview_bytes
+        self.max_bytes = max_bytes
+        self.stored = 0
+        self.stored_bytes = 0
+        self._counter = self._last_number()
+        self._lock = threading.Lock()
+
+    def _last_number(self) -> int:
+        """保存済みのアーティファクトの最大の通し番号を取得（再開したセッションで ID を重複させないため）"""
+        if not self.session_dir.is_dir():
+            return 0
+        numbers = [
+            int(path.stem.rsplit("-", 1)[1])
+            for path in self.session_dir.iterdir()
+            if path.suffix == ".txt" and _ARTIFACT_ID_PATTERN.match(path.stem)
+        ]
+        return max(numbers, default=0)
+
+    def save(self, tool_name: str, data: bytes) -> Artifact:
+        """ツールの結果をアーティファクトとして保存
+
+        Args:
+            tool_name: ツール名（ID の接頭辞になります）
+            data: 保存する内容（UTF-8）
+
+        Returns:
+            保存したアーティファクト
+        """
+        with self._lock:
+            self._counter += 1
+            artifact_id = f"{tool_name}-{self._counter}"
+            self.stored += 1
+            self.stored_bytes += len(data)
+        self.session_dir.mkdir(parents=True, exist_ok=True)
+        path = self.session_dir / f"{artifact_id}.txt"
+        # ID ごとに別のファイルで上書きしないため、一時ファイルを経由せずに書き込む
+        path.write_bytes(data)
+        total_lines = data.count(b"\n") + (0 if data.endswith(b"\n") else 1)
+        return Artifact(artifact_id, path, len(data), total_lines)
+
+    def offload(self, tool_name: str, text: str) -> Tuple[str, Optional[Artifact]]:
+        """上限を超える結果をアーティファクトに保存し、プレビューに置き換え
+
+        Args:
+            tool_name: ツール名
+            text: ツールの結果
+
+        Returns:
+            モデルに返す文字列と、保存したアーティファクト（上限以下の場合は元の文字列と None）
+        """
+        # 1文字は UTF-8 で最大4バイトなので、明らかに小さい結果はエンコードせずに返す
+        if self.threshold <= 0 or len(text) * 4 <= self.threshold:
+            return text, None
+        data = text.encode("utf-8")
+        if len(data) <= self.threshold:
+            return text, None
+
+        artifact = self.save(tool_name, data)
+        head = _head(data, self.preview_bytes).decode("utf-8", errors="ignore")
+        tail = _tail(data, self.preview_bytes).decode("utf-8", errors="ignore")
+        preview = (
+            f"[結果が大きいため、アーティファクト {artifact.artifact_id} に保存しました"
+            f"（全{artifact.total_bytes}バイト、{artifact.total_lines}行）]\n"
+            f"--- 先頭 ---\n{head}\n"
+            f"--- 末尾 ---\n{tail}\n"
+            f"[全体は read_artifact で ID {artifact.artifact_id} と行またはバイトの範囲を指定して読み取ってください]"
+        )
+        return preview, artifact
+
+    def path(self, artifact_id: str) -> Optional[Path]:
+        """ID からアーティファクトのファイルを引く
+
+        Args:
+            artifact_id: アーティファクトの ID
+
+        Returns:
+            ファイルのパス（不正な ID や存在しない場合は None）
+        """
+        artifact_id = artifact_id.strip()
+        if not _ARTIFACT_ID_PATTERN.match(artifact_id):
+            return None
+        path = self.session_dir / f"{artifact_id}.txt"
+        return path if path.is_file() else None
+
+    def prune(self) -> int:
+        """合計が上限を超える場合に、古い実行のディレクトリから削除（現在の実行は残します）
+
+        Returns:
+            削除したディレクトリの数
+        """
+        if self.max_bytes <= 0 or not self.directory.is_dir():
+            return 0
+        sessions: List[Tuple[float, int, Path]] = []
+        total = 0
+        for entry in self.directory.iterdir():
+            if not entry.is_dir() or entry == self.session_dir:
+                continue
+            size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+            sessions.append((entry.stat().st_mtime, size, entry))
+            total += size
+        removed = 0
+        for _, size, path in sorted(sessions):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """保存した件数と合計バイト数を取得"""
+        return {"stored": self.stored, "stored_bytes": self.stored_bytes, "threshold": self.threshold}
+
+# 保存先（open_store を呼び出すか、最初に使用したときに作成）
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+def _create_store(session_id: str) -> ArtifactStore:
+    """設定から保存先を作成し、古いセッションのアーティファクトを整理"""
+    store = ArtifactStore(
+        Path(settings.get_artifact_dir()), session_id,
+        settings.get_artifact_threshold(), settings.get_artifact_preview_bytes(),
+        settings.get_artifact_max_bytes()
+    )
+    store.prune()
+    return store
+
+def open_store(session_id: str) -> ArtifactStore:
+    """セッションのアーティファクトの保存先を開く
+
+    再開したセッションでは、保存済みのアーティファクトの続きから通し番号を振ります。
+
+    Args:
+        session_id: セッションID（ディレクトリ名になります）
+
+    Returns:
+        このセッションの保存先
+    """
+    global _store
+    with _store_lock:
+        _store = _create_store(session_id)
+    return _store
+
+def get_store() -> ArtifactStore:
+    """アーティファクトの保存先を取得
+
+    open_store を呼び出していない場合は、最初に呼び出したときに <日時>_<プロセスID> の保存先を作成します。
+
+    Returns:
+        この実行の保存先
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _create_store(f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}")
+    return _store
+
+def offload_output(func: Callable) -> Callable:
+    """ツール関数の大きな結果をアーティファクトに保存するデコレーター
+
+    @function_tool の下に付けます。functools.wraps で引数と docstring を引き継ぐため、
+    ツールのスキーマは変わりません。ARTIFACT_THRESHOLD が 0 の場合は関数をそのまま返します。
+
+    Args:
+        func: 文字列を返すツールのコルーチン関数
+
+    Returns:
+        上限を超える結果をプレビューに置き換えるコルーチン関数
+    """
+    if settings.get_artifact_threshold() <= 0:
+        return func
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        result = await func(*args, **kwargs)
+        if not isinstance(result, str):
+            return result
+        preview, artifact = get_store().offload(func.__name__, result)
+        if artifact is not None:
+            logger.log_event("artifact", {
+                "id": artifact.artifact_id,
+                "path": str(artifact.path),
+                "total_bytes": artifact.total_bytes,
+                "total_lines": artifact.total_lines
+            })
+        return preview
+    return wrapper
+
+def stats() -> Optional[Dict[str, int]]:
+    """保存した件数と合計バイト数を取得（保存先を作成していない場合は None）"""
+    return _store.stats() if _store is not None else None
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+セッションのチェックポイント
+
+エージェントのモデルを CheckpointModel（utils/checkpoint_model.py）で包み、モデルを呼び出すたびに
+入力のうち前回から増えたアイテム（前のターンのモデルの応答とツールの結果）をセッションごとのファイル
+（.agent_cache/sessions/<セッションID>.jsonl）に1行ずつ追記します。SDK のセッション（Runner.run の
+session 引数）は、SDK のバージョンによっては実行の終わりにしか保存しないため使いません。
+各行は書き込むたびに fsync するため、途中で異常終了しても最後に完了したターンまでは残ります
+（書き込みの途中で終了した最後の行は読み込み時に無視します）。
+
+`python main.py --resume <セッションID>` で最後に完了したターンの次から再開します。
+それまでの API 呼び出しはやり直しません。.env の CHECKPOINT=false で無効化できます。
+"""
+
+import os
+import sys
+import json
+import uuid
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+# 絶対インポートに変更
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+
+# 記録の種類
+RECORD_START = "start"
+RECORD_ITEMS = "items"
+RECORD_CLEAR = "clear"
+RECORD_END = "end"
+
+# セッションの終了状態
+STATUS_COMPLETE = "complete"
+STATUS_STOPPED = "stopped"
+
+def file_hash(path: str) -> Optional[str]:
+    """ファイルの SHA-256 を取得（存在しない場合は None）"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def _ends_with_newline(path: Path) -> bool:
+    """ファイルが空か改行で終わっているか（書き込みの途中で終了した行が残っていないか）"""
+    try:
+        with open(path, "rb") as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+    except FileNotFoundError:
+        return True
+
+def _written_paths(items: List[Dict[str, Any]]) -> List[str]:
+    """アイテムに含まれる write_file の呼び出しで書き込んだファイル"""
+    paths = []
+    for item in items:
+        if not isinstance(item, dict) or item.get("type") != "function_call" or item.get("name") != "write_file":
+            continue
+        try:
+            path = json.loads(item.get("arguments") or "{}").get("path")
+        except (json.JSONDecodeError, AttributeError):
+            continue
+        if path:
+            paths.append(os.path.abspath(path))
+    return paths
+
+class CheckpointSession:
+    """チェックポイントを記録するセッション
+
+    会話履歴はメモリにも保持し、再開するときの入力（run_input）はファイルを読み直さずに作成します。
+    """
+
+    def __init__(self, session_id: str, directory: Optional[str] = None):
+        """初期化
+
+        Args:
+            session_id: セッションID
+            directory: チェックポイントの保存先（省略時は CHECKPOINT_DIR）
+        """
+        self.session_id = session_id
+        self.path = Path(directory or settings.get_checkpoint_dir()) / f"{session_id}.jsonl"
+        self.task = ""
+        self.model = ""
+        # 完了したターン数（モデルの応答とツールの結果を追記した回数。ユーザーの入力だけの追記は数えません）
+        self.turn = 0
+        # write_file で書き込んだファイルのハッシュ（削除された場合は None）
+        self.files: Dict[str, Optional[str]] = {}
+        # 終了した場合の状態（異常終了した場合は None）
+        self.status: Optional[str] = None
+        self._items: List[Dict[str, Any]] = []
+        self._lock = asyncio.Lock()
+        # 最後の行が改行で終わっていることを確認したかどうか（最初の追記の前に1回だけ確認します）
+        self._tail_checked = False
+
+    @classmethod
+    def create(cls, task: str, model: str, directory: Optional[str] = None) -> "CheckpointSession":
+        """新しいセッションを作成し、開始を記録
+
+        Args:
+            task: ユーザーのタスク
+            model: 使用するモデル名
+            directory: チェックポイントの保存先
+
+        Returns:
+            作成したセッション
+        """
+        session = cls(uuid.uuid4().hex, directory)
+        session.task = task
+        session.model = model
+        session._append({"type": RECORD_START, "session_id": session.session_id, "task": task, "model": model})
+        return session
+
+    @classmethod
+    def load(cls, session_id: str, directory: Optional[str] = None) -> "CheckpointSession":
+        """チェックポイントを読み込み、最後に完了したターンの状態を復元
+
+        Args:
+            session_id: セッションID
+            directory: チェックポイントの保存先
+
+        Returns:
+            復元したセッション（以降のターンは同じファイルに追記します）
+
+        Raises:
+            FileNotFoundError: チェックポイントが存在しない場合
+        """
+        session = cls(session_id, directory)
+        with open(session.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込みの途中で終了した行
+                    continue
+                record_type = record.get("type")
+                if record_type == RECORD_START:
+                    session.task = record.get("task", "")
+                    session.model = record.get("model", "")
+                elif record_type == RECORD_ITEMS:
+                    session._items.extend(record.get("items") or [])
+                    session.files.update(record.get("files") or {})
+                    session.turn = record.get("turn", session.turn)
+                    session.status = None
+                elif record_type == RECORD_CLEAR:
+                    session._items.clear()
+                elif record_type == RECORD_END:
+                    session.status = record.get("status")
+        return session
+
+    def _append(self, record: Dict[str, Any]):
+        """1行を追記して fsync"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        complete = self._tail_checked or _ends_with_newline(self.path)
+        self._tail_checked = True
+        with open(self.path, "a", encoding="utf-8") as f:
+            if not complete:
+                # 再開したセッションの最後の行が途中で終わっている場合は、次の行がつながらないよう改行で区切ります
+                # （途中で終わった行は読み込み時に無視します）
+                f.write("\n")
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def run_input(self, message: str) -> List[Dict[str, Any]]:
+        """再開するときの Runner.run の入力（記録した会話履歴 + ユーザーのメッセージ）"""
+        return list(self._items) + [{"role": "user", "content": message}]
+
+    async def record_input(self, input: Union[str, List[Dict[str, Any]]]) -> None:
+        """モデルに送る入力のうち、記録した会話履歴より後のアイテムを追記
+
+        SDK はターンごとに会話履歴全体を入力として渡すため、前回の呼び出しから増えたアイテム
+        （前のターンのモデルの応答とツールの結果）だけを記録します。
+
+        Args:
+            input: モデルの入力（文字列の場合はユーザーのメッセージ）
+        """
+        if isinstance(input, str):
+            input = [{"role": "user", "content": input}]
+        async with self._lock:
+            items = [item if isinstance(item, dict) else dict(item) for item in input[len(self._items):]]
+            if not items:
+                return
+            # write_file の結果まで揃ってから記録するため、ハッシュは書き込んだ後の内容です
+            files = {path: await asyncio.to_thread(file_hash, path) for path in _written_paths(items)}
+            if any(item.get("role") != "user" for item in items):
+                self.turn += 1
+            record = {"type": RECORD_ITEMS, "turn": self.turn, "items": items, "files": files}
+            await asyncio.to_thread(self._append, record)
+            self._items.extend(items)
+            self.files.update(files)
+
+    def clear(self) -> None:
+        """記録した会話履歴を消去（完了したターンがないセッションを最初のタスクから始め直す場合）"""
+        self._append({"type": RECORD_CLEAR})
+        self._items.clear()
+
+    def end(self, status: str):
+        """セッションの終了を記録
+
+        Args:
+            status: STATUS_COMPLETE（完了）または STATUS_STOPPED（上限や中断で停止）
+        """
+        self.status = status
+        self._append({"type": RECORD_END, "status": status})
+
+    def changed_files(self) -> List[str]:
+        """チェックポイントを記録した後に内容が変わった（または削除された）ファイル"""
+        return sorted(path for path, digest in self.files.items() if file_hash(path) != digest)
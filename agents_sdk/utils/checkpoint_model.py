@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+チェックポイントを記録するモデル
+
+モデルを呼び出す前に、入力のうち前回の呼び出しから増えたアイテムをセッションのチェックポイントに
+追記します（utils/checkpoint.py）。モデルの呼び出しは SDK のバージョンによらずターンごとに行われるため、
+実行の途中で終了しても最後に完了したターンまでが残ります。
+"""
+
+import os
+import sys
+from typing import Any, AsyncIterator
+
+from agents import Model
+
+# 絶対インポートに変更
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.checkpoint import CheckpointSession
+
+class CheckpointModel(Model):
+    """チェックポイントを記録してからモデルを呼び出すラッパー
+
+    引数は SDK のバージョンによって異なるため、そのまま元のモデルに渡します。
+    """
+
+    def __init__(self, model: Model, session: CheckpointSession):
+        """初期化
+
+        Args:
+            model: 元のモデル
+            session: チェックポイントを記録するセッション
+        """
+        self.model = model
+        self.session = session
+
+    async def get_response(self, system_instructions, input, model_settings, *args, **kwargs):
+        """前のターンまでを記録してから応答を取得"""
+        await self.session.record_input(input)
+        return await self.model.get_response(system_instructions, input, model_settings, *args, **kwargs)
+
+    async def stream_response(self, system_instructions, input, model_settings, *args, **kwargs) -> AsyncIterator[Any]:
+        """前のターンまでを記録してから応答をストリーミングで取得"""
+        await self.session.record_input(input)
+        async for event in self.model.stream_response(system_instructions, input, model_settings, *args, **kwargs):
+            yield event
+
+    async def close(self) -> None:
+        close = getattr(self.model, "close", None)
+        if close is not None:
+            await close()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+禁止コマンドの照合
+
+このモジュールは、禁止コマンドリスト（config/forbidden_commands.json）を1つの正規表現に
+コンパイルして保持し、設定ファイルの更新日時が変わったときだけ読み直す照合器を提供します。
+
+コマンドと禁止パターンはどちらもシェルの字句解析（shlex）でトークンに分割し、1つの空白で
+連結した形に正規化してから照合します。そのため `rm  -rf`（空白が複数）や `rm "-rf"`（引用符付き）、
+`:(){:|:&};:`（演算子の前後の空白の有無）も同じパターンに一致します。
+"""
+
+import os
+import re
+import json
+import shlex
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Pattern, Union
+
+# 設定ファイルが見つからない場合に使用する禁止コマンド
+DEFAULT_FORBIDDEN = {
+    "common": [
+        "rm -rf", "deltree", "format", "del /s", "del /q",
+        "shutdown", "reboot", "halt"
+    ],
+    "windows": [],
+    "linux": []
+}
+
+def normalize_command(command: str) -> str:
+    """コマンドをトークンに分割し、小文字にして1つの空白で連結
+
+    引用符は取り除き、演算子（`;` `&` `|` `(` `)` `<` `>`）は独立したトークンにします。
+    Windows のパスを壊さないよう、バックスラッシュはエスケープとして扱いません。
+    引用符が閉じていないなど分割できない場合は、空白の連続だけをまとめます。
+
+    Args:
+        command: コマンド
+
+    Returns:
+        正規化したコマンド
+    """
+    lexer = shlex.shlex(command.lower(), posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    lexer.escape = ""
+    try:
+        return " ".join(lexer)
+    except ValueError:
+        return _collapse_whitespace(command)
+
+def _collapse_whitespace(command: str) -> str:
+    return " ".join(command.lower().split())
+
+def _compile(patterns: Iterable[str]) -> Optional[Pattern[str]]:
+    """パターンを1つの正規表現にまとめる（長いパターンを優先）
+
+    正規化したパターンと、空白の連続だけをまとめたパターンの両方を含めます。
+    """
+    normalized = set()
+    for pattern in patterns:
+        if pattern and pattern.strip():
+            normalized.add(normalize_command(pattern))
+            normalized.add(_collapse_whitespace(pattern))
+    if not normalized:
+        return None
+    alternatives = sorted(normalized, key=len, reverse=True)
+    return re.compile("|".join(re.escape(p) for p in alternatives))
+
+class ForbiddenCommandMatcher:
+    """禁止コマンドの照合器クラス
+
+    設定ファイルの共通と OS 固有のパターンを1つの正規表現にコンパイルして保持し、
+    照合のたびに更新日時だけを確認して、変わっていればコンパイルし直します。
+    """
+
+    def __init__(self, config_path: Union[str, Path], windows: bool):
+        """照合器の初期化
+
+        Args:
+            config_path: 禁止コマンドの設定ファイル
+            windows: Windows 用のパターンを使用するかどうか
+        """
+        self.config_path = Path(config_path)
+        self.section = "windows" if windows else "linux"
+        self._lock = threading.Lock()
+        # 読み込んだ設定ファイルの更新日時（ファイルがない場合は None、未読み込みの場合は -1）
+        self._mtime_ns: Optional[int] = -1
+        self._regex: Optional[Pattern[str]] = None
+
+    def _current_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self, mtime_ns: Optional[int]) -> None:
+        config: Dict[str, List[str]] = DEFAULT_FORBIDDEN
+        if mtime_ns is None:
+            print(f"警告: 設定ファイル '{self.config_path.name}' が見つかりません")
+        else:
+            try:
+                with open(self.config_path, "r", encoding="utf-8") as f:
+                    config = json.load(f)
+            except (IOError, json.JSONDecodeError) as e:
+                print(f"警告: 設定ファイル '{self.config_path.name}' の読み込みに失敗しました: {e}")
+        self._regex = _compile(list(config.get("common", [])) + list(config.get(self.section, [])))
+        self._mtime_ns = mtime_ns
+
+    def _get_regex(self) -> Optional[Pattern[str]]:
+        mtime_ns = self._current_mtime()
+        if mtime_ns != self._mtime_ns:
+            with self._lock:
+                if mtime_ns != self._mtime_ns:
+                    self._load(mtime_ns)
+        return self._regex
+
+    def find(self, command: str) -> Optional[str]:
+        """コマンドに含まれる禁止パターンを検索
+
+        正規化したコマンドと、空白の連続だけをまとめたコマンドの両方を照合します
+        （字句解析で形が変わる記述も、従来どおり文字列として一致すれば拒否するため）。
+
+        Args:
+            command: 実行するコマンド
+
+        Returns:
+            一致した禁止パターン（正規化後の形）。一致しない場合は None
+        """
+        regex = self._get_regex()
+        if regex is None:
+            return None
+        match = regex.search(normalize_command(command)) or regex.search(_collapse_whitespace(command))
+        return match.group(0) if match else None
+
+    def is_safe(self, command: str) -> bool:
+        """コマンドが禁止パターンを含まないかどうか
+
+        Args:
+            command: 実行するコマンド
+
+        Returns:
+            禁止パターンを含まなければ True
+        """
+        return self.find(command) is None
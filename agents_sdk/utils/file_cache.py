@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ファイル内容キャッシュ
+
+このモジュールは、ファイル内容のバイト数上限付きLRUキャッシュを提供します。
+"""
+
+import os
+import mmap
+import bisect
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+# 1ファイルあたりの上限（キャッシュ全体の上限に対する割合）
+MAX_ENTRY_RATIO = 0.25
+# これ以上の大きさのファイルは範囲指定の読み取りを mmap と行インデックスで行う（既定値。.env の MMAP_THRESHOLD）
+MMAP_THRESHOLD = 8 * 1024 * 1024
+# 保持する行インデックスの数
+MAX_LINE_INDEXES = 16
+# 行インデックスのチェックポイントの間隔（バイト）
+_INDEX_BLOCK_SIZE = 64 * 1024
+
+@dataclass
+class _Entry:
+    """キャッシュエントリ"""
+    mtime_ns: int
+    size: int
+    text: str
+
+@dataclass
+class FileSlice:
+    """範囲を指定して読み取ったファイルの一部"""
+    text: str
+    total_bytes: int
+    # 行単位で読み取った場合の範囲（1始まり、両端を含む）と総行数
+    start_line: int = 0
+    end_line: int = 0
+    total_lines: int = 0
+    # 上限バイト数に達したため end_line で打ち切った場合は True
+    truncated: bool = False
+
+class LineIndex:
+    """行オフセットの疎なインデックスクラス
+    
+    約64KBごとに「その位置以降で最初に始まる行の行番号とオフセット」を記録し、
+    任意の行を直前のチェックポイントからの走査だけで求めます。
+    """
+    
+    def __init__(self, mm: mmap.mmap, size: int, mtime_ns: int):
+        """インデックスの構築
+        
+        Args:
+            mm: ファイルをマップした mmap
+            size: ファイルサイズ
+            mtime_ns: ファイルの更新日時（ナノ秒）
+        """
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self._lines: List[int] = [0]
+        self._offsets: List[int] = [0]
+        newlines = 0
+        pos = 0
+        while pos < size:
+            end = min(pos + _INDEX_BLOCK_SIZE, size)
+            newlines += mm[pos:end].count(b"\n")
+            last = mm.rfind(b"\n", pos, end)
+            if last != -1 and last + 1 < size:
+                self._lines.append(newlines)
+                self._offsets.append(last + 1)
+            pos = end
+        ends_with_newline = size == 0 or mm[size - 1:size] == b"\n"
+        self.total_lines = newlines if ends_with_newline else newlines + 1
+    
+    def offset_of(self, mm: mmap.mmap, line: int) -> int:
+        """行の先頭のオフセットを取得
+        
+        Args:
+            mm: ファイルをマップした mmap
+            line: 行番号（0始まり）
+            
+        Returns:
+            行の先頭のオフセット
+        """
+        if line >= self.total_lines:
+            return self.size
+        index = bisect.bisect_right(self._lines, line) - 1
+        current, offset = self._lines[index], self._offsets[index]
+        while current < line:
+            offset = mm.find(b"\n", offset) + 1
+            current += 1
+        return offset
+
+class FileContentCache:
+    """ファイル内容キャッシュクラス
+    
+    解決済みの絶対パスとエンコーディングをキーにデコード済みの内容を保持し、
+    (st_mtime_ns, st_size) が変わっていれば読み直します。
+    """
+    
+    def __init__(self, max_bytes: int, mmap_threshold: int = MMAP_THRESHOLD):
+        """キャッシュの初期化
+        
+        Args:
+            max_bytes: キャッシュ全体の上限（バイト）
+            mmap_threshold: これ以上の大きさのファイルは範囲指定の読み取りを mmap で行う（バイト）
+        """
+        self.max_bytes = max_bytes
+        self.mmap_threshold = mmap_threshold
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._line_indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+    
+    def read_text(self, path: Union[str, Path], encoding: str = "utf-8") -> str:
+        """ファイルの内容を読み取り（変更が無ければキャッシュから返す）
+        
+        Args:
+            path: ファイルパス
+            encoding: エンコーディング
+            
+        Returns:
+            ファイル内容
+        """
+        resolved = os.path.realpath(path)
+        stat = os.stat(resolved)
+        key = (resolved, encoding)
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.bytes_saved += entry.size
+                return entry.text
+            self.misses += 1
+        
+        with open(resolved, "r", encoding=encoding) as f:
+            text = f.read()
+        
+        if stat.st_size <= self.max_bytes * MAX_ENTRY_RATIO:
+            with self._lock:
+                self._remove(key)
+                self._entries[key] = _Entry(stat.st_mtime_ns, stat.st_size, text)
+                self._bytes += stat.st_size
+                while self._bytes > self.max_bytes and self._entries:
+                    self._remove(next(iter(self._entries)))
+        return text
+    
+    def read_lines(self, path: Union[str, Path], start_line: int = 1, end_line: int = 0,
+                   max_bytes: int = 0, encoding: str = "utf-8") -> FileSlice:
+        """ファイルを行単位で範囲を指定して読み取り
+        
+        大きなファイルは mmap とキャッシュした行インデックスを使用し、
+        先頭から走査せずに指定した行を読み取ります。
+        
+        Args:
+            path: ファイルパス
+            start_line: 開始行（1始まり）
+            end_line: 終了行（この行を含む）。0の場合は最終行まで
+            max_bytes: 読み取る最大バイト数。0の場合は無制限（最低1行は返す）
+            encoding: エンコーディング
+            
+        Returns:
+            読み取った範囲と総行数
+        """
+        resolved = os.path.realpath(path)
+        stat = os.stat(resolved)
+        start_line = max(1, start_line)
+        if stat.st_size < self.mmap_threshold:
+            return self._read_lines_cached(resolved, stat.st_size, start_line, end_line, max_bytes, encoding)
+        
+        with open(resolved, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            index = self._get_line_index(resolved, mm, stat)
+            total = index.total_lines
+            last = min(end_line, total) if end_line > 0 else total
+            begin = index.offset_of(mm, start_line - 1)
+            offset = begin
+            line = start_line - 1
+            while line < last:
+                next_newline = mm.find(b"\n", offset)
+                next_offset = stat.st_size if next_newline == -1 else next_newline + 1
+                if max_bytes and line >= start_line and next_offset - begin > max_bytes:
+                    break
+                offset = next_offset
+                line += 1
+            text = mm[begin:offset].decode(encoding, errors="replace")
+        return FileSlice(text, stat.st_size, start_line, line, total, truncated=line < last)
+    
+    def read_bytes(self, path: Union[str, Path], offset: int, length: int,
+                   encoding: str = "utf-8") -> FileSlice:
+        """ファイルをバイト単位で範囲を指定して読み取り
+        
+        Args:
+            path: ファイルパス
+            offset: 開始位置（バイト）
+            length: 読み取るバイト数
+            encoding: エンコーディング（範囲の境界で分断された文字は置換文字になる）
+            
+        Returns:
+            読み取った範囲とファイルの総バイト数
+        """
+        resolved = os.path.realpath(path)
+        with open(resolved, "rb") as f:
+            total = os.fstat(f.fileno()).st_size
+            f.seek(max(0, offset))
+            data = f.read(max(0, length))
+        return FileSlice(data.decode(encoding, errors="replace"), total)
+    
+    def _read_lines_cached(self, path: str, size: int, start_line: int, end_line: int,
+                           max_bytes: int, encoding: str) -> FileSlice:
+        lines = self.read_text(path, encoding=encoding).split("\n")
+        if lines[-1] == "":
+            lines.pop()
+        total = len(lines)
+        last = min(end_line, total) if end_line > 0 else total
+        selected = []
+        used = 0
+        line = start_line - 1
+        while line < last:
+            length = len(lines[line].encode(encoding, errors="replace")) + 1
+            if max_bytes and selected and used + length > max_bytes:
+                break
+            selected.append(lines[line])
+            used += length
+            line += 1
+        text = "\n".join(selected) + ("\n" if selected else "")
+        return FileSlice(text, size, start_line, line, total, truncated=line < last)
+    
+    def _get_line_index(self, path: str, mm: mmap.mmap, stat: os.stat_result) -> LineIndex:
+        with self._lock:
+            index = self._line_indexes.get(path)
+            if index is not None and index.mtime_ns == stat.st_mtime_ns and index.size == stat.st_size:
+                self._line_indexes.move_to_end(path)
+                return index
+        index = LineIndex(mm, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            self._line_indexes[path] = index
+            while len(self._line_indexes) > MAX_LINE_INDEXES:
+                self._line_indexes.popitem(last=False)
+        return index
+    
+    def invalidate(self, path: Union[str, Path]) -> None:
+        """指定したファイルのキャッシュを破棄
+        
+        Args:
+            path: ファイルパス
+        """
+        resolved = os.path.realpath(path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == resolved]:
+                self._remove(key)
+            self._line_indexes.pop(resolved, None)
+    
+    def clear(self) -> None:
+        """すべてのキャッシュを破棄"""
+        with self._lock:
+            self._entries.clear()
+            self._line_indexes.clear()
+            self._bytes = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """キャッシュの統計情報を取得
+        
+        Returns:
+            ヒット・ミスの回数、読み取りを省略したバイト数、エントリ数、使用バイト数
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_saved": self.bytes_saved,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            }
+    
+    def _remove(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
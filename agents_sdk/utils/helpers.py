@@ -10,10 +10,40 @@
 import os
 import sys
 import json
+import time
+import signal
+import asyncio
+import importlib
+import threading
 import subprocess
+from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Union
 from pathlib import Path
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from utils.command_filter import ForbiddenCommandMatcher
+from utils.file_cache import FileContentCache
+from utils.patcher import atomic_write
+from utils.task_context import current_task
+
+# ツール間で共有するファイル内容キャッシュ
+file_cache = FileContentCache(settings.get_file_cache_max_bytes(), settings.get_mmap_threshold())
+
+# 禁止コマンドの照合器（設定ファイルが更新されたときだけ読み直す）
+_command_matcher = ForbiddenCommandMatcher(
+    Path(__file__).parents[1] / "config" / "forbidden_commands.json",
+    windows=sys.platform.startswith("win")
+)
+
+# 非同期コマンド実行で一度に読み取るバイト数
+_READ_CHUNK_SIZE = 65536
+# コマンドの終了後にパイプに残った出力を読み取る最大秒数
+# （バックグラウンドで起動した子孫プロセスがパイプを開いたままの場合に待ち続けないため）
+_DRAIN_TIMEOUT = 1.0
+# 出力を読み取っている間にコマンドの終了を確認する間隔（秒）
+_EXIT_POLL_INTERVAL = 0.05
+
 def ensure_directory(path: Union[str, Path]) -> Path:
     """ディレクトリの存在を確認し、存在しない場合は作成
     
@@ -101,16 +131,222 @@ def run_command(command: str, shell: bool = True, check: bool = False) -> subpro
     
     return process
 
+@dataclass
+class CommandResult:
+    """非同期コマンド実行の結果"""
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    stdout_bytes: int
+    stderr_bytes: int
+    truncated: bool
+    timed_out: bool
+    duration: float
+    # コマンドの途中でシェルが終了した（永続的なシェルセッションの場合のみ）
+    shell_exited: bool = False
+
+async def _read_stream(stream: asyncio.StreamReader, buffer: bytearray, limit: int) -> int:
+    """ストリームを少しずつ読み取り、上限までをバッファに格納
+    
+    上限を超えた分は読み捨てる（パイプが詰まって子プロセスが止まらないように
+    最後まで読み続ける）。
+    
+    Args:
+        stream: 読み取るストリーム
+        buffer: 格納先のバッファ
+        limit: 格納する最大バイト数
+        
+    Returns:
+        読み取った総バイト数
+    """
+    total = 0
+    while True:
+        chunk = await stream.read(_READ_CHUNK_SIZE)
+        if not chunk:
+            return total
+        total += len(chunk)
+        remaining = limit - len(buffer)
+        if remaining > 0:
+            buffer += chunk[:remaining]
+
+def _kill_process_tree(process: asyncio.subprocess.Process) -> None:
+    """プロセスとその子孫プロセスをすべて終了
+    
+    Args:
+        process: 終了するプロセス
+    """
+    if process.returncode is not None:
+        return
+    try:
+        if is_windows():
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        else:
+            # 新しいセッションで起動しているのでプロセスグループごと終了できる
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, OSError):
+        pass
+
+async def _wait_exit(process: asyncio.subprocess.Process, readers: asyncio.Future,
+                     deadline: Optional[float]) -> bool:
+    """コマンドの終了を期限まで待機
+    
+    Process.wait() はパイプが閉じるまで戻らず、バックグラウンドで起動した子孫プロセスが
+    パイプを開いたままだと終了を検出できないため、出力を読み取っている間は returncode を確認します。
+    
+    Args:
+        process: 待つプロセス
+        readers: 標準出力・標準エラーの読み取り
+        deadline: 期限（time.monotonic() の値）。None の場合は無制限
+        
+    Returns:
+        期限までに終了しなかった場合は True
+    """
+    while process.returncode is None:
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        if remaining is not None and remaining <= 0:
+            return True
+        if readers.done():
+            # パイプが閉じた後は Process.wait() で終了を待てる
+            try:
+                await asyncio.wait_for(process.wait(), remaining)
+            except asyncio.TimeoutError:
+                return True
+            return False
+        await asyncio.wait({readers}, timeout=min(_EXIT_POLL_INTERVAL, remaining or _EXIT_POLL_INTERVAL))
+    return False
+
+def _close_pipes(process: asyncio.subprocess.Process) -> None:
+    """子孫プロセスが開いたままの標準出力・標準エラーのパイプを閉じる
+    
+    閉じないとイベントループを閉じた後にトランスポートが破棄され、エラーが表示されます。
+    asyncio.subprocess.Process にはパイプを閉じる公開の API がないため、トランスポートから取得します。
+    
+    Args:
+        process: 終了したプロセス
+    """
+    transport = getattr(process, "_transport", None)
+    if transport is None:
+        return
+    for fd in (1, 2):
+        pipe = transport.get_pipe_transport(fd)
+        if pipe is not None:
+            pipe.close()
+
+async def run_command_async(command: str, timeout: Optional[float] = None,
+                            output_limit: int = 1048576,
+                            cwd: Optional[Union[str, Path]] = None) -> CommandResult:
+    """イベントループを止めずにコマンドを実行
+    
+    標準出力・標準エラーは少しずつ読み取り、それぞれ output_limit バイトまで
+    保持します。タイムアウトは起動からコマンドの終了までにかかる時間に適用し、
+    タイムアウトやキャンセル時はプロセスツリーごと終了します。コマンドの終了後は
+    パイプに残った出力を短い時間だけ読み取り、バックグラウンドで起動した子孫プロセスの終了は待ちません。
+    
+    Args:
+        command: 実行するコマンド
+        timeout: タイムアウト（秒）。None または0以下の場合は無制限
+        output_limit: 標準出力・標準エラーそれぞれの最大取得バイト数
+        cwd: コマンドを実行するディレクトリ。None の場合はカレントディレクトリ
+        
+    Returns:
+        実行結果
+    """
+    if is_windows():
+        kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    else:
+        kwargs = {"start_new_session": True}
+    
+    start = time.monotonic()
+    process = await asyncio.create_subprocess_shell(
+        command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        **kwargs
+    )
+    
+    stdout_buffer = bytearray()
+    stderr_buffer = bytearray()
+    readers = asyncio.gather(
+        _read_stream(process.stdout, stdout_buffer, output_limit),
+        _read_stream(process.stderr, stderr_buffer, output_limit)
+    )
+    
+    try:
+        # 出力の読み取りと並行して、起動から timeout 秒までコマンドの終了を待つ
+        timed_out = await _wait_exit(process, readers, start + timeout if timeout and timeout > 0 else None)
+        if timed_out:
+            _kill_process_tree(process)
+            await _wait_exit(process, readers, None)
+        try:
+            stdout_bytes, stderr_bytes = await asyncio.wait_for(readers, _DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            # 子孫プロセスがパイプを開いたまま（wait_for が読み取りを取り消します）
+            _close_pipes(process)
+            stdout_bytes, stderr_bytes = len(stdout_buffer), len(stderr_buffer)
+    except asyncio.CancelledError:
+        # キャンセルされた場合もプロセスを残さない
+        _kill_process_tree(process)
+        readers.cancel()
+        readers.add_done_callback(lambda f: f.cancelled() or f.exception())
+        raise
+    
+    return CommandResult(
+        returncode=process.returncode,
+        stdout=stdout_buffer.decode("utf-8", errors="replace"),
+        stderr=stderr_buffer.decode("utf-8", errors="replace"),
+        stdout_bytes=stdout_bytes,
+        stderr_bytes=stderr_bytes,
+        truncated=stdout_bytes > len(stdout_buffer) or stderr_bytes > len(stderr_buffer),
+        timed_out=timed_out,
+        duration=time.monotonic() - start
+    )
+
+def preload_modules(*names: str) -> threading.Thread:
+    """モジュールをバックグラウンドのスレッドで読み込みます。
+    
+    ユーザーの入力を待つ間に重いモジュール（agents など）の読み込みを済ませ、
+    起動してから入力を求めるまでの時間を短くします。読み込みに失敗した場合は何もしません
+    （実際に使う箇所の import で改めてエラーになります）。
+    
+    Args:
+        names: 読み込むモジュール名（指定した順に読み込みます）
+        
+    Returns:
+        読み込みを行うスレッド
+    """
+    def load():
+        for name in names:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass
+    
+    thread = threading.Thread(target=load, name="preload-modules", daemon=True)
+    thread.start()
+    return thread
+
 def normalize_path(path: Union[str, Path]) -> Path:
     """パスを正規化
     
+    バッチモードで実行中のタスクでは、相対パスをタスクの作業ディレクトリからのパスとして扱います。
+    
     Args:
         path: 正規化するパス
         
     Returns:
         正規化されたパス
     """
-    return Path(os.path.normpath(os.path.expanduser(str(path))))
+    path = os.path.expanduser(str(path))
+    task = current_task()
+    if task is not None and not os.path.isabs(path):
+        path = os.path.join(task.workdir, path)
+    return Path(os.path.normpath(path))
 
 def read_file_safe(path: Union[str, Path], encoding: str = "utf-8", default: str = "") -> str:
     """安全にファイルを読み取り
@@ -124,8 +360,8 @@ def read_file_safe(path: Union[str, Path], encoding: str = "utf-8", default: str
         ファイル内容、またはデフォルト値
     """
     try:
-        with open(path, "r", encoding=encoding) as f:
-            return f.read()
+        # 変更されていなければキャッシュから返す
+        return file_cache.read_text(path, encoding=encoding)
     except (IOError, UnicodeDecodeError):
         return default
 
@@ -141,11 +377,9 @@ def write_file_safe(path: Union[str, Path], content: str, encoding: str = "utf-8
         成功した場合True
     """
     try:
-        # ディレクトリが存在しない場合は作成
-        ensure_directory(Path(path).parent)
-        
-        with open(path, "w", encoding=encoding) as f:
-            f.write(content)
+        # 一時ファイルに書き込んでから置き換え（ディレクトリが存在しない場合は作成）
+        atomic_write(path, content, encoding=encoding)
+        file_cache.invalidate(path)
         return True
     except (IOError, UnicodeEncodeError):
         return False
@@ -197,45 +431,14 @@ def is_command_safe(command: str) -> bool:
     """コマンドが安全に実行できるかどうかを確認します。
     外部の設定ファイルから禁止コマンドリストを読み取ります。
     
+    禁止コマンドリストは1つの正規表現にコンパイルして保持し、設定ファイルの更新日時が
+    変わったときだけ読み直します。コマンドはシェルの字句解析で正規化してから照合するため、
+    空白の数や引用符の有無の違いでは回避できません。
+    
     Args:
         command: 実行するコマンド
         
     Returns:
         bool: コマンドが安全であればTrue、そうでなければFalse
     """
-    # デフォルトの禁止コマンド（設定ファイルが見つからない場合に使用）
-    default_forbidden = {
-        "common": [
-            "rm -rf", "deltree", "format", "del /s", "del /q",
-            "shutdown", "reboot", "halt"
-        ],
-        "windows": [],
-        "linux": []
-    }
-    
-    # 禁止コマンドリストの読み込み
-    config = load_config_file("forbidden_commands.json", default_forbidden)
-    
-    # 共通の禁止コマンド
-    forbidden_commands = config.get("common", [])
-    
-    # OS固有の禁止コマンド
-    if is_windows():
-        os_specific_commands = config.get("windows", [])
-    else:
-        os_specific_commands = config.get("linux", [])
-    
-    # コマンドを小文字に変換
-    command_lower = command.lower()
-    
-    # 共通の禁止コマンドをチェック
-    for forbidden in forbidden_commands:
-        if forbidden.lower() in command_lower:
-            return False
-    
-    # OS固有の禁止コマンドをチェック
-    for forbidden in os_specific_commands:
-        if forbidden.lower() in command_lower:
-            return False
-    
-    return True 
\ No newline at end of file
+    return _command_matcher.is_safe(command) 
\ No newline at end of file
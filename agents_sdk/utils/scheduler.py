@@ -0,0 +1,422 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+モデルの呼び出しのスケジューラー
+
+エージェントのモデルを ScheduledModel で包み、モデルを呼び出す前に次の2つのトークンバケットで
+送信を待たせます。バッチモードで複数のタスクを同時に実行しても、合計が1分あたりのリクエスト数
+（.env の RATE_LIMIT_RPM）とトークン数（RATE_LIMIT_TPM）を超えません。送信を待っている呼び出しは、
+タスクごとの順番（各タスクの何番目の呼び出しか）が小さいものから送信するため、呼び出しの多いタスクが
+他のタスクを待たせ続けることはありません。
+
+429（レート制限）・408・409・5xx と接続エラーは、Retry-After（retry-after-ms）を優先し、
+なければジッター付きの指数バックオフで待って送り直します（最大 MAX_RETRIES 回）。429 の場合は
+他のタスクも同じ時間だけ送信を止めます。送り直しが重ならないよう、API クライアントの組み込みの
+再試行は無効にします。
+
+トークン数は送信前に推定値（入力の文字数 / 4 + 出力の上限）で予約し、応答の usage で精算します。
+失敗した送信の予約は送り直す前に戻します。
+待ち行列の長さ・待ち時間・再試行の回数は stats() で取得できます。
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import datetime
+import itertools
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from agents import Model
+
+# 絶対インポートに変更
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from utils.task_context import current_task
+
+T = TypeVar("T")
+
+# 送り直すステータスコード（5xx も送り直します）
+RETRYABLE_STATUS = {408, 409, 429}
+# 出力の上限が指定されていない場合に予約する出力トークン数
+DEFAULT_OUTPUT_TOKENS = 1024
+# 待ち行列の先頭でない呼び出しが状態を確認し直す間隔（秒）
+_POLL_INTERVAL = 0.05
+
+class RetryLimitExceeded(Exception):
+    """送り直しても成功しなかったことを示す例外"""
+
+    def __init__(self, attempts: int, error: BaseException):
+        super().__init__(f"{attempts}回送信しても成功しませんでした: {str(error)}")
+        self.attempts = attempts
+        self.error = error
+
+class TokenBucket:
+    """1分あたりの量を上限とするトークンバケット
+
+    容量は1分ぶんです。take() は残量を超えて消費でき、不足分は以降の補充で返します。
+    """
+
+    def __init__(self, rate_per_minute: float):
+        """初期化
+
+        Args:
+            rate_per_minute: 1分あたりの量（0 の場合は無制限）
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """amount を消費できるまでの秒数を取得（容量を超える量は容量まで待ちます）"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        needed = min(amount, self.capacity) - self.level
+        return needed / self.rate if needed > 0 else 0.0
+
+    def take(self, amount: float, now: float) -> None:
+        if self.rate > 0:
+            self._refill(now)
+            self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        """予約した量のうち使わなかった分を戻す（負の値の場合は追加で消費します）"""
+        if self.rate > 0:
+            self.level = min(self.capacity, self.level + amount)
+
+@dataclass(order=True)
+class _Ticket:
+    """送信を待っている呼び出し（タスクの中での順番・到着順に送信します）"""
+    round: int
+    seq: int
+    key: str = field(compare=False)
+    tokens: int = field(compare=False)
+    enqueued: float = field(compare=False)
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """エラーの応答の Retry-After（retry-after-ms）ヘッダーの秒数を取得
+
+    Args:
+        error: API のエラー
+
+    Returns:
+        待つ秒数（ヘッダーがない場合は None）
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (date - datetime.datetime.now(date.tzinfo)).total_seconds())
+
+def is_retryable(error: BaseException) -> bool:
+    """送り直すエラーかどうか（レート制限・一時的なサーバーエラー・接続エラー）"""
+    from openai import APIConnectionError
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(error, APIConnectionError)
+
+class RequestScheduler:
+    """リクエストスケジューラークラス
+
+    トークンバケットで送信を待たせ、一時的なエラーで失敗した呼び出しを送り直します。
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        """初期化
+
+        Args:
+            requests_per_minute: 1分あたりのリクエスト数の上限（0 の場合は無制限）
+            tokens_per_minute: 1分あたりのトークン数の上限（0 の場合は無制限）
+            max_retries: 送り直す最大回数
+            base_delay: 指数バックオフの最初の待ち時間（秒）
+            max_delay: 指数バックオフの待ち時間の上限（秒）
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._queue: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._rounds: Dict[str, int] = {}
+        self._current_round = 0
+        # 429 を受け取った場合に、すべてのタスクの送信を止める期限
+        self._paused_until = 0.0
+        self._stats = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failed": 0,
+            "max_queue_depth": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "backoff_seconds": 0.0
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        """送信を待っている呼び出しの数"""
+        return len(self._queue)
+
+    def _try_dispatch(self, ticket: _Ticket) -> Optional[float]:
+        """ticket を送信できれば予約して None を、できなければ待つ秒数を返す（先頭でない場合は 0）"""
+        if min(self._queue) is not ticket:
+            return 0.0
+        now = time.monotonic()
+        wait = max(
+            self._paused_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(ticket.tokens, now)
+        )
+        if wait > 0:
+            return wait
+        self.requests.take(1, now)
+        self.tokens.take(ticket.tokens, now)
+        self._queue.remove(ticket)
+        self._current_round = ticket.round
+        waited = now - ticket.enqueued
+        self._stats["requests"] += 1
+        self._stats["wait_seconds"] += waited
+        self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        return None
+
+    async def acquire(self, key: str = "default", tokens: int = 0) -> None:
+        """送信できるまで待ってからトークン数を予約
+
+        Args:
+            key: タスクのキー（公平に送信する単位）
+            tokens: 予約するトークン数の推定値
+        """
+        # しばらく呼び出していなかったタスクが溜めた順番で割り込まないよう、現在の順番から始める
+        round_ = max(self._rounds.get(key, 0), self._current_round)
+        self._rounds[key] = round_ + 1
+        ticket = _Ticket(round_, next(self._seq), key, tokens, time.monotonic())
+        self._queue.append(ticket)
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._queue))
+        try:
+            while True:
+                wait = self._try_dispatch(ticket)
+                if wait is None:
+                    return
+                await asyncio.sleep(wait or _POLL_INTERVAL)
+        except BaseException:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+            raise
+
+    def settle(self, reserved: int, actual: Optional[int]) -> None:
+        """予約したトークン数を実際の使用量で精算（使用量が分からない場合は何もしません）"""
+        if actual is not None:
+            self.tokens.give_back(reserved - actual)
+
+    def refund(self, reserved: int) -> None:
+        """失敗した送信の予約を戻す（送り直すたびに予約し直すため、戻さないと二重に消費します）"""
+        self.tokens.give_back(reserved)
+
+    def backoff(self, attempt: int, error: BaseException) -> Optional[float]:
+        """送り直すまでの秒数を取得
+
+        Retry-After があればその秒数（複数のタスクが同時に送り直さないよう最大10%のジッターを加えます）、
+        なければ上限付きの指数バックオフの半分から全体までの乱数です。429 の場合はすべてのタスクの送信を止めます。
+
+        Args:
+            attempt: 失敗した送信の回数 - 1
+            error: 発生したエラー
+
+        Returns:
+            待つ秒数（送り直さない場合は None）
+        """
+        if not is_retryable(error) or attempt >= self.max_retries:
+            self._stats["failed"] += 1
+            return None
+        delay = retry_after(error)
+        if delay is not None:
+            delay *= 1 + random.random() * 0.1
+        else:
+            ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+            delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+        self._stats["retries"] += 1
+        self._stats["backoff_seconds"] += delay
+        if getattr(error, "status_code", None) == 429:
+            self._stats["rate_limited"] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    async def call(self, func: Callable[[], Awaitable[T]], key: str = "default", tokens: int = 0) -> T:
+        """送信できるまで待ってから func を呼び出し、一時的なエラーの場合は送り直す
+
+        Args:
+            func: モデルを呼び出すコルーチンを返す関数
+            key: タスクのキー
+            tokens: 予約するトークン数の推定値
+
+        Returns:
+            func の戻り値
+
+        Raises:
+            RetryLimitExceeded: 送り直しても成功しなかった場合（送り直さないエラーはそのまま送出します）
+        """
+        for attempt in itertools.count():
+            await self.acquire(key, tokens)
+            try:
+                return await func()
+            except Exception as e:
+                self.refund(tokens)
+                delay = self.backoff(attempt, e)
+                if delay is None:
+                    if attempt > 0:
+                        raise RetryLimitExceeded(attempt + 1, e) from e
+                    raise
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """待ち行列の長さ・待ち時間・再試行の回数を取得"""
+        stats = dict(self._stats)
+        stats["queue_depth"] = len(self._queue)
+        stats["avg_wait_seconds"] = stats["wait_seconds"] / stats["requests"] if stats["requests"] else 0.0
+        for name in ("wait_seconds", "max_wait_seconds", "backoff_seconds", "avg_wait_seconds"):
+            stats[name] = round(stats[name], 3)
+        return stats
+
+def _task_key() -> str:
+    """公平に送信する単位（バッチモードではタスクID）"""
+    context = current_task()
+    return context.task_id if context is not None else "default"
+
+def _estimate_tokens(system_instructions: Optional[str], input: Any, model_settings: Any) -> int:
+    """予約するトークン数の推定値（入力は4文字で1トークン + 出力の上限）"""
+    text = input if isinstance(input, str) else json.dumps(input, ensure_ascii=False, default=str)
+    output_tokens = getattr(model_settings, "max_tokens", None) or DEFAULT_OUTPUT_TOKENS
+    return (len(system_instructions or "") + len(text)) // 4 + output_tokens
+
+def _used_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+class ScheduledModel(Model):
+    """スケジューラーを通してモデルを呼び出すラッパー
+
+    引数は SDK のバージョンによって異なるため、そのまま元のモデルに渡します。
+    """
+
+    def __init__(self, model: Model, scheduler: RequestScheduler):
+        """初期化
+
+        Args:
+            model: 元のモデル
+            scheduler: 使用するスケジューラー
+        """
+        self.model = model
+        self.scheduler = scheduler
+
+    async def get_response(self, system_instructions, input, model_settings, *args, **kwargs):
+        """送信できるまで待ってから応答を取得（一時的なエラーの場合は送り直します）"""
+        reserved = _estimate_tokens(system_instructions, input, model_settings)
+        response = await self.scheduler.call(
+            lambda: self.model.get_response(system_instructions, input, model_settings, *args, **kwargs),
+            key=_task_key(),
+            tokens=reserved
+        )
+        self.scheduler.settle(reserved, _used_tokens(response))
+        return response
+
+    async def stream_response(self, system_instructions, input, model_settings, *args, **kwargs) -> AsyncIterator[Any]:
+        """送信できるまで待ってから応答をストリーミングで取得
+
+        最初のイベントを受信する前のエラーだけを送り直します（受信した後は送り直しません）。
+        """
+        reserved = _estimate_tokens(system_instructions, input, model_settings)
+        key = _task_key()
+        for attempt in itertools.count():
+            await self.scheduler.acquire(key, reserved)
+            received = False
+            try:
+                async for event in self.model.stream_response(system_instructions, input, model_settings,
+                                                               *args, **kwargs):
+                    received = True
+                    if getattr(event, "type", None) == "response.completed":
+                        self.scheduler.settle(reserved, _used_tokens(getattr(event, "response", None)))
+                    yield event
+                return
+            except Exception as e:
+                if received:
+                    raise
+                self.scheduler.refund(reserved)
+                delay = self.scheduler.backoff(attempt, e)
+                if delay is None:
+                    if attempt > 0:
+                        raise RetryLimitExceeded(attempt + 1, e) from e
+                    raise
+            await asyncio.sleep(delay)
+
+    async def close(self) -> None:
+        close = getattr(self.model, "close", None)
+        if close is not None:
+            await close()
+
+# プロセスで共有するスケジューラー（最初に使用したときに作成）
+_scheduler: Optional[RequestScheduler] = None
+
+def get_scheduler() -> RequestScheduler:
+    """プロセスで共有するスケジューラーを取得
+
+    Returns:
+        .env の設定で作成したスケジューラー
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RequestScheduler(
+            settings.get_rate_limit_rpm(), settings.get_rate_limit_tpm(),
+            settings.get_max_retries(), settings.get_retry_base_delay(), settings.get_retry_max_delay()
+        )
+    return _scheduler
+
+def scheduled_model(model_name: str) -> ScheduledModel:
+    """スケジューラーを通して呼び出すモデルを作成
+
+    API クライアントの組み込みの再試行は無効にします（送り直しはスケジューラーで行います）。
+
+    Args:
+        model_name: モデル名
+
+    Returns:
+        Agent の model に指定するモデル
+    """
+    from openai import AsyncOpenAI
+    from agents import OpenAIProvider
+    provider = OpenAIProvider(openai_client=AsyncOpenAI(max_retries=0))
+    return ScheduledModel(provider.get_model(model_name), get_scheduler())
+
+def stats() -> Optional[Dict[str, Any]]:
+    """待ち行列の長さ・待ち時間・再試行の回数を取得（スケジューラーを作成していない場合は None）"""
+    return _scheduler.stats() if _scheduler is not None else None
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+永続的なシェルセッション
+
+execute_command のたびにシェルを起動する代わりに、長時間動作するシェルにパイプ経由で
+コマンドを送り、標準出力と標準エラー出力に書き出した区切り文字（セッションごとの乱数と
+コマンドの通し番号）までをそのコマンドの出力として読み取ります。`cd` や環境変数の変更は
+同じセッションの次のコマンドに引き継がれます。
+
+シェルはキー（通常の実行では1つ、バッチモードではタスクごと）ごとにプールで保持し、
+シェルが終了した場合（コマンド中の `exit` など）やタイムアウトで強制終了した場合は、
+次のコマンドを実行するときに自動的に起動し直します。
+
+.env の SHELL_SESSION=true の場合だけ使用します。
+"""
+
+import os
+import sys
+import time
+import uuid
+import base64
+import shutil
+import asyncio
+import subprocess
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Union
+
+# 絶対インポートに変更
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import settings
+from utils.helpers import CommandResult, is_windows, _kill_process_tree
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+def _shell_command() -> List[str]:
+    """シェルの起動コマンドを取得"""
+    if is_windows():
+        return ["powershell.exe", "-NoLogo", "-NoProfile", "-NonInteractive", "-Command", "-"]
+    bash = shutil.which("bash")
+    if bash:
+        return [bash, "--noprofile", "--norc"]
+    return ["/bin/sh"]
+
+def _wrap_posix(command: str, marker: str) -> str:
+    """コマンドを区切り文字の出力で囲む（sh / bash）
+
+    コマンドは引用符で囲まないヒアドキュメントで渡して eval するため、複数行のコマンドや
+    引用符を含むコマンドもそのまま実行できます。標準入力はシェルへのパイプを読まないよう
+    /dev/null にします。
+    """
+    delimiter = f"__AGENT_CMD_{uuid.uuid4().hex}"
+    return (
+        f"eval \"$(cat <<'{delimiter}'\n{command}\n{delimiter}\n)\" < /dev/null\n"
+        f"__agent_rc=$?\n"
+        f"printf '\\n%s %d\\n' '{marker}' \"$__agent_rc\"\n"
+        f"printf '\\n%s\\n' '{marker}' >&2\n"
+    )
+
+def _wrap_powershell(command: str, marker: str) -> str:
+    """コマンドを区切り文字の出力で囲む（PowerShell。コマンドは Base64 で渡して1行にします）"""
+    encoded = base64.b64encode(command.encode("utf-8")).decode("ascii")
+    return (
+        f"$__agent_cmd = [Text.Encoding]::UTF8.GetString([Convert]::FromBase64String('{encoded}')); "
+        "$global:LASTEXITCODE = 0; $__agent_ok = $true; "
+        "try { Invoke-Expression $__agent_cmd | Out-String -Stream } "
+        "catch { $__agent_ok = $false; [Console]::Error.WriteLine($_.ToString()) }; "
+        "$__agent_rc = if ($LASTEXITCODE) { $LASTEXITCODE } elseif ($__agent_ok) { 0 } else { 1 }; "
+        f"[Console]::Out.WriteLine(''); [Console]::Out.WriteLine('{marker} ' + $__agent_rc); "
+        f"[Console]::Error.WriteLine(''); [Console]::Error.WriteLine('{marker}')\n"
+    )
+
+class _MarkerScanner:
+    """ストリームから区切り文字の行までを読み取り、上限までをバッファに格納
+
+    区切り文字は行頭にだけ現れるよう改行を前に付けて出力するため、その改行も区切り文字の
+    一部として取り除きます（コマンドの出力が改行で終わらない場合も元の出力のままになります）。
+    """
+
+    def __init__(self, marker: bytes, limit: int):
+        self.marker = b"\n" + marker
+        self.limit = limit
+        self.buffer = bytearray()
+        self.total = 0
+        self.status: Optional[bytes] = None
+        self._pending = b""
+
+    def _append(self, data: bytes) -> None:
+        self.total += len(data)
+        room = self.limit - len(self.buffer)
+        if room > 0:
+            self.buffer += data[:room]
+
+    def feed(self, chunk: bytes) -> bool:
+        """読み取ったデータを追加し、区切り文字の行まで読み取った場合は True を返す"""
+        data = self._pending + chunk
+        index = data.find(self.marker)
+        if index >= 0:
+            end = data.find(b"\n", index + len(self.marker))
+            if end < 0:
+                self._pending = data
+                return False
+            self._append(data[:index])
+            self.status = data[index + len(self.marker):end].strip()
+            self._pending = b""
+            return True
+        # 区切り文字の途中で切れている可能性がある末尾は次のデータと合わせて調べる
+        keep = len(self.marker) - 1
+        if len(data) > keep:
+            self._append(data[:-keep])
+            data = data[-keep:]
+        self._pending = data
+        return False
+
+    def finish(self) -> None:
+        """区切り文字を読み取る前にストリームが終了した場合に残りを格納"""
+        self._append(self._pending)
+        self._pending = b""
+
+    def text(self) -> str:
+        output = bytes(self.buffer)
+        if output.endswith(b"\r"):
+            output = output[:-1]
+        return output.decode("utf-8", errors="replace")
+
+async def _scan(stream: asyncio.StreamReader, scanner: _MarkerScanner) -> bool:
+    """区切り文字の行まで読み取る（ストリームが終了した場合は False を返す）"""
+    while True:
+        chunk = await stream.read(_READ_CHUNK_SIZE)
+        if not chunk:
+            scanner.finish()
+            return False
+        if scanner.feed(chunk):
+            return True
+
+class ShellSession:
+    """1つの長時間動作するシェル
+
+    同じセッションでは一度に1つのコマンドだけを実行します（後から来たコマンドは前のコマンドの
+    終了を待ちます）。
+    """
+
+    def __init__(self, cwd: Optional[Union[str, Path]] = None):
+        """初期化
+
+        Args:
+            cwd: シェルを起動するディレクトリ（起動し直したときもこのディレクトリに戻ります）
+        """
+        self.cwd = str(cwd) if cwd is not None else os.getcwd()
+        self.lock = asyncio.Lock()
+        # 起動した回数（2回目以降は自動的に起動し直したことを示します）
+        self.starts = 0
+        self._token = uuid.uuid4().hex
+        self._counter = 0
+        self._process: Optional[asyncio.subprocess.Process] = None
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def _start(self) -> None:
+        if is_windows():
+            kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            # タイムアウトしたときにシェルから起動したプロセスもまとめて終了できるようにする
+            kwargs = {"start_new_session": True}
+        self._process = await asyncio.create_subprocess_exec(
+            *_shell_command(),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.cwd,
+            **kwargs
+        )
+        self.starts += 1
+        if is_windows():
+            await self._send("[Console]::OutputEncoding = [Text.Encoding]::UTF8; $OutputEncoding = [Text.Encoding]::UTF8\n")
+
+    async def _send(self, script: str) -> None:
+        self._process.stdin.write(script.encode("utf-8"))
+        await self._process.stdin.drain()
+
+    async def run(self, command: str, timeout: Optional[float] = None,
+                  output_limit: int = 1048576) -> CommandResult:
+        """コマンドを実行して終了を待つ
+
+        Args:
+            command: 実行するコマンド
+            timeout: タイムアウト（秒）。None または0以下の場合は無制限。超えた場合はシェルごと終了します
+            output_limit: 標準出力・標準エラーそれぞれの最大取得バイト数
+
+        Returns:
+            実行結果
+        """
+        async with self.lock:
+            start = time.monotonic()
+            if not self.is_alive():
+                await self._start()
+            self._counter += 1
+            marker = f"__AGENT_DONE_{self._token}_{self._counter}__"
+            wrap = _wrap_powershell if is_windows() else _wrap_posix
+            try:
+                await self._send(wrap(command, marker))
+            except (BrokenPipeError, ConnectionResetError):
+                # 前のコマンドの後でシェルが終了していた場合は起動し直して1回だけ送り直す
+                await self.close()
+                await self._start()
+                await self._send(wrap(command, marker))
+
+            process = self._process
+            stdout = _MarkerScanner(marker.encode("ascii"), output_limit)
+            stderr = _MarkerScanner(marker.encode("ascii"), output_limit)
+            readers = asyncio.gather(_scan(process.stdout, stdout), _scan(process.stderr, stderr))
+            timed_out = False
+            finished = False
+            try:
+                finished = all(await asyncio.wait_for(
+                    asyncio.shield(readers), timeout if timeout and timeout > 0 else None
+                ))
+            except asyncio.TimeoutError:
+                timed_out = True
+            except asyncio.CancelledError:
+                # 実行中のコマンドの状態がわからないため、シェルごと終了する
+                readers.cancel()
+                readers.add_done_callback(lambda f: f.cancelled() or f.exception())
+                await self.close()
+                raise
+
+            if finished:
+                returncode: Optional[int] = int(stdout.status or b"0")
+            else:
+                # タイムアウトした、または区切り文字を出力する前にシェルが終了した
+                if timed_out:
+                    readers.cancel()
+                    readers.add_done_callback(lambda f: f.cancelled() or f.exception())
+                await self.close()
+                returncode = process.returncode
+            return CommandResult(
+                returncode=returncode,
+                stdout=stdout.text(),
+                stderr=stderr.text(),
+                stdout_bytes=stdout.total,
+                stderr_bytes=stderr.total,
+                truncated=stdout.total > len(stdout.buffer) or stderr.total > len(stderr.buffer),
+                timed_out=timed_out,
+                duration=time.monotonic() - start,
+                shell_exited=not finished and not timed_out
+            )
+
+    async def close(self) -> None:
+        """シェルを終了（次の run() で起動し直します）"""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except (OSError, RuntimeError):
+            pass
+        _kill_process_tree(process)
+        await process.wait()
+
+class ShellSessionPool:
+    """キーごとのシェルセッションを保持するクラス
+
+    最大数を超えた場合は、コマンドを実行していないセッションのうち最後に使われた日時が
+    最も古いものを終了します（すべて実行中の場合は一時的に最大数を超えて作成します）。
+    """
+
+    def __init__(self, max_sessions: int = 4):
+        """初期化
+
+        Args:
+            max_sessions: 同時に保持するセッションの最大数
+        """
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, ShellSession]" = OrderedDict()
+
+    async def get(self, key: str, cwd: Optional[Union[str, Path]] = None) -> ShellSession:
+        """キーに対応するセッションを取得（ない場合は作成します）
+
+        Args:
+            key: セッションのキー
+            cwd: 新しく作成する場合にシェルを起動するディレクトリ
+
+        Returns:
+            シェルセッション
+        """
+        session = self._sessions.get(key)
+        if session is None:
+            while len(self._sessions) >= self.max_sessions:
+                idle = next((k for k, s in self._sessions.items() if not s.lock.locked()), None)
+                if idle is None:
+                    break
+                await self._sessions.pop(idle).close()
+            session = ShellSession(cwd)
+            self._sessions[key] = session
+        self._sessions.move_to_end(key)
+        return session
+
+    async def close(self, key: str) -> None:
+        """キーに対応するセッションを終了"""
+        session = self._sessions.pop(key, None)
+        if session is not None:
+            await session.close()
+
+    async def close_all(self) -> None:
+        """すべてのセッションを終了"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+# プール（最初に使用したときに作成）
+_pool: Optional[ShellSessionPool] = None
+
+def get_pool() -> ShellSessionPool:
+    """シェルセッションのプールを取得
+
+    Returns:
+        SHELL_POOL_SIZE を最大数とするプール
+    """
+    global _pool
+    if _pool is None:
+        _pool = ShellSessionPool(settings.get_shell_pool_size())
+    return _pool
+
+async def run_command(command: str, key: str, cwd: Optional[Union[str, Path]] = None,
+                      timeout: Optional[float] = None, output_limit: int = 1048576) -> CommandResult:
+    """キーに対応するシェルセッションでコマンドを実行
+
+    Args:
+        command: 実行するコマンド
+        key: セッションのキー
+        cwd: 新しくシェルを起動する場合のディレクトリ
+        timeout: タイムアウト（秒）。None または0以下の場合は無制限
+        output_limit: 標準出力・標準エラーそれぞれの最大取得バイト数
+
+    Returns:
+        実行結果
+    """
+    session = await get_pool().get(key, cwd)
+    return await session.run(command, timeout=timeout, output_limit=output_limit)
+
+async def close_session(key: str) -> None:
+    """キーに対応するシェルセッションを終了（プールを作成していない場合は何もしません）"""
+    if _pool is not None:
+        await _pool.close(key)
+
+async def close_all() -> None:
+    """すべてのシェルセッションを終了（プールを作成していない場合は何もしません）"""
+    if _pool is not None:
+        await _pool.close_all()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+シンボルインデックス
+
+このモジュールは、ワークスペースの .py ファイルを ast で解析したシンボルインデックスを提供します。
+
+定義（クラス・関数・メソッド・モジュール直下の変数）、import、呼び出し箇所を行番号付きで
+.agent_cache/symbol_index.json に記録し、更新日時とサイズが変わったファイルだけを解析し直します。
+解析するファイルが多い場合はプロセスプールで並列に解析します。
+"""
+
+import ast
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from utils.patcher import atomic_write
+from utils.workspace_index import INDEX_DIR_NAME, list_directory
+
+INDEX_FILE_NAME = "symbol_index.json"
+INDEX_VERSION = 1
+# 解析するファイル数がこれ未満の場合はプロセスプールを使わずにその場で解析する
+_PARALLEL_MIN_FILES = 50
+# 1つのタスクで解析するファイル数の下限
+_MIN_CHUNK_FILES = 8
+
+@dataclass
+class Definition:
+    """シンボルの定義"""
+    path: str
+    # クラス内の定義は "Class.method" のように外側の名前を付ける
+    qualname: str
+    # class / function / method / variable
+    kind: str
+    start_line: int
+    end_line: int
+
+@dataclass
+class Reference:
+    """シンボルの呼び出し・import の箇所"""
+    path: str
+    line: int
+    # call（呼び出し）/ import
+    kind: str
+
+class _SymbolVisitor(ast.NodeVisitor):
+    """定義・import・呼び出し箇所を集める"""
+    
+    def __init__(self):
+        self.definitions: List[list] = []
+        self.imports: List[list] = []
+        # 呼び出す名前 -> 行番号のリスト
+        self.calls: Dict[str, List[int]] = {}
+        self._scope: List[Tuple[str, bool]] = []
+
+    def _define(self, node, kind: str):
+        qualname = ".".join([name for name, _ in self._scope] + [node.name])
+        # デコレーターも定義の行に含める
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        self.definitions.append([qualname, kind, start, getattr(node, "end_lineno", node.lineno)])
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self._define(node, "class")
+        self._scope.append((node.name, True))
+        self.generic_visit(node)
+        self._scope.pop()
+
+    def visit_FunctionDef(self, node):
+        in_class = bool(self._scope) and self._scope[-1][1]
+        self._define(node, "method" if in_class else "function")
+        self._scope.append((node.name, False))
+        self.generic_visit(node)
+        self._scope.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Assign(self, node: ast.Assign):
+        if not self._scope:
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    self.definitions.append([target.id, "variable", node.lineno, getattr(node, "end_lineno", node.lineno)])
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign):
+        if not self._scope and isinstance(node.target, ast.Name):
+            self.definitions.append([node.target.id, "variable", node.lineno, getattr(node, "end_lineno", node.lineno)])
+        self.generic_visit(node)
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self.imports.append([alias.name, "", alias.asname or "", node.lineno])
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        module = "." * node.level + (node.module or "")
+        for alias in node.names:
+            self.imports.append([module, alias.name, alias.asname or "", node.lineno])
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        if isinstance(func, ast.Name):
+            self.calls.setdefault(func.id, []).append(node.lineno)
+        elif isinstance(func, ast.Attribute):
+            self.calls.setdefault(func.attr, []).append(node.lineno)
+        self.generic_visit(node)
+
+def _parse_file(path: str) -> Optional[Dict[str, Any]]:
+    """1ファイルを解析（読み取れない場合はNone、構文エラーの場合は空の記録）"""
+    try:
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            source = f.read()
+    except OSError:
+        return None
+    record = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "definitions": [], "imports": [], "calls": {}}
+    try:
+        tree = ast.parse(source, filename=path)
+    except (SyntaxError, ValueError):
+        # 解析できないファイルも記録し、変更されるまで解析し直さない
+        record["error"] = True
+        return record
+    visitor = _SymbolVisitor()
+    visitor.visit(tree)
+    record["definitions"] = visitor.definitions
+    record["imports"] = visitor.imports
+    record["calls"] = visitor.calls
+    return record
+
+def _parse_files(paths: List[str]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """ファイルのまとまりを解析（プロセスプールで実行）"""
+    return [(path, _parse_file(path)) for path in paths]
+
+class SymbolIndex:
+    """シンボルインデックスクラス
+    
+    パスはルートからの "/" 区切りの相対パスで扱います。
+    """
+
+    def __init__(self, root: Union[str, Path], workers: int = 1, use_index: bool = True):
+        """インデックスの初期化（保存済みのインデックスがあれば読み込み）
+        
+        Args:
+            root: ルートディレクトリ
+            workers: 解析に使うプロセス数
+            use_index: 対象ファイルをワークスペースインデックスから取り出すかどうか
+        """
+        self.root = os.path.realpath(root)
+        self.index_path = os.path.join(self.root, INDEX_DIR_NAME, INDEX_FILE_NAME)
+        self.workers = max(1, workers)
+        self.use_index = use_index
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.parsed = 0
+        self._load()
+
+    @property
+    def file_count(self) -> int:
+        """インデックスに含まれるファイル数"""
+        return len(self._files)
+
+    def refresh(self) -> int:
+        """追加・変更されたファイルを解析し、削除されたファイルを除去
+        
+        Returns:
+            解析したファイル数
+        """
+        _, files = list_directory(self.root, recursive=True, use_index=self.use_index, root=self.root)
+        current = {f.replace(os.sep, "/") for f in files if f.endswith(".py")}
+        changed = False
+        for rel in list(self._files):
+            if rel not in current:
+                del self._files[rel]
+                changed = True
+
+        stale = []
+        for rel in sorted(current):
+            record = self._files.get(rel)
+            try:
+                stat = os.stat(os.path.join(self.root, rel))
+            except OSError:
+                continue
+            if record is None or record["mtime_ns"] != stat.st_mtime_ns or record["size"] != stat.st_size:
+                stale.append(rel)
+
+        for rel, record in self._parse(stale):
+            if record is None:
+                self._files.pop(rel, None)
+            else:
+                self._files[rel] = record
+            changed = True
+        self.parsed += len(stale)
+        if changed:
+            self._save()
+        return len(stale)
+
+    def _parse(self, rels: List[str]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        paths = [os.path.join(self.root, rel) for rel in rels]
+        if len(paths) < _PARALLEL_MIN_FILES or self.workers <= 1:
+            parsed = _parse_files(paths)
+        else:
+            # 初回の構築など、解析するファイルが多いときだけプロセスを起動する
+            chunk_size = max(_MIN_CHUNK_FILES, -(-len(paths) // (self.workers * 4)))
+            chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+            parsed = []
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                for result in pool.map(_parse_files, chunks):
+                    parsed.extend(result)
+        return [(rel, record) for rel, (_, record) in zip(rels, parsed)]
+
+    def find_definitions(self, name: str) -> List[Definition]:
+        """名前に一致する定義を検索
+        
+        "Class.method" のような修飾名、または末尾の名前（"method"）で指定できます。
+        修飾名が完全に一致するものを先に返します。
+        
+        Args:
+            name: シンボル名
+            
+        Returns:
+            一致した定義のリスト
+        """
+        with self._lock:
+            self.refresh()
+            exact, partial = [], []
+            for rel, record in sorted(self._files.items()):
+                for qualname, kind, start, end in record["definitions"]:
+                    if qualname == name:
+                        exact.append(Definition(rel, qualname, kind, start, end))
+                    elif qualname.endswith("." + name):
+                        partial.append(Definition(rel, qualname, kind, start, end))
+            return exact + partial
+
+    def find_references(self, name: str) -> List[Reference]:
+        """名前の呼び出し箇所と import を検索
+        
+        Args:
+            name: シンボル名（修飾名の場合は末尾の名前で検索）
+            
+        Returns:
+            呼び出し・import の箇所のリスト
+        """
+        short = name.rsplit(".", 1)[-1]
+        with self._lock:
+            self.refresh()
+            references = []
+            for rel, record in sorted(self._files.items()):
+                for module, imported, alias, line in record["imports"]:
+                    if short in (imported, alias) or (not imported and module.rsplit(".", 1)[-1] == short):
+                        references.append(Reference(rel, line, "import"))
+                for line in record["calls"].get(short, ()):
+                    references.append(Reference(rel, line, "call"))
+            return sorted(references, key=lambda r: (r.path, r.line))
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION and data.get("root") == self.root:
+            self._files = data.get("files", {})
+
+    def _save(self):
+        data = {"version": INDEX_VERSION, "root": self.root, "files": self._files}
+        try:
+            atomic_write(self.index_path, json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        except OSError:
+            # 保存できなくてもメモリ上のインデックスは使用可能
+            pass
+
+_indexes: Dict[str, SymbolIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_symbol_index(workers: int = 1, use_index: bool = True,
+                     root: Optional[Union[str, Path]] = None) -> SymbolIndex:
+    """シンボルインデックスを取得
+    
+    Args:
+        workers: 解析に使うプロセス数
+        use_index: 対象ファイルをワークスペースインデックスから取り出すかどうか
+        root: ルートディレクトリ（省略時は作業ディレクトリ）
+        
+    Returns:
+        ルートディレクトリごとにプロセス内で共有するシンボルインデックス
+    """
+    root = os.path.realpath(root or os.getcwd())
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = SymbolIndex(root, workers=workers, use_index=use_index)
+        return index
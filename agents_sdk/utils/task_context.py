@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+タスクの実行コンテキスト
+
+バッチモードでは1つのプロセスで複数のタスクを並行して実行するため、作業ディレクトリと
+ログの出力先をプロセス全体（os.chdir など）ではなく contextvars でタスクごとに保持します。
+asyncio のタスクは作成時のコンテキストを引き継ぐので、Runner.run から呼ばれるツールにも伝わります。
+スレッドプール（run_in_executor）にはコンテキストが引き継がれないため、必要な値は引数で渡してください。
+"""
+
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+@dataclass
+class TaskContext:
+    """実行中のタスクの情報"""
+    task_id: str
+    # 相対パスの基準とコマンドを実行するディレクトリ
+    workdir: Path
+    # タスクのログの出力先（None の場合は日付ごとのログファイル）
+    log_path: Optional[Path] = None
+    # 承認が必要なコマンドを確認せずに実行するかどうか（標準入力が使えないため）
+    auto_approve: bool = False
+
+_current: "contextvars.ContextVar[Optional[TaskContext]]" = contextvars.ContextVar("task_context", default=None)
+
+def current_task() -> Optional[TaskContext]:
+    """実行中のタスクを取得
+
+    Returns:
+        実行中のタスク。対話モードの場合は None
+    """
+    return _current.get()
+
+@contextmanager
+def task_scope(context: TaskContext) -> Iterator[TaskContext]:
+    """ブロックの中をタスクのコンテキストで実行
+
+    Args:
+        context: タスクの情報
+    """
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+def get_workdir() -> Path:
+    """作業ディレクトリを取得
+
+    Returns:
+        実行中のタスクの作業ディレクトリ。対話モードの場合はカレントディレクトリ
+    """
+    context = _current.get()
+    return context.workdir if context is not None else Path.cwd()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+トークン使用量の集計
+
+RunHooks で LLM の呼び出しごとのトークン使用量（入力・出力・プロンプトキャッシュに一致した
+入力トークン）をログに記録し、ツールの種類ごとに集計します。ツールの種類ごとの値は、
+そのツールを呼び出した応答の出力トークン（1つの応答で複数のツールを呼び出した場合は等分）と、
+ツールの結果の文字数です。
+
+セッション（Runner.run の1回の実行）のトークン数の上限を超えると TokenBudgetExceeded を送出して
+実行を打ち切ります。
+"""
+
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+from agents import RunHooks, RunContextWrapper
+
+# 絶対インポートに変更
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from log_manager import logger
+
+class TokenBudgetExceeded(Exception):
+    """セッションのトークン数の上限を超えたことを示す例外"""
+
+    def __init__(self, total_tokens: int, token_budget: int):
+        super().__init__(f"トークン数の上限（{token_budget}）に達しました（使用量: {total_tokens}）")
+        self.total_tokens = total_tokens
+        self.token_budget = token_budget
+
+def usage_to_dict(usage: Any) -> Optional[Dict[str, int]]:
+    """SDK の Usage を辞書に変換
+
+    Args:
+        usage: Usage（None の場合は None を返します）
+
+    Returns:
+        requests / input_tokens / cached_tokens / output_tokens / total_tokens の辞書
+    """
+    if usage is None:
+        return None
+    # 古いバージョンの SDK には input_tokens_details がない
+    details = getattr(usage, "input_tokens_details", None)
+    return {
+        "requests": getattr(usage, "requests", 0) or 0,
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) or 0
+    }
+
+def _called_tools(response: Any) -> List[str]:
+    """モデルの応答で呼び出したツールの名前（出現順）"""
+    return [
+        getattr(item, "name", "")
+        for item in getattr(response, "output", None) or []
+        if getattr(item, "type", None) == "function_call"
+    ]
+
+class UsageHooks(RunHooks):
+    """トークン使用量を記録し、セッションの上限を判定するフック
+
+    Runner.run の hooks に指定します。集計は実行ごとに行うため、並行して実行する場合は
+    実行ごとにインスタンスを作成してください。
+    """
+
+    def __init__(self, token_budget: int = 0):
+        """初期化
+
+        Args:
+            token_budget: セッションのトークン数の上限（0 の場合は無制限）
+        """
+        self.token_budget = token_budget
+        self.turns = 0
+        self.tools: Dict[str, Dict[str, float]] = {}
+        self._usage: Any = None
+
+    def _tool(self, name: str) -> Dict[str, float]:
+        return self.tools.setdefault(name, {"calls": 0, "output_tokens": 0.0, "result_chars": 0})
+
+    def _check_budget(self, context: RunContextWrapper[Any]) -> None:
+        self._usage = context.usage
+        total = getattr(context.usage, "total_tokens", 0) or 0
+        if self.token_budget > 0 and total >= self.token_budget:
+            raise TokenBudgetExceeded(total, self.token_budget)
+
+    async def on_llm_end(self, context: RunContextWrapper[Any], agent: Any, response: Any) -> None:
+        """LLM の呼び出しごとの使用量を記録（この処理がない古いバージョンの SDK では呼ばれません）"""
+        self.turns += 1
+        usage = usage_to_dict(getattr(response, "usage", None)) or {}
+        tool_names = _called_tools(response)
+        if tool_names:
+            share = usage.get("output_tokens", 0) / len(tool_names)
+            for name in tool_names:
+                self._tool(name)["output_tokens"] += share
+        logger.log_event("usage", {
+            "turn": self.turns,
+            "input_tokens": usage.get("input_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "tools": tool_names,
+            "session_total_tokens": getattr(context.usage, "total_tokens", 0)
+        })
+        self._check_budget(context)
+
+    async def on_tool_end(self, context: RunContextWrapper[Any], agent: Any, tool: Any, result: str) -> None:
+        """ツールの呼び出し回数と結果の文字数を記録"""
+        stats = self._tool(getattr(tool, "name", str(tool)))
+        stats["calls"] += 1
+        stats["result_chars"] += len(str(result))
+        self._check_budget(context)
+
+    def summary(self, usage: Any = None) -> Dict[str, Any]:
+        """セッション全体の集計
+
+        Args:
+            usage: 実行結果の Usage（省略時は最後にフックで受け取った値）
+
+        Returns:
+            トークン使用量とツールの種類ごとの集計
+        """
+        totals = usage_to_dict(usage if usage is not None else self._usage) or {
+            "requests": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "total_tokens": 0
+        }
+        return dict(totals, **{
+            "token_budget": self.token_budget,
+            "budget_exceeded": self.token_budget > 0 and totals["total_tokens"] >= self.token_budget,
+            "tools": {
+                name: {
+                    "calls": int(stats["calls"]),
+                    "output_tokens": round(stats["output_tokens"]),
+                    "result_chars": int(stats["result_chars"])
+                }
+                for name, stats in sorted(self.tools.items())
+            }
+        })
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ワークスペースインデックス
+
+このモジュールは、作業ディレクトリ以下のファイル一覧をディスクに保存し、
+更新日時が変わったディレクトリだけを読み直して差分更新するインデックスを提供します。
+
+ディレクトリごとに更新日時（st_mtime_ns）とその中のファイル・サブディレクトリの名前を
+.agent_cache/workspace_index.json に記録します。.gitignore（各ディレクトリのもの）に
+一致するファイル・ディレクトリと、.git、node_modules、.agent_cache は含めません。
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Pattern, Tuple, Union
+
+from utils.patcher import atomic_write
+
+# インデックスを保存するディレクトリ（作業ディレクトリからの相対パス）
+INDEX_DIR_NAME = ".agent_cache"
+INDEX_FILE_NAME = "workspace_index.json"
+INDEX_VERSION = 1
+# .gitignore の内容にかかわらず常に除外するディレクトリ
+ALWAYS_EXCLUDED = frozenset({".git", "node_modules", INDEX_DIR_NAME})
+# 更新日時がこの時間（ナノ秒）以内のディレクトリは、同じ時刻内に再び変更される
+# 可能性があるため、次回も読み直す
+_RACY_MTIME_NS = 2 * 1000 * 1000 * 1000
+
+@dataclass
+class _IgnoreRule:
+    """.gitignore の規則"""
+    pattern: Pattern
+    negated: bool
+    dir_only: bool
+    # "/" を含むパターンは .gitignore のあるディレクトリからの相対パスと、
+    # 含まないパターンは名前と照合する
+    anchored: bool
+
+@dataclass
+class _DirEntry:
+    """ディレクトリ1つ分のエントリ"""
+    mtime_ns: int
+    # このディレクトリの .gitignore の更新日時（無い場合は 0）
+    ignore_mtime_ns: int
+    files: List[str] = field(default_factory=list)
+    dirs: List[str] = field(default_factory=list)
+
+def _translate(pattern: str) -> str:
+    """gitignore のパターンを正規表現に変換"""
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end + 1
+                continue
+        elif c == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+def parse_gitignore(text: str) -> List[_IgnoreRule]:
+    """.gitignore の内容を規則のリストに変換
+    
+    Args:
+        text: .gitignore の内容
+        
+    Returns:
+        規則のリスト
+    """
+    rules = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        stripped = line.rstrip(" ")
+        if stripped.endswith("\\") and len(stripped) < len(line):
+            stripped += " "
+        line = stripped
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        elif line.startswith(("\\!", "\\#")):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        anchored = "/" in line
+        line = line.lstrip("/")
+        rules.append(_IgnoreRule(re.compile(_translate(line)), negated, dir_only, anchored))
+    return rules
+
+class WorkspaceIndex:
+    """ワークスペースインデックスクラス
+    
+    パスはすべてルートからの "/" 区切りの相対パスで扱います（ルート自身は ""）。
+    """
+
+    def __init__(self, root: Union[str, Path]):
+        """インデックスの初期化（保存済みのインデックスがあれば読み込み）
+        
+        Args:
+            root: ルートディレクトリ
+        """
+        self.root = os.path.realpath(root)
+        self.index_path = os.path.join(self.root, INDEX_DIR_NAME, INDEX_FILE_NAME)
+        self._dirs: Dict[str, _DirEntry] = {}
+        # ディレクトリ -> (.gitignore の更新日時, 規則)
+        self._rules: Dict[str, Tuple[int, List[_IgnoreRule]]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.rescanned = 0
+        self._load()
+
+    def list(self, rel: str, recursive: bool) -> Optional[Tuple[List[str], List[str]]]:
+        """インデックスを更新してからディレクトリの内容を取得
+        
+        Args:
+            rel: ルートからの相対パス
+            recursive: サブディレクトリ以下も含めるかどうか
+            
+        Returns:
+            rel からの相対パスの (ディレクトリ, ファイル)。
+            rel がインデックスの対象外（除外されている、存在しない）の場合はNone
+        """
+        with self._lock:
+            self._refresh(rel, recursive)
+            if self._dirty:
+                self._save()
+            if rel not in self._dirs:
+                return None
+
+            dirs, files = [], []
+            stack = [rel]
+            while stack:
+                current = stack.pop()
+                entry = self._dirs.get(current)
+                if entry is None:
+                    continue
+                prefix = current[len(rel):].lstrip("/")
+                prefix = prefix + "/" if prefix else ""
+                files.extend(prefix + name for name in entry.files)
+                dirs.extend(prefix + name for name in entry.dirs)
+                if recursive:
+                    stack.extend(_join(current, name) for name in entry.dirs)
+            return sorted(dirs), sorted(files)
+
+    def _refresh(self, rel: str, recursive: bool):
+        """rel 以下で更新日時が変わったディレクトリだけを読み直し"""
+        if rel and not self._is_indexed_parent(rel):
+            self._drop(rel)
+            return
+        now_ns = time.time_ns()
+        stack = [rel]
+        while stack:
+            current = stack.pop()
+            try:
+                stat = os.stat(os.path.join(self.root, current))
+            except OSError:
+                self._drop(current)
+                continue
+            entry = self._dirs.get(current)
+            ignore_mtime_ns = entry.ignore_mtime_ns if entry is not None else 0
+            if entry is None or entry.mtime_ns != stat.st_mtime_ns or ignore_mtime_ns:
+                ignore_mtime_ns = self._ignore_mtime(current)
+            if entry is None or entry.mtime_ns != stat.st_mtime_ns or entry.ignore_mtime_ns != ignore_mtime_ns:
+                rules_changed = entry is not None and entry.ignore_mtime_ns != ignore_mtime_ns
+                old_dirs = set(entry.dirs) if entry is not None else set()
+                entry = self._scan(current, stat.st_mtime_ns, ignore_mtime_ns, now_ns)
+                # 削除されたサブディレクトリと、規則が変わった場合はすべてのサブディレクトリを読み直す
+                for name in (old_dirs if rules_changed else old_dirs - set(entry.dirs)):
+                    self._drop(_join(current, name))
+            if recursive:
+                stack.extend(_join(current, name) for name in entry.dirs)
+
+    def _is_indexed_parent(self, rel: str) -> bool:
+        """rel の親ディレクトリをたどり、rel がインデックスの対象かどうかを確認"""
+        parent, _, name = rel.rpartition("/")
+        if parent and not self._is_indexed_parent(parent):
+            return False
+        self._refresh(parent, recursive=False)
+        entry = self._dirs.get(parent)
+        return entry is not None and name in entry.dirs
+
+    def _scan(self, rel: str, mtime_ns: int, ignore_mtime_ns: int, now_ns: int) -> _DirEntry:
+        chain = self._rule_chain(rel)
+        files, dirs = [], []
+        with os.scandir(os.path.join(self.root, rel)) as it:
+            for item in it:
+                is_dir = item.is_dir(follow_symlinks=False)
+                if is_dir and item.name in ALWAYS_EXCLUDED:
+                    continue
+                if chain and _is_ignored(chain, _join(rel, item.name), item.name, is_dir):
+                    continue
+                (dirs if is_dir else files).append(item.name)
+
+        if now_ns - mtime_ns < _RACY_MTIME_NS:
+            mtime_ns = -1
+        entry = _DirEntry(mtime_ns, ignore_mtime_ns, sorted(files), sorted(dirs))
+        if self._dirs.get(rel) != entry:
+            self._dirs[rel] = entry
+            self._dirty = True
+        self.rescanned += 1
+        return entry
+
+    def _ignore_mtime(self, rel: str) -> int:
+        try:
+            return os.stat(os.path.join(self.root, rel, ".gitignore")).st_mtime_ns
+        except OSError:
+            return 0
+
+    def _rule_chain(self, rel: str) -> List[Tuple[str, List[_IgnoreRule]]]:
+        """rel とその親ディレクトリの .gitignore の規則をルートに近い順に取得"""
+        chain = []
+        parts = rel.split("/") if rel else []
+        for depth in range(len(parts) + 1):
+            base = "/".join(parts[:depth])
+            rules = self._load_rules(base)
+            if rules:
+                chain.append((base, rules))
+        return chain
+
+    def _load_rules(self, rel: str) -> List[_IgnoreRule]:
+        mtime_ns = self._ignore_mtime(rel)
+        cached = self._rules.get(rel)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        rules = []
+        if mtime_ns:
+            try:
+                with open(os.path.join(self.root, rel, ".gitignore"), "r", encoding="utf-8", errors="replace") as f:
+                    rules = parse_gitignore(f.read())
+            except OSError:
+                rules = []
+        self._rules[rel] = (mtime_ns, rules)
+        return rules
+
+    def _drop(self, rel: str):
+        """rel 以下のエントリをインデックスから削除"""
+        entry = self._dirs.pop(rel, None)
+        if entry is None:
+            return
+        self._dirty = True
+        for name in entry.dirs:
+            self._drop(_join(rel, name))
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != INDEX_VERSION or data.get("root") != self.root:
+            return
+        self._dirs = {
+            rel: _DirEntry(values[0], values[1], values[2], values[3])
+            for rel, values in data.get("dirs", {}).items()
+        }
+
+    def _save(self):
+        data = {
+            "version": INDEX_VERSION,
+            "root": self.root,
+            "dirs": {
+                rel: [e.mtime_ns, e.ignore_mtime_ns, e.files, e.dirs]
+                for rel, e in self._dirs.items()
+            }
+        }
+        try:
+            atomic_write(self.index_path, json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+            self._dirty = False
+        except OSError:
+            # 保存できなくてもメモリ上のインデックスは使用可能
+            pass
+
+def _join(rel: str, name: str) -> str:
+    return f"{rel}/{name}" if rel else name
+
+def _is_ignored(chain: List[Tuple[str, List[_IgnoreRule]]], rel: str, name: str, is_dir: bool) -> bool:
+    """.gitignore の規則を順に照合（後に一致した規則が優先）"""
+    ignored = False
+    for base, rules in chain:
+        path = rel[len(base) + 1:] if base else rel
+        for rule in rules:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.pattern.fullmatch(path if rule.anchored else name):
+                ignored = not rule.negated
+    return ignored
+
+_indexes: Dict[str, WorkspaceIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_index(root: Optional[Union[str, Path]] = None) -> WorkspaceIndex:
+    """インデックスを取得
+    
+    Args:
+        root: ルートディレクトリ（省略時は作業ディレクトリ）
+        
+    Returns:
+        ルートディレクトリごとに共有するインデックス
+    """
+    root = os.path.realpath(root or os.getcwd())
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = WorkspaceIndex(root)
+        return index
+
+def list_directory(path: Union[str, Path], recursive: bool, use_index: bool = True,
+                   root: Optional[Union[str, Path]] = None) -> Tuple[List[str], List[str]]:
+    """ディレクトリの内容を取得
+    
+    作業ディレクトリ以下のパスはインデックスから返します。作業ディレクトリの外のパスや、
+    .gitignore で除外されたディレクトリを指定した場合は直接走査します。
+    
+    Args:
+        path: ディレクトリのパス
+        recursive: サブディレクトリ以下も含めるかどうか
+        use_index: インデックスを使用するかどうか
+        root: インデックスのルートディレクトリ（省略時は作業ディレクトリ）
+        
+    Returns:
+        path からの相対パスの (ディレクトリ, ファイル)
+    """
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"ディレクトリが見つかりません: {path}")
+
+    if use_index:
+        index = get_index(root)
+        target = os.path.realpath(path)
+        if target == index.root or target.startswith(index.root + os.sep):
+            rel = os.path.relpath(target, index.root).replace(os.sep, "/")
+            result = index.list("" if rel == "." else rel, recursive)
+            if result is not None:
+                return _to_native(result)
+    return _walk(path, recursive)
+
+def _to_native(result: Tuple[List[str], List[str]]) -> Tuple[List[str], List[str]]:
+    if os.sep == "/":
+        return result
+    dirs, files = result
+    return [d.replace("/", os.sep) for d in dirs], [f.replace("/", os.sep) for f in files]
+
+def _walk(path: Union[str, Path], recursive: bool) -> Tuple[List[str], List[str]]:
+    """インデックスを使わずに走査（常に除外するディレクトリには入らない）"""
+    dirs, files = [], []
+    for current, subdirs, names in os.walk(path):
+        subdirs[:] = sorted(d for d in subdirs if d not in ALWAYS_EXCLUDED)
+        prefix = os.path.relpath(current, path)
+        prefix = "" if prefix == "." else prefix
+        dirs.extend(os.path.join(prefix, d) for d in subdirs)
+        files.extend(os.path.join(prefix, n) for n in names)
+        if not recursive:
+            break
+    return sorted(dirs), sorted(files)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+エージェントを計測付きで起動する（bench_agent.py が子プロセスとして実行します）
+
+対象（python / agents_sdk）の main を読み込み、LLM の呼び出し・ツールの実行・
+ツール呼び出しの解析を行う関数を計測用の関数で包んでから実行します。
+終了時にターンごとの計測結果を JSON ファイルに書き出します。
+
+ターンは LLM へのリクエストの開始から次のリクエストの開始（最後のターンは終了）までです。
+    wall  : ターン全体の経過時間
+    model : LLM の呼び出しにかかった時間（解析と同じスレッドで実行したツールの時間を除く）
+    tool  : ツールの実行時間の合計（並行して実行したツールはそれぞれの時間を合計）
+    parse : ツール呼び出しの解析時間の合計
+    rss_mb: ターン終了時のメモリ使用量（取得できる環境のみ）
+
+使用例:
+    python benchmarks/agent_probe.py python metrics.json
+"""
+
+import argparse
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def current_rss_mb() -> Optional[float]:
+    """現在のメモリ使用量（MB）。取得できない環境では None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss_mb() -> Optional[float]:
+    """プロセスの最大メモリ使用量（MB）。取得できない環境では None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class Recorder:
+    """ターンごとの計測結果を記録する"""
+
+    def __init__(self, trace_memory: bool = False):
+        self.started = time.perf_counter()
+        self.trace_memory = trace_memory
+        self.turns: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        # 同じスレッドで入れ子になった計測の時間を外側から差し引くためのスタック
+        self._local = threading.local()
+        if trace_memory:
+            tracemalloc.start()
+
+    def begin_turn(self):
+        now = time.perf_counter()
+        with self._lock:
+            if self.turns:
+                self._close(self.turns[-1], now)
+            self.turns.append({"start": now, "model": 0.0, "tool": 0.0, "parse": 0.0, "tool_calls": 0})
+
+    def add(self, kind: str, seconds: float):
+        with self._lock:
+            if self.turns:
+                self.turns[-1][kind] += seconds
+                if kind == "tool":
+                    self.turns[-1]["tool_calls"] += 1
+
+    def _close(self, turn: Dict[str, Any], now: float):
+        turn["wall"] = now - turn["start"]
+        turn["rss_mb"] = current_rss_mb()
+        if self.trace_memory:
+            turn["py_peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+
+    def timed(self, kind: str, func: Callable, begin_turn: bool = False) -> Callable:
+        """同期関数を計測する関数で包む"""
+        recorder = self
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if begin_turn:
+                recorder.begin_turn()
+            stack = recorder._local.__dict__.setdefault("stack", [])
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = stack.pop()
+                recorder.add(kind, elapsed - nested)
+                if stack:
+                    stack[-1] += elapsed
+        return wrapper
+
+    def timed_async(self, kind: str, func: Callable, begin_turn: bool = False) -> Callable:
+        """コルーチン関数を計測する関数で包む（他のコルーチンと交互に実行されるため入れ子は考慮しない）"""
+        recorder = self
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if begin_turn:
+                recorder.begin_turn()
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                recorder.add(kind, time.perf_counter() - start)
+        return wrapper
+
+    def finish(self) -> Dict[str, Any]:
+        now = time.perf_counter()
+        with self._lock:
+            startup = None
+            if self.turns:
+                startup = self.turns[0]["start"] - self.started
+                self._close(self.turns[-1], now)
+            for turn in self.turns:
+                # 起動からの経過時間にする
+                turn["start"] -= self.started
+            return {
+                "startup": startup,
+                "elapsed": now - self.started,
+                "peak_rss_mb": peak_rss_mb(),
+                "turns": self.turns
+            }
+
+def instrument_python(recorder: Recorder) -> Callable[[], Any]:
+    """python/ 版を計測できるようにして main 関数を返す"""
+    sys.path.insert(0, os.path.join(ROOT, "python"))
+    import main
+    import parser
+
+    main.request_completion = recorder.timed("model", main.request_completion, begin_turn=True)
+    main.stream_completion = recorder.timed("model", main.stream_completion, begin_turn=True)
+    main.extract_tool_calls = recorder.timed("parse", main.extract_tool_calls)
+    parser.ToolCallParser.feed = recorder.timed("parse", parser.ToolCallParser.feed)
+    parser.execute_tool = recorder.timed("tool", parser.execute_tool)
+    # プローブ自身のコマンドライン引数を main に渡さない
+    return functools.partial(main.main, [])
+
+def instrument_agents_sdk(recorder: Recorder) -> Callable[[], Any]:
+    """agents_sdk/ 版を計測できるようにして main 関数を返す"""
+    sys.path.insert(0, os.path.join(ROOT, "agents_sdk"))
+    import main
+    from agents.models.openai_responses import OpenAIResponsesModel
+    from tools import file_tools, command_tools, interaction_tools, search_tools
+
+    OpenAIResponsesModel.get_response = recorder.timed_async(
+        "model", OpenAIResponsesModel.get_response, begin_turn=True
+    )
+    # レスポンスからツール呼び出しを取り出す処理（SDK の内部 API のため、見つからない場合は計測しない）
+    try:
+        from agents._run_impl import RunImpl
+        process = RunImpl.process_model_response.__func__
+        RunImpl.process_model_response = classmethod(recorder.timed("parse", process))
+    except (ImportError, AttributeError):
+        pass
+    try:
+        # 新しいバージョンの SDK ではモジュールの関数になっている
+        from agents.run_internal import turn_resolution
+        turn_resolution.process_model_response = recorder.timed("parse", turn_resolution.process_model_response)
+    except (ImportError, AttributeError):
+        pass
+
+    for module in (file_tools, command_tools, interaction_tools, search_tools):
+        for value in vars(module).values():
+            if hasattr(value, "on_invoke_tool"):
+                value.on_invoke_tool = recorder.timed_async("tool", value.on_invoke_tool)
+    # プローブ自身のコマンドライン引数を main に渡さない
+    return functools.partial(main.main, [])
+
+TARGETS = {
+    "python": instrument_python,
+    "agents_sdk": instrument_agents_sdk,
+}
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="エージェントを計測付きで起動する")
+    arg_parser.add_argument("target", choices=sorted(TARGETS), help="計測するエージェント")
+    arg_parser.add_argument("output", help="計測結果を書き出す JSON ファイル")
+    arg_parser.add_argument("--trace-memory", action="store_true", help="tracemalloc で Python のメモリ使用量の最大値も記録する")
+    args = arg_parser.parse_args(argv)
+
+    recorder = Recorder(trace_memory=args.trace_memory)
+    run = TARGETS[args.target](recorder)
+    error = None
+    try:
+        run()
+    except BaseException as e:
+        error = f"{type(e).__name__}: {str(e)}"
+    result = recorder.finish()
+    result["error"] = error
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
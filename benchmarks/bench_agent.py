@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+エージェントのループのベンチマーク
+
+モック LLM サーバー（mock_llm_server.py）を起動し、python/ 版と agents_sdk/ 版の
+エージェントをシナリオ（リポジトリの調査・ファイルの書き込み・コマンドの実行）ごとに
+子プロセスで実行します。各エージェントは agent_probe.py で計測され、ターンごとの
+経過時間・LLM の呼び出し時間・ツールの実行時間・解析時間・メモリ使用量を表示します。
+OpenAI の API は呼び出しません。
+
+使用例:
+    python benchmarks/bench_agent.py
+    python benchmarks/bench_agent.py --target python --scenario explore --repeat 5 --verbose
+    python benchmarks/bench_agent.py --latency 0.2 --json results.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_llm_server import DEFAULT_SCENARIOS, MockLLMServer  # noqa: E402
+
+PROBE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent_probe.py")
+TARGETS = ("python", "agents_sdk")
+
+def build_workspace(path: str, modules: int = 30, large_lines: int = 20000):
+    """シナリオが前提とするファイルを含むワークスペースを作成する"""
+    pkg = os.path.join(path, "pkg")
+    os.makedirs(pkg)
+    os.makedirs(os.path.join(path, "data"))
+    with open(os.path.join(pkg, "__init__.py"), "w", encoding="utf-8") as f:
+        f.write("")
+    with open(os.path.join(pkg, "core.py"), "w", encoding="utf-8") as f:
+        f.write(
+            '"""処理の基底クラス"""\n\n\n'
+            "class Processor:\n"
+            "    def __init__(self, name):\n"
+            "        self.name = name\n\n"
+            "    def run(self, data):\n"
+            "        raise NotImplementedError\n"
+        )
+    for i in range(modules):
+        with open(os.path.join(pkg, f"module_{i:02d}.py"), "w", encoding="utf-8") as f:
+            f.write(
+                f'"""モジュール {i}"""\n\n'
+                "from pkg.core import Processor\n\n\n"
+                f"def compute_{i}(value):\n"
+                f"    return value * {i}\n\n\n"
+                f"def helper_{i}(items):\n"
+                f"    return [compute_{i}(item) for item in items]\n\n\n"
+                f"class Worker{i}(Processor):\n"
+                "    def run(self, data):\n"
+                f"        return helper_{i}(data)\n"
+            )
+    with open(os.path.join(path, "data", "large.txt"), "w", encoding="utf-8") as f:
+        f.writelines(f"{n:06d} サンプルデータの行です。値: {n * 7 % 1000}\n" for n in range(large_lines))
+    with open(os.path.join(path, "README.md"), "w", encoding="utf-8") as f:
+        f.write("# ベンチマーク用のワークスペース\n")
+
+def run_once(target: str, scenario: str, server: MockLLMServer, template: str,
+             args: argparse.Namespace) -> Dict[str, Any]:
+    """エージェントを1回実行して計測結果を返す"""
+    with tempfile.TemporaryDirectory(prefix="bench_agent_") as temp_dir:
+        workspace = os.path.join(temp_dir, "workspace")
+        shutil.copytree(template, workspace)
+        metrics_path = os.path.join(temp_dir, "metrics.json")
+        env = dict(
+            os.environ,
+            OPENAI_API_KEY="mock",
+            OPENAI_BASE_URL=server.base_url(scenario),
+            OPENAI_AGENTS_DISABLE_TRACING="1",
+            ENABLE_TRACING="false",
+            AGENT_STREAM="false" if args.no_stream else "true",
+            PYTHONIOENCODING="utf-8",
+        )
+        command = [sys.executable, PROBE, target, metrics_path]
+        if args.trace_memory:
+            command.append("--trace-memory")
+
+        start = time.perf_counter()
+        process = subprocess.run(
+            command, cwd=workspace, env=env, input="ベンチマーク\n" + "y\n" * 20,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8",
+            errors="replace", timeout=args.timeout,
+        )
+        process_time = time.perf_counter() - start
+        if not os.path.exists(metrics_path):
+            raise RuntimeError(
+                f"{target}/{scenario}: 計測結果がありません（終了コード {process.returncode}）\n"
+                f"{process.stdout[-2000:]}\n{process.stderr[-2000:]}"
+            )
+        with open(metrics_path, "r", encoding="utf-8") as f:
+            metrics = json.load(f)
+    metrics["process"] = process_time
+    metrics["returncode"] = process.returncode
+    return metrics
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """繰り返した実行の中央値"""
+    def median(values):
+        values = [v for v in values if v is not None]
+        return statistics.median(values) if values else None
+
+    def total(run, key):
+        return sum(turn[key] for turn in run["turns"])
+
+    return {
+        "turns": median([len(run["turns"]) for run in runs]),
+        "process": median([run["process"] for run in runs]),
+        "startup": median([run["startup"] for run in runs]),
+        "wall": median([total(run, "wall") for run in runs]),
+        "model": median([total(run, "model") for run in runs]),
+        "tool": median([total(run, "tool") for run in runs]),
+        "parse": median([total(run, "parse") for run in runs]),
+        "peak_rss_mb": median([run["peak_rss_mb"] for run in runs]),
+    }
+
+def _ms(value) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+def _mb(value) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+def print_turns(run: Dict[str, Any]):
+    print(f"    {'ターン':<6}{'経過(ms)':>10}{'LLM(ms)':>10}{'ツール(ms)':>12}{'解析(ms)':>10}{'ツール数':>8}{'RSS(MB)':>10}")
+    for index, turn in enumerate(run["turns"], 1):
+        print(f"    {index:<6}{_ms(turn['wall']):>10}{_ms(turn['model']):>10}{_ms(turn['tool']):>12}"
+              f"{_ms(turn['parse']):>10}{turn['tool_calls']:>8}{_mb(turn.get('rss_mb')):>10}")
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="エージェントのループのベンチマーク")
+    arg_parser.add_argument("--target", choices=TARGETS + ("all",), default="all", help="計測するエージェント")
+    arg_parser.add_argument("--scenario", choices=tuple(DEFAULT_SCENARIOS) + ("all",), default="all", help="シナリオ")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="繰り返し回数（中央値を表示）")
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="モックサーバーの応答の待ち時間（秒）")
+    arg_parser.add_argument("--chunk-delay", type=float, default=0.0, help="ストリーミングのチャンクの間隔（秒）")
+    arg_parser.add_argument("--no-stream", action="store_true", help="python/ 版をストリーミングなしで実行する")
+    arg_parser.add_argument("--trace-memory", action="store_true", help="tracemalloc で Python のメモリ使用量も記録する（遅くなります）")
+    arg_parser.add_argument("--timeout", type=float, default=300, help="1回の実行のタイムアウト（秒）")
+    arg_parser.add_argument("--verbose", action="store_true", help="ターンごとの計測結果も表示する")
+    arg_parser.add_argument("--json", help="すべての計測結果を書き出す JSON ファイル")
+    args = arg_parser.parse_args(argv)
+
+    targets = TARGETS if args.target == "all" else (args.target,)
+    scenarios = tuple(DEFAULT_SCENARIOS) if args.scenario == "all" else (args.scenario,)
+    server = MockLLMServer(latency=args.latency, chunk_delay=args.chunk_delay).start()
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench_workspace_") as template_root:
+            template = os.path.join(template_root, "workspace")
+            build_workspace(template)
+
+            print(f"繰り返し: {args.repeat}回（中央値）, 応答の待ち時間: {args.latency}秒\n")
+            print(f"{'対象':<12}{'シナリオ':<10}{'ターン':>6}{'プロセス(ms)':>14}{'起動(ms)':>10}{'ループ(ms)':>12}"
+                  f"{'LLM(ms)':>10}{'ツール(ms)':>12}{'解析(ms)':>10}{'最大RSS(MB)':>14}")
+            for target in targets:
+                for scenario in scenarios:
+                    try:
+                        runs = [run_once(target, scenario, server, template, args) for _ in range(args.repeat)]
+                    except (RuntimeError, subprocess.TimeoutExpired) as e:
+                        print(f"{target:<12}{scenario:<10} 失敗: {str(e)}")
+                        continue
+                    summary = summarize(runs)
+                    results[f"{target}/{scenario}"] = {"summary": summary, "runs": runs}
+                    print(f"{target:<12}{scenario:<10}{summary['turns']:>6g}{_ms(summary['process']):>14}"
+                          f"{_ms(summary['startup']):>10}{_ms(summary['wall']):>12}{_ms(summary['model']):>10}"
+                          f"{_ms(summary['tool']):>12}{_ms(summary['parse']):>10}{_mb(summary['peak_rss_mb']):>14}")
+                    errors = {run["error"] for run in runs if run.get("error")}
+                    for error in errors:
+                        print(f"    エラー: {error}")
+                    if args.verbose:
+                        print_turns(runs[-1])
+    finally:
+        server.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n計測結果: {args.json}")
+
+if __name__ == "__main__":
+    main()
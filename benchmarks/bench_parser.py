@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ツール呼び出しパーサーのベンチマーク
+
+python/parser.py の状態機械パーサー（ToolCallParser）と、置き換え前の
+正規表現 + ElementTree による実装を、100KB以上のレスポンスで比較します。
+
+使用例:
+    python benchmarks/bench_parser.py
+    python benchmarks/bench_parser.py --size 1000000 --repeat 10
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python"))
+
+from parser import ToolCallParser, extract_tool_calls  # noqa: E402
+
+def legacy_parse(response: str) -> Dict[str, Any]:
+    """置き換え前の実装（最初のツールを正規表現で探し、ElementTreeでパース）"""
+    match = re.search(r'<([a-z_]+)>([\s\S]*?)</\1>', response)
+    if not match:
+        return {}
+    tool_type = match.group(1)
+    try:
+        root = ET.fromstring(f"<{tool_type}>{match.group(2)}</{tool_type}>")
+    except Exception:
+        return {}
+    return {child.tag: child.text.strip() if child.text else "" for child in root}
+
+def make_code(size: int, xml_safe: bool) -> str:
+    """size 文字程度のソースコードを生成（xml_safe=False なら "<" や "&" を含む）"""
+    if xml_safe:
+        line = "    total = total + values[index] * 2  # accumulate\n"
+    else:
+        line = "    if a < b && items.get<int>(i) > 0: total += 1  # <generic>\n"
+    return line * (size // len(line) + 1)
+
+def make_scenarios(size: int) -> Dict[str, str]:
+    """ベンチマークに使用するレスポンスを生成"""
+    prose = "ここでは <b>HTML</b> 風のタグや a<b の比較式を説明します。\n" * (size // 40)
+    return {
+        "write_file (XML安全なコード)": (
+            "<write_file>\n<path>big.py</path>\n<content>\n"
+            + make_code(size, True) + "</content>\n</write_file>"
+        ),
+        "write_file (< & を含むコード)": (
+            "<write_file>\n<path>big.py</path>\n<content>\n"
+            + make_code(size, False) + "</content>\n</write_file>"
+        ),
+        "タグを多く含む説明文 + read_file": (
+            prose + "<read_file>\n<path>main.py</path>\n</read_file>"
+        ),
+    }
+
+def best_of(func: Callable[[], Any], repeat: int) -> float:
+    """repeat 回実行した中で最も短い実行時間（秒）を返す"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def feed_in_chunks(response: str, chunk_size: int) -> List[Any]:
+    """ストリーミングを想定してチャンク単位でパーサーに入力する"""
+    parser = ToolCallParser()
+    calls = []
+    for index in range(0, len(response), chunk_size):
+        calls.extend(parser.feed(response[index:index + chunk_size]))
+    return calls
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="ツール呼び出しパーサーのベンチマーク")
+    arg_parser.add_argument("--size", type=int, default=200_000, help="レスポンスの大きさ（文字数）")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数")
+    arg_parser.add_argument("--chunk", type=int, default=16, help="ストリーミング時のチャンクの大きさ（文字数）")
+    args = arg_parser.parse_args(argv)
+
+    print(f"レスポンスの大きさ: 約{args.size // 1000}KB, 繰り返し: {args.repeat}回\n")
+    print(f"{'シナリオ':<36}{'従来(ms)':>10}{'新(ms)':>10}{'新/ストリーム(ms)':>20}{'従来の結果':>12}")
+    for name, response in make_scenarios(args.size).items():
+        legacy = best_of(lambda: legacy_parse(response), args.repeat)
+        new = best_of(lambda: extract_tool_calls(response), args.repeat)
+        stream = best_of(lambda: feed_in_chunks(response, args.chunk), args.repeat)
+        legacy_ok = "成功" if legacy_parse(response) else "失敗"
+        assert extract_tool_calls(response), name
+        print(f"{name:<36}{legacy * 1000:>10.2f}{new * 1000:>10.2f}{stream * 1000:>20.2f}{legacy_ok:>12}")
+
+if __name__ == "__main__":
+    main()
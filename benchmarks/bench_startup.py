@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+起動時間のベンチマーク
+
+python/ 版と agents_sdk/ 版の main モジュールを `python -X importtime` で読み込み、
+インポートにかかった時間（中央値）と時間のかかったパッケージを表示します。
+あわせて、エージェントを起動してからタスクの入力を求めるまでの時間も計測します。
+
+インポートの時間が上限（--budget で変更可能）を超えた場合は終了コード 1 で終了するため、
+CI やコミット前の確認で起動時間の劣化を検出できます。OpenAI の API は呼び出しません。
+
+使用例:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --target agents_sdk --repeat 10 --top 15
+    python benchmarks/bench_startup.py --budget python=200 --budget agents_sdk=300
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = ("python", "agents_sdk")
+
+# main モジュールのインポートにかける時間の上限（ミリ秒）
+DEFAULT_BUDGET_MS = {
+    "python": 250.0,
+    "agents_sdk": 300.0,
+}
+
+# タスクの入力を求めるときに表示する文字列
+PROMPT = "タスクを入力してください"
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$")
+
+def parse_importtime(stderr: str) -> Tuple[Optional[float], Dict[str, float]]:
+    """
+    -X importtime の出力を解析する
+
+    Returns:
+        main の累積時間（ミリ秒）と、トップレベルのパッケージごとの自己時間の合計（ミリ秒）
+    """
+    total = None
+    packages: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us) / 1000
+        if name == "main" and len(indent) == 1:
+            total = int(cumulative_us) / 1000
+    return total, dict(packages)
+
+def measure_import(target: str, env: Dict[str, str]) -> Tuple[float, Dict[str, float]]:
+    """main モジュールを1回インポートして時間を計測する"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.join(ROOT, target), env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        text=True, encoding="utf-8", errors="replace", timeout=120,
+    )
+    total, packages = parse_importtime(process.stderr)
+    if process.returncode != 0 or total is None:
+        raise RuntimeError(f"{target}: main をインポートできませんでした\n{process.stderr[-2000:]}")
+    return total, packages
+
+def measure_prompt(target: str, env: Dict[str, str]) -> float:
+    """エージェントを起動してからタスクの入力を求めるまでの時間（ミリ秒）を計測する"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "main.py"], cwd=os.path.join(ROOT, target), env=env,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    try:
+        output = b""
+        while True:
+            line = process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"{target}: 入力を求める前に終了しました\n{output.decode('utf-8', 'replace')[-2000:]}")
+            output += line
+            if PROMPT in line.decode("utf-8", "replace"):
+                return (time.perf_counter() - start) * 1000
+    finally:
+        process.kill()
+        process.wait()
+
+def parse_budgets(values: List[str]) -> Dict[str, float]:
+    budgets = dict(DEFAULT_BUDGET_MS)
+    for value in values:
+        target, _, ms = value.partition("=")
+        if target not in TARGETS or not ms:
+            raise SystemExit(f"--budget は <対象>=<ミリ秒> の形式で指定してください: {value}")
+        budgets[target] = float(ms)
+    return budgets
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="起動時間のベンチマーク")
+    arg_parser.add_argument("--target", choices=TARGETS + ("all",), default="all", help="計測するエージェント")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数（中央値を表示）")
+    arg_parser.add_argument("--top", type=int, default=8, help="表示する時間のかかったパッケージの数")
+    arg_parser.add_argument("--budget", action="append", default=[],
+                            help="インポートの時間の上限（例: python=250）。超えた場合は終了コード 1")
+    arg_parser.add_argument("--no-prompt", action="store_true", help="入力を求めるまでの時間を計測しない")
+    args = arg_parser.parse_args(argv)
+
+    budgets = parse_budgets(args.budget)
+    targets = TARGETS if args.target == "all" else (args.target,)
+    # OPENAI_API_KEY がないと入力を求める前に終了するため、ダミーの値を設定する（API は呼び出さない）
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY") or "mock",
+               PYTHONIOENCODING="utf-8", PYTHONUNBUFFERED="1")
+    # バイトコードのキャッシュを作成するため、計測の前に1回読み込む
+    for target in targets:
+        measure_import(target, env)
+
+    failed = []
+    print(f"繰り返し: {args.repeat}回（中央値）\n")
+    print(f"{'対象':<12}{'インポート(ms)':>16}{'上限(ms)':>10}{'入力まで(ms)':>16}")
+    details = {}
+    for target in targets:
+        totals = []
+        packages: Dict[str, List[float]] = defaultdict(list)
+        for _ in range(args.repeat):
+            total, run_packages = measure_import(target, env)
+            totals.append(total)
+            for name, ms in run_packages.items():
+                packages[name].append(ms)
+        prompt = None
+        if not args.no_prompt:
+            prompt = statistics.median(measure_prompt(target, env) for _ in range(args.repeat))
+
+        median = statistics.median(totals)
+        budget = budgets[target]
+        status = "" if median <= budget else "  上限超過"
+        if median > budget:
+            failed.append(target)
+        prompt_text = "-" if prompt is None else f"{prompt:.1f}"
+        print(f"{target:<12}{median:>16.1f}{budget:>10.0f}{prompt_text:>16}{status}")
+        details[target] = sorted(
+            ((statistics.median(values), name) for name, values in packages.items()), reverse=True
+        )[:args.top]
+
+    for target, top in details.items():
+        print(f"\n{target}: 時間のかかったパッケージ（自己時間の合計, ms）")
+        for ms, name in top:
+            print(f"    {name:<32}{ms:>8.1f}")
+
+    if failed:
+        print(f"\nインポートの時間が上限を超えました: {', '.join(failed)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+OpenAI API のモックサーバー
+
+Chat Completions（python/ 版、ストリーミングを含む）と Responses（agents_sdk/ 版）の
+エンドポイントを持ち、シナリオに書いたアシスタントの応答を順番に返します。
+API を呼び出さずにエージェントのループの性能を計測するために使用します。
+
+シナリオは URL のパスで選択します（OPENAI_BASE_URL=http://127.0.0.1:8765/<シナリオ名>/v1）。
+何ターン目の応答を返すかはリクエストの会話履歴から決めるため（Chat Completions は
+assistant メッセージの数、Responses は function_call の数）、サーバーはセッションの状態を持たず、
+複数のエージェントから同時に呼び出されても混ざりません。
+
+使用例:
+    python benchmarks/mock_llm_server.py --port 8765 --latency 0.5
+    python benchmarks/mock_llm_server.py --scenario-file scenarios.json
+    python benchmarks/mock_llm_server.py --rate-limit-every 3 --retry-after 0.5
+"""
+
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+# シナリオ: 名前 -> ターンのリスト。各ターンは同時に呼び出すツールのリスト（{"tool": 名前, "args": 引数}）
+# ツール名と引数は python/ 版と agents_sdk/ 版で共通のものだけを使う
+# （benchmarks/bench_agent.py が作成するワークスペースのファイルを前提にしている）
+DEFAULT_SCENARIOS: Dict[str, List[List[Dict[str, Any]]]] = {
+    # リポジトリの調査: 一覧・検索・定義の検索・範囲を指定した読み取り
+    "explore": [
+        [{"tool": "list_file", "args": {"path": ".", "recursive": "true"}}],
+        [
+            {"tool": "search", "args": {"pattern": "def compute_[0-9]+", "file_pattern": "*.py"}},
+            {"tool": "read_file", "args": {"path": "pkg/module_03.py"}},
+        ],
+        [{"tool": "find_definition", "args": {"name": "Processor.run"}}],
+        [{"tool": "read_file", "args": {"path": "data/large.txt", "start_line": 5000, "end_line": 5200}}],
+        [{"tool": "complete", "args": {"result": "リポジトリの構成を確認しました"}}],
+    ],
+    # ファイルの書き込みと部分編集
+    "write": [
+        [{"tool": "read_file", "args": {"path": "pkg/module_01.py"}}],
+        [{"tool": "write_file", "args": {
+            "path": "generated/big_module.py",
+            "content": "".join(f"def generated_{i}(value):\n    return value * {i} + 1\n\n" for i in range(1500)),
+        }}],
+        [{"tool": "write_file", "args": {
+            "path": "pkg/module_01.py",
+            "edit": "<<<<<<< SEARCH\n    return value * 1\n=======\n    return value * 1 + 0\n>>>>>>> REPLACE\n",
+        }}],
+        [{"tool": "complete", "args": {"result": "ファイルを作成・編集しました"}}],
+    ],
+    # コマンドの実行
+    "command": [
+        [{"tool": "execute_command", "args": {"command": "python -c \"print('hello')\"", "requires_approval": "false"}}],
+        [{"tool": "execute_command", "args": {"command": "python --version", "requires_approval": "false"}}],
+        [{"tool": "complete", "args": {"result": "コマンドを実行しました"}}],
+    ],
+}
+
+# シナリオを最後まで返した後の応答
+_FINAL_TEXT = "タスクは完了しています。"
+
+def render_xml(calls: List[Dict[str, Any]]) -> str:
+    """ツール呼び出しを python/ 版の XML 形式にする"""
+    blocks = []
+    for call in calls:
+        params = []
+        for name, value in call["args"].items():
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            params.append(f"<{name}>{value}</{name}>")
+        blocks.append(f"<{call['tool']}>\n" + "\n".join(params) + f"\n</{call['tool']}>")
+    return "\n".join(blocks)
+
+def _estimate_tokens(data: Any) -> int:
+    """使用量として返すトークン数の概算（4文字で1トークン）"""
+    text = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    return max(1, len(text) // 4)
+
+class MockLLMServer:
+    """
+    シナリオを返すモックサーバー
+
+    Args:
+        scenarios: シナリオ名 -> ターンのリスト
+        latency: 応答を返し始めるまでの待ち時間（秒）
+        chunk_size: ストリーミングで1つのチャンクに含める文字数
+        chunk_delay: ストリーミングのチャンクの間隔（秒）
+        rate_limit_every: N 回に1回のリクエストに 429 を返す（0 の場合は返さない）
+        retry_after: 429 の Retry-After ヘッダーの秒数
+        host: 待ち受けるアドレス
+        port: 待ち受けるポート（0 の場合は空いているポート）
+    """
+
+    def __init__(self, scenarios: Optional[Dict[str, List[List[Dict[str, Any]]]]] = None,
+                 latency: float = 0.0, chunk_size: int = 20, chunk_delay: float = 0.0,
+                 rate_limit_every: int = 0, retry_after: float = 1.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.scenarios = scenarios if scenarios is not None else DEFAULT_SCENARIOS
+        self.latency = latency
+        self.chunk_size = max(1, chunk_size)
+        self.chunk_delay = chunk_delay
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def base_url(self, scenario: str) -> str:
+        """シナリオを選択する OPENAI_BASE_URL を返す"""
+        host = self._httpd.server_address[0]
+        return f"http://{host}:{self.port}/{scenario}/v1"
+
+    def start(self) -> "MockLLMServer":
+        """バックグラウンドのスレッドで待ち受けを開始する"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _next_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}_{next(self._ids)}"
+
+    def _chat_turn(self, scenario: List[List[Dict[str, Any]]], body: Dict[str, Any]) -> str:
+        turn = sum(1 for m in body.get("messages", []) if m.get("role") == "assistant")
+        if turn < len(scenario):
+            return render_xml(scenario[turn])
+        return render_xml([{"tool": "complete", "args": {"result": _FINAL_TEXT}}])
+
+    def _responses_turn(self, scenario: List[List[Dict[str, Any]]], body: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        items = body.get("input")
+        calls = sum(1 for i in items if isinstance(i, dict) and i.get("type") == "function_call") if isinstance(items, list) else 0
+        # これまでに返した function_call の数からターンを求める
+        for turn in scenario:
+            if calls <= 0:
+                return turn
+            calls -= len(turn)
+        return None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", "0"))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._send_json(400, {"error": {"message": "invalid JSON"}})
+
+                parts = self.path.strip("/").split("/")
+                name, endpoint = (parts[0], "/".join(parts[1:])) if len(parts) > 2 else ("", "/".join(parts))
+                scenario = server.scenarios.get(name) if name else next(iter(server.scenarios.values()), [])
+                if scenario is None:
+                    return self._send_json(404, {"error": {"message": f"unknown scenario: {name}"}})
+
+                with server._lock:
+                    server.request_count += 1
+                    rate_limited = server.rate_limit_every > 0 and server.request_count % server.rate_limit_every == 0
+                    if rate_limited:
+                        server.rate_limited_count += 1
+                if rate_limited:
+                    return self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                           {"Retry-After": f"{server.retry_after:g}"})
+                if server.latency > 0:
+                    time.sleep(server.latency)
+                if endpoint == "v1/chat/completions":
+                    self._chat(scenario, body)
+                elif endpoint == "v1/responses":
+                    self._responses(scenario, body)
+                else:
+                    self._send_json(404, {"error": {"message": f"unknown endpoint: {self.path}"}})
+
+            def _chat(self, scenario, body):
+                text = server._chat_turn(scenario, body)
+                model = body.get("model", "mock")
+                usage = {
+                    "prompt_tokens": _estimate_tokens(body.get("messages", [])),
+                    "completion_tokens": _estimate_tokens(text),
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                response_id = server._next_id("chatcmpl")
+                created = int(time.time())
+                if not body.get("stream"):
+                    return self._send_json(200, {
+                        "id": response_id, "object": "chat.completion", "created": created, "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": usage,
+                    })
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def chunk(delta, finish_reason=None, **extra):
+                    data = {
+                        "id": response_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                    }
+                    data.update(extra)
+                    self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                try:
+                    chunk({"role": "assistant", "content": ""})
+                    for index in range(0, len(text), server.chunk_size):
+                        if server.chunk_delay > 0:
+                            time.sleep(server.chunk_delay)
+                        chunk({"content": text[index:index + server.chunk_size]})
+                    chunk({}, "stop")
+                    if (body.get("stream_options") or {}).get("include_usage"):
+                        chunk(None, usage=usage)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # クライアントが complete を受け取って受信を打ち切った
+                    pass
+
+            def _responses(self, scenario, body):
+                if body.get("stream"):
+                    return self._send_json(400, {"error": {"message": "streaming is not supported for /responses"}})
+                turn = server._responses_turn(scenario, body)
+                if turn is None:
+                    output = [{
+                        "type": "message", "id": server._next_id("msg"), "role": "assistant", "status": "completed",
+                        "content": [{"type": "output_text", "text": _FINAL_TEXT, "annotations": []}],
+                    }]
+                else:
+                    output = [{
+                        "type": "function_call", "id": server._next_id("fc"), "call_id": server._next_id("call"),
+                        "name": call["tool"], "arguments": json.dumps(call["args"], ensure_ascii=False), "status": "completed",
+                    } for call in turn]
+                input_tokens = _estimate_tokens(body.get("input", ""))
+                output_tokens = _estimate_tokens(output)
+                self._send_json(200, {
+                    "id": server._next_id("resp"), "object": "response", "created_at": int(time.time()),
+                    "model": body.get("model", "mock"), "status": "completed", "output": output,
+                    "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+                    "error": None, "incomplete_details": None, "instructions": None, "metadata": {},
+                    "text": {"format": {"type": "text"}}, "truncation": "disabled",
+                    "usage": {
+                        "input_tokens": input_tokens, "input_tokens_details": {"cached_tokens": 0},
+                        "output_tokens": output_tokens, "output_tokens_details": {"reasoning_tokens": 0},
+                        "total_tokens": input_tokens + output_tokens,
+                    },
+                })
+
+            def _send_json(self, status: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+def load_scenarios(path: str) -> Dict[str, List[List[Dict[str, Any]]]]:
+    """シナリオを JSON ファイルから読み込む（形式は DEFAULT_SCENARIOS と同じ）"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="OpenAI API のモックサーバー")
+    arg_parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス")
+    arg_parser.add_argument("--port", type=int, default=8765, help="待ち受けるポート")
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="応答を返し始めるまでの待ち時間（秒）")
+    arg_parser.add_argument("--chunk-size", type=int, default=20, help="ストリーミングのチャンクの文字数")
+    arg_parser.add_argument("--chunk-delay", type=float, default=0.0, help="ストリーミングのチャンクの間隔（秒）")
+    arg_parser.add_argument("--rate-limit-every", type=int, default=0, help="N 回に1回のリクエストに 429 を返す")
+    arg_parser.add_argument("--retry-after", type=float, default=1.0, help="429 の Retry-After ヘッダーの秒数")
+    arg_parser.add_argument("--scenario-file", help="シナリオの JSON ファイル（省略時は組み込みのシナリオ）")
+    args = arg_parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenario_file) if args.scenario_file else None
+    server = MockLLMServer(scenarios, latency=args.latency, chunk_size=args.chunk_size,
+                           chunk_delay=args.chunk_delay, rate_limit_every=args.rate_limit_every,
+                           retry_after=args.retry_after, host=args.host, port=args.port)
+    print("シナリオ:")
+    for name in server.scenarios:
+        print(f"  {name}: OPENAI_BASE_URL={server.base_url(name)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+大きなツール結果の保存（アーティファクト）
+
+ツールの結果が上限（AGENT_ARTIFACT_THRESHOLD バイト）を超える場合は、全体をディスクに保存し、
+会話履歴には先頭と末尾のプレビュー・全体の大きさ・アーティファクトの ID だけを追加する。
+全体は ReadArtifact ツールで行またはバイトの範囲を指定して読み取る。
+
+アーティファクトはセッションごとのディレクトリ（.agent_cache/artifacts/<セッションID>/）に保存し、
+合計が AGENT_ARTIFACT_MAX_BYTES を超えた場合は古いセッションのディレクトリから削除する。
+"""
+
+import os
+import re
+import shutil
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from session_context import current_session
+
+DEFAULT_ARTIFACT_DIR = os.path.join(".agent_cache", "artifacts")
+# これより大きいツールの結果をアーティファクトに保存する（バイト。0 の場合は保存しない）
+DEFAULT_THRESHOLD = 16 * 1024
+# プレビューに含める先頭と末尾のそれぞれのバイト数
+DEFAULT_PREVIEW_BYTES = 2 * 1024
+# すべてのセッションのアーティファクトの合計の上限（バイト）
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# アーティファクトの ID（<ツールの種類>-<通し番号>）
+_ARTIFACT_ID_PATTERN = re.compile(r"^[a-z_]+-\d+$")
+
+@dataclass
+class Artifact:
+    artifact_id: str
+    path: str
+    total_bytes: int
+    total_lines: int
+
+def _head(data: bytes, limit: int) -> bytes:
+    """先頭 limit バイトまでを返す（途中に改行があれば最後の改行まで）"""
+    if len(data) <= limit:
+        return data
+    piece = data[:limit]
+    newline = piece.rfind(b"\n")
+    return piece[:newline + 1] if newline > 0 else piece
+
+def _tail(data: bytes, limit: int) -> bytes:
+    """末尾 limit バイトまでを返す（途中に改行があれば最初の改行の次から）"""
+    if len(data) <= limit:
+        return data
+    piece = data[-limit:]
+    newline = piece.find(b"\n")
+    return piece[newline + 1:] if 0 <= newline < len(piece) - 1 else piece
+
+class ArtifactStore:
+    """
+    セッションのアーティファクトを保存し、ID からファイルを引く
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        directory: str = DEFAULT_ARTIFACT_DIR,
+        threshold: int = DEFAULT_THRESHOLD,
+        preview_bytes: int = DEFAULT_PREVIEW_BYTES,
+        max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.directory = directory
+        self.session_dir = os.path.join(directory, session_id)
+        self.threshold = threshold
+        self.preview_bytes = preview_bytes
+        self.max_bytes = max_bytes
+        self._counter = self._last_number()
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.stored_bytes = 0
+
+    def _last_number(self) -> int:
+        """再開したセッションで保存済みのアーティファクトの最大の通し番号（ID を重複させないため）"""
+        if not os.path.isdir(self.session_dir):
+            return 0
+        numbers = [
+            int(name[:-4].rsplit("-", 1)[1])
+            for name in os.listdir(self.session_dir)
+            if name.endswith(".txt") and _ARTIFACT_ID_PATTERN.match(name[:-4])
+        ]
+        return max(numbers, default=0)
+
+    @classmethod
+    def from_env(cls, session_id: str) -> "ArtifactStore":
+        """環境変数から設定を読み込んで生成する"""
+        return cls(
+            session_id,
+            directory=os.getenv("AGENT_ARTIFACT_DIR", DEFAULT_ARTIFACT_DIR),
+            threshold=int(os.getenv("AGENT_ARTIFACT_THRESHOLD", str(DEFAULT_THRESHOLD))),
+            preview_bytes=int(os.getenv("AGENT_ARTIFACT_PREVIEW_BYTES", str(DEFAULT_PREVIEW_BYTES))),
+            max_bytes=int(os.getenv("AGENT_ARTIFACT_MAX_BYTES", str(DEFAULT_MAX_BYTES)))
+        )
+
+    def save(self, tool_type: str, data: bytes) -> Artifact:
+        """
+        ツールの結果をアーティファクトとして保存する
+
+        Args:
+            tool_type: ツールの種類（ID の接頭辞になる）
+            data: 保存する内容（UTF-8）
+
+        Returns:
+            Artifact: 保存したアーティファクト
+        """
+        with self._lock:
+            self._counter += 1
+            artifact_id = f"{tool_type}-{self._counter}"
+        os.makedirs(self.session_dir, exist_ok=True)
+        path = os.path.join(self.session_dir, f"{artifact_id}.txt")
+        # ID ごとに別のファイルで上書きしないため、一時ファイルを経由せずに書き込む
+        with open(path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            self.stored += 1
+            self.stored_bytes += len(data)
+        total_lines = data.count(b"\n") + (0 if data.endswith(b"\n") else 1)
+        return Artifact(artifact_id, path, len(data), total_lines)
+
+    def offload(self, tool_type: str, text: str) -> Tuple[str, Optional[Artifact]]:
+        """
+        上限を超える結果をアーティファクトに保存し、プレビューに置き換える
+
+        Args:
+            tool_type: ツールの種類
+            text: ツールの結果
+
+        Returns:
+            Tuple[str, Optional[Artifact]]: 会話履歴に追加する文字列と、保存したアーティファクト
+            （上限以下の場合は元の文字列と None）
+        """
+        # 1文字は UTF-8 で最大4バイトなので、明らかに小さい結果はエンコードせずに返す
+        if self.threshold <= 0 or len(text) * 4 <= self.threshold:
+            return text, None
+        data = text.encode("utf-8")
+        if len(data) <= self.threshold:
+            return text, None
+
+        artifact = self.save(tool_type, data)
+        head = _head(data, self.preview_bytes).decode("utf-8", errors="ignore")
+        tail = _tail(data, self.preview_bytes).decode("utf-8", errors="ignore")
+        preview = (
+            f"[結果が大きいため、アーティファクト {artifact.artifact_id} に保存しました"
+            f"（全{artifact.total_bytes}バイト、{artifact.total_lines}行）]\n"
+            f"--- 先頭 ---\n{head}\n"
+            f"--- 末尾 ---\n{tail}\n"
+            f"[全体は ReadArtifact で ID {artifact.artifact_id} と行またはバイトの範囲を指定して読み取ってください]"
+        )
+        return preview, artifact
+
+    def path(self, artifact_id: str) -> Optional[str]:
+        """
+        ID からアーティファクトのファイルを引く
+
+        Returns:
+            Optional[str]: ファイルのパス（不正な ID や存在しない場合は None）
+        """
+        artifact_id = artifact_id.strip()
+        if not _ARTIFACT_ID_PATTERN.match(artifact_id):
+            return None
+        path = os.path.join(self.session_dir, f"{artifact_id}.txt")
+        return path if os.path.isfile(path) else None
+
+    def prune(self) -> int:
+        """
+        合計が上限を超える場合に、古いセッションのディレクトリから削除する（現在のセッションは残す）
+
+        Returns:
+            int: 削除したディレクトリの数
+        """
+        if self.max_bytes <= 0 or not os.path.isdir(self.directory):
+            return 0
+        sessions: List[Tuple[float, int, str]] = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or os.path.abspath(entry.path) == os.path.abspath(self.session_dir):
+                continue
+            size = 0
+            for file in os.scandir(entry.path):
+                if file.is_file():
+                    size += file.stat().st_size
+            sessions.append((entry.stat().st_mtime, size, entry.path))
+            total += size
+        removed = 0
+        for _, size, path in sorted(sessions):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        return {"stored": self.stored, "stored_bytes": self.stored_bytes, "threshold": self.threshold}
+
+# 現在のセッションのアーティファクト（open_store を呼び出すまでは保存しない）
+_store: Optional[ArtifactStore] = None
+
+def create_store(session_id: str) -> ArtifactStore:
+    """
+    セッションのアーティファクトの保存先を作成し、古いセッションのアーティファクトを整理する
+
+    Args:
+        session_id: セッションID（ディレクトリ名になる）
+    """
+    store = ArtifactStore.from_env(session_id)
+    store.prune()
+    return store
+
+def open_store(session_id: str) -> ArtifactStore:
+    """プロセスの保存先としてセッションの保存先を開く（1つのプロセスで1つのセッションを実行する main.py 用）"""
+    global _store
+    _store = create_store(session_id)
+    return _store
+
+def get_store() -> Optional[ArtifactStore]:
+    """実行中のセッションの保存先（session_scope の外では open_store で開いた保存先）"""
+    context = current_session()
+    return context.artifacts if context is not None else _store
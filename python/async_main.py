@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+AI Coding Agent（asyncio 版）
+
+main.py と同じエージェントのループを AsyncOpenAI で実行する。
+
+- API クライアントはプロセスで1つだけ作成し、明示的に設定した HTTP のコネクションプール
+  （キープアライブ・h2 パッケージがあれば HTTP/2）を共有する。1つのプロセスで複数のセッションを
+  実行してもコネクションを使い回す
+- ログの書き込み・ツールの結果のトークン数の計算・チェックポイントの記録はイベントループの外の
+  1つのスレッドで順番に行い、次のリクエストの送信と重ねる（書き込む順番は main.py と同じ）
+- ツールはスレッドで実行し、ストリームの受信を止めない
+- リクエストは scheduler.request_scheduler の待ち行列をセッションIDごとに公平に通して送信する
+- アーティファクトの保存先とシェルセッションは session_context でセッションごとに分ける
+- 1ターンの処理（圧縮・上限の確認・キャッシュ・使用量・会話履歴への追加）は main.py の関数を共有する
+
+使い方:
+    python async_main.py
+    python async_main.py --resume <セッションID>
+"""
+
+import os
+import asyncio
+import importlib.util
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+import checkpoint
+import artifact_store
+import tracer
+from tracer import span
+from context_manager import ContextManager
+from scheduler import request_scheduler, RetryLimitExceeded
+from request_log import RequestDeltaRecorder
+from response_cache import ResponseCache, ResponseCacheMiss
+from session_context import SessionContext, session_scope
+from usage import UsageTracker, usage_to_dict
+from parser import ToolCallParser, ToolExecutor, extract_tool_calls
+from main import (
+    MODEL_NAME, REQUEST_PARAMS, STREAM_RESPONSES, SYSTEM_PROMPT,
+    log_to_file, preload_module, parse_args, load_checkpoint, open_checkpoint, written_paths, report_session,
+    shutdown, reserved_tokens, used_tokens, compact_context, exceeds_budget, reached_budget, record_request,
+    lookup_response, record_usage, append_turn, record_turn_results, end_checkpoint
+)
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# HTTP のコネクションプールの設定
+HTTP_MAX_CONNECTIONS = int(os.getenv("AGENT_HTTP_MAX_CONNECTIONS", "64"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("AGENT_HTTP_MAX_KEEPALIVE", "16"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("AGENT_HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("AGENT_HTTP_TIMEOUT", "600"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("AGENT_HTTP_CONNECT_TIMEOUT", "5"))
+# HTTP/2 を使用するかどうか（h2 パッケージがない場合は HTTP/1.1）
+HTTP2_ENABLED = os.getenv("AGENT_HTTP2", "true").lower() == "true"
+
+# プロセスで共有する API クライアント
+_client: Optional["AsyncOpenAI"] = None
+
+def http2_available() -> bool:
+    """HTTP/2 を使用できるかどうか（httpx の HTTP/2 対応には h2 パッケージが必要）"""
+    return HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+def create_client(api_key: str) -> "AsyncOpenAI":
+    """
+    コネクションプールを設定した AsyncOpenAI クライアントを作成する（openai はここで初めて読み込む）
+
+    Args:
+        api_key: OpenAI APIキー
+
+    Returns:
+        AsyncOpenAI: API クライアント（close() で HTTP クライアントも閉じる）
+    """
+    import httpx
+    from openai import AsyncOpenAI
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        http2=http2_available()
+    )
+    # 送り直しはスケジューラーで行うため、クライアントの組み込みの再試行は無効にする
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+def get_client(api_key: str) -> "AsyncOpenAI":
+    """プロセスで共有する API クライアントを取得する（最初に呼び出したときに作成する）"""
+    global _client
+    if _client is None:
+        _client = create_client(api_key)
+    return _client
+
+async def close_client():
+    """共有している API クライアントとコネクションプールを閉じる"""
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.close()
+
+class BackgroundWriter:
+    """
+    ログやチェックポイントの書き込みを1つのスレッドで順番に実行する
+
+    submit() は待たずに戻るため、書き込みと次のリクエストの送信が重なる。
+    1つのスレッドで実行するため、ログの行は submit() を呼び出した順に書き込まれる。
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent-writer")
+        self._last: Optional[Future] = None
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> Future:
+        self._last = self._executor.submit(func, *args)
+        return self._last
+
+    def log(self, log_type: str, data: Any) -> Future:
+        return self.submit(log_to_file, log_type, data)
+
+    async def drain(self):
+        """それまでに submit() した処理の終了を待つ"""
+        if self._last is not None:
+            await asyncio.wrap_future(self._last)
+
+    async def close(self):
+        await self.drain()
+        self._executor.shutdown(wait=True)
+
+async def submit_tool(executor: ToolExecutor, call):
+    """ツールの実行を開始する（副作用のあるツールはその場で実行されるため、スレッドで待つ）"""
+    await asyncio.to_thread(executor.submit, call)
+
+async def request_completion(
+    client: "AsyncOpenAI",
+    messages: List[Dict[str, str]],
+    session_id: str,
+    prompt_tokens: int = 0
+) -> Tuple[str, Optional[Dict[str, int]]]:
+    """LLMにリクエストを送信してレスポンス全体を受け取る"""
+    reserved = reserved_tokens(prompt_tokens)
+    with span("llm.request", "llm"):
+        response = await request_scheduler.call_async(
+            lambda: client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=messages,
+                **REQUEST_PARAMS
+            ),
+            key=session_id,
+            tokens=reserved
+        )
+    usage = usage_to_dict(response.usage)
+    request_scheduler.settle(reserved, used_tokens(usage))
+    return response.choices[0].message.content or "", usage
+
+async def stream_completion(
+    client: "AsyncOpenAI",
+    messages: List[Dict[str, str]],
+    executor: ToolExecutor,
+    session_id: str,
+    prompt_tokens: int = 0
+) -> Tuple[str, Optional[Dict[str, int]]]:
+    """
+    レスポンスをチャンク単位で受信し、ツールの閉じタグが届くたびにそのツールを
+    executor に渡す。complete ツールが届いた時点で受信を打ち切る（main.stream_completion と同じ）
+
+    Returns:
+        Tuple[str, Optional[Dict[str, int]]]: 受信したレスポンスとトークン使用量
+    """
+    start = time.perf_counter_ns()
+    # 送り直すのはストリームを開始するまで
+    reserved = reserved_tokens(prompt_tokens)
+    stream = await request_scheduler.call_async(
+        lambda: client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **REQUEST_PARAMS
+        ),
+        key=session_id,
+        tokens=reserved
+    )
+    parser = ToolCallParser()
+    first_chunk = True
+    usage = None
+    try:
+        async for chunk in stream:
+            if chunk.usage:
+                usage = usage_to_dict(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_chunk:
+                tracer.record("llm.first_chunk", "llm", start)
+                first_chunk = False
+            with span("parse.feed", "parse"):
+                calls = parser.feed(delta)
+            for call in calls:
+                await submit_tool(executor, call)
+
+            label = parser.tool_type or "応答"
+            print(f"\r[生成中] {label} {parser.length}文字", end="", flush=True)
+
+            if executor.completed:
+                break
+    finally:
+        await stream.close()
+        print()
+        tracer.record("llm.stream", "llm", start, {"chars": parser.length})
+    request_scheduler.settle(reserved, used_tokens(usage))
+
+    text = parser.text
+    return (text[:parser.end] if executor.completed else text), usage
+
+async def run_session(
+    client: Optional["AsyncOpenAI"],
+    user_task: str,
+    response_cache: Optional[ResponseCache] = None,
+    restored: Optional[checkpoint.Checkpoint] = None
+) -> bool:
+    """
+    1つのセッションを実行する
+
+    Args:
+        client: API クライアント（replay モードでは None）
+        user_task: ユーザーのタスク
+        response_cache: レスポンスのキャッシュ
+        restored: 再開するセッションのチェックポイント
+
+    Returns:
+        bool: Complete でタスクが完了した場合は True
+    """
+    if restored is None:
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_task}
+        ]
+    else:
+        messages = restored.messages
+
+    context = ContextManager.from_env(MODEL_NAME)
+    usage_tracker = UsageTracker.from_env()
+    if restored is not None and restored.usage:
+        usage_tracker.restore(restored.usage)
+    request_recorder = RequestDeltaRecorder(restored.session_id if restored else None)
+    if restored is not None:
+        request_recorder.resume(restored.turn)
+    print(f"セッションID: {request_recorder.session_id}\n")
+    session_id = request_recorder.session_id
+    checkpoint_writer = open_checkpoint(session_id, user_task, messages, restored)
+    # 同じプロセスの他のセッションと共有しないよう、保存先はセッションのコンテキストで渡す
+    artifacts = artifact_store.create_store(session_id)
+
+    writer = BackgroundWriter()
+    # 前のターンの結果の記録（次のターンの使用量を記録する前に終了を待つ）
+    pending: Optional[Future] = None
+
+    is_complete = False
+    try:
+        with session_scope(SessionContext(session_id, artifacts)):
+            while not is_complete:
+                # 予算を超えていれば古いツール結果を圧縮
+                report, prompt_tokens = compact_context(context, messages, writer.log)
+
+                # 送信するとセッションの上限を超える場合は終了
+                if exceeds_budget(usage_tracker, prompt_tokens):
+                    break
+
+                # リクエストデータ（前回からの差分）をログに記録
+                stable_prefix, prefix_broken = record_request(request_recorder, messages, report, writer.log)
+
+                # LLMにリクエストを送信してレスポンスを取得（前のターンの記録と並行して進む）
+                executor = ToolExecutor(defer_interactive=STREAM_RESPONSES)
+                response_usage = None
+                try:
+                    cache_key, assistant_response = lookup_response(response_cache, messages)
+                except ResponseCacheMiss as e:
+                    print(f"\n[cache] {str(e)}。replay モードのため終了します")
+                    break
+                cached = assistant_response is not None
+                if cached:
+                    with span("parse", "parse"):
+                        calls = extract_tool_calls(assistant_response)
+                    for call in calls:
+                        await submit_tool(executor, call)
+                else:
+                    try:
+                        if STREAM_RESPONSES:
+                            assistant_response, response_usage = await stream_completion(
+                                client, messages, executor, session_id, prompt_tokens
+                            )
+                        else:
+                            assistant_response, response_usage = await request_completion(
+                                client, messages, session_id, prompt_tokens
+                            )
+                    except RetryLimitExceeded as e:
+                        print(f"\n[scheduler] {str(e)}。終了します")
+                        writer.log("error", {"message": str(e), "attempts": e.attempts})
+                        break
+                    if not STREAM_RESPONSES:
+                        with span("parse", "parse"):
+                            calls = extract_tool_calls(assistant_response)
+                        for call in calls:
+                            await submit_tool(executor, call)
+                if response_cache and not cached:
+                    response_cache.put(cache_key, assistant_response, MODEL_NAME)
+
+                writer.log("response", assistant_response)
+
+                # すべてのツールの実行結果を出現順に取得
+                with span("tools.finish", "tool"):
+                    results = await asyncio.to_thread(executor.finish)
+
+                # トークン使用量を記録（前のターンのツールの結果の集計が終わってから）
+                if pending is not None:
+                    await asyncio.wrap_future(pending)
+                writer.log("usage", record_usage(
+                    usage_tracker, context, response_usage, cached, prompt_tokens, assistant_response,
+                    results, stable_prefix, prefix_broken
+                ))
+
+                is_complete = append_turn(messages, assistant_response, results)
+
+                # 結果の集計・ログ・チェックポイントは次のリクエストと並行して記録する
+                pending = writer.submit(
+                    record_turn_results, results, context, usage_tracker, checkpoint_writer,
+                    [dict(message) for message in messages], written_paths(executor)
+                )
+
+                # セッションの上限に達した場合は終了
+                if reached_budget(usage_tracker, is_complete):
+                    break
+    finally:
+        await writer.close()
+
+    end_checkpoint(checkpoint_writer, session_id, is_complete, "async_main.py")
+
+    report_session(usage_tracker, response_cache, artifacts, session_id)
+    return is_complete
+
+async def main_async(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+
+    restored = None
+    if args.resume:
+        restored = load_checkpoint(args.resume)
+        if restored is None:
+            return
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    response_cache = ResponseCache.from_env()
+    replay_only = response_cache is not None and response_cache.read_only
+    if not api_key and not replay_only:
+        print("OPENAI_API_KEYが設定されていません")
+        return
+
+    # タスクの入力を待つ間に openai を読み込んでおく
+    if api_key:
+        preload_module("openai")
+
+    if restored is None:
+        print("コーディングエージェントにタスクを入力してください:")
+        user_task = await asyncio.to_thread(input)
+    else:
+        user_task = restored.task
+        print(f"セッション {restored.session_id} をターン {restored.turn} の次から再開します")
+        print(f"タスク: {user_task}")
+
+    client = get_client(api_key) if api_key else None
+
+    print("\nAI Coding Agentを初期化しています...")
+    print("このエージェントは与えられたタスクを解決するためにツールを使用します。")
+    print("処理には少し時間がかかる場合があります。しばらくお待ちください。\n")
+
+    try:
+        await run_session(client, user_task, response_cache, restored)
+    finally:
+        await close_client()
+        shutdown()
+
+def main(argv: Optional[List[str]] = None):
+    asyncio.run(main_async(argv))
+
+if __name__ == "__main__":
+    main()
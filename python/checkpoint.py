@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+セッションのチェックポイント
+
+ターンが終わるたびに、会話履歴の前回からの差分（追加・書き換えられたメッセージ）・ターン番号・
+ツールの実行結果の概要・トークン使用量の集計・WriteFile で書き込んだファイルのハッシュを
+セッションごとのファイル（.agent_cache/sessions/<セッションID>.jsonl）に1行ずつ追記する。
+各行は書き込むたびに fsync するため、途中で異常終了しても最後に完了したターンまでは残る
+（書き込みの途中で終了した最後の行は読み込み時に無視する）。
+
+`python main.py --resume <セッションID>` で最後に完了したターンの次から再開する。
+それまでの API 呼び出しはやり直さない。
+
+環境変数 AGENT_CHECKPOINT=false で無効化できる。
+"""
+
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from request_log import RequestDeltaRecorder, apply_delta
+
+# チェックポイントを記録するかどうか
+CHECKPOINT_ENABLED = os.getenv("AGENT_CHECKPOINT", "true").lower() == "true"
+DEFAULT_CHECKPOINT_DIR = os.path.join(".agent_cache", "sessions")
+
+# 記録の種類
+RECORD_START = "start"
+RECORD_TURN = "turn"
+RECORD_END = "end"
+
+# セッションの終了状態
+STATUS_COMPLETE = "complete"
+STATUS_STOPPED = "stopped"
+
+def checkpoint_path(session_id: str, directory: Optional[str] = None) -> str:
+    directory = directory or os.getenv("AGENT_CHECKPOINT_DIR", DEFAULT_CHECKPOINT_DIR)
+    return os.path.join(directory, f"{session_id}.jsonl")
+
+def file_hash(path: str) -> Optional[str]:
+    """ファイルの SHA-256（存在しない場合は None）"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def _ends_with_newline(path: str) -> bool:
+    """ファイルが空か改行で終わっているか（書き込みの途中で終了した行が残っていないか）"""
+    try:
+        with open(path, "rb") as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+    except FileNotFoundError:
+        return True
+
+@dataclass
+class Checkpoint:
+    session_id: str
+    task: str = ""
+    model: str = ""
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    turn: int = 0
+    usage: Optional[Dict[str, Any]] = None
+    # WriteFile で書き込んだファイルのハッシュ（削除された場合は None）
+    files: Dict[str, Optional[str]] = field(default_factory=dict)
+    # 終了した場合の状態（異常終了した場合は None）
+    status: Optional[str] = None
+
+class CheckpointWriter:
+    """
+    セッションのチェックポイントを追記する
+
+    会話履歴の差分は RequestDeltaRecorder で計算するため、書き換えられていないメッセージは
+    2回目以降は記録しない。
+    """
+
+    def __init__(self, session_id: str, directory: Optional[str] = None):
+        self.session_id = session_id
+        self.path = checkpoint_path(session_id, directory)
+        self.files: Dict[str, Optional[str]] = {}
+        self._recorder = RequestDeltaRecorder(session_id)
+        self._file = None
+
+    def _append(self, record: Dict[str, Any]):
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            complete = _ends_with_newline(self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+            if not complete:
+                # 再開したセッションの最後の行が途中で終わっている場合は、次の行がつながらないよう改行で区切る
+                # （途中で終わった行は読み込み時に無視する）
+                self._file.write("\n")
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def start(self, task: str, model: str):
+        """新しいセッションの開始を記録する"""
+        self._append({"type": RECORD_START, "session_id": self.session_id, "task": task, "model": model})
+
+    def resume(self, checkpoint: Checkpoint, messages: List[Dict[str, Any]]):
+        """
+        再開したセッションに続けて記録する
+
+        Args:
+            checkpoint: 読み込んだチェックポイント
+            messages: 復元した会話履歴（以降はこの状態からの差分を記録する）
+        """
+        self.files = dict(checkpoint.files)
+        self._recorder.resume(checkpoint.turn, messages)
+
+    def record_turn(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: List[Dict[str, Any]],
+        usage: Dict[str, Any],
+        written_paths: List[str]
+    ):
+        """
+        完了したターンを記録する
+
+        Args:
+            messages: ターンの終了時点の会話履歴
+            tools: ツールの実行結果の概要（tool_type / success / artifact_id）
+            usage: UsageTracker.summary() の戻り値
+            written_paths: このターンで WriteFile で書き込んだファイル
+        """
+        delta = self._recorder.record(messages)
+        files = {}
+        for path in written_paths:
+            key = os.path.abspath(path)
+            files[key] = self.files[key] = file_hash(key)
+        self._append({
+            "type": RECORD_TURN,
+            "turn": delta["turn"],
+            "length": delta["length"],
+            "replaced": delta["replaced"],
+            "appended": delta["appended"],
+            "tools": tools,
+            "usage": usage,
+            "files": files
+        })
+
+    def end(self, status: str):
+        """セッションの終了を記録してファイルを閉じる"""
+        self._append({"type": RECORD_END, "status": status})
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def load(session_id: str, directory: Optional[str] = None) -> Checkpoint:
+    """
+    チェックポイントを読み込み、最後に完了したターンの状態を復元する
+
+    Args:
+        session_id: セッションID
+        directory: チェックポイントの保存先（省略時は AGENT_CHECKPOINT_DIR）
+
+    Returns:
+        Checkpoint: 復元した状態
+
+    Raises:
+        FileNotFoundError: チェックポイントが存在しない場合
+    """
+    checkpoint = Checkpoint(session_id)
+    with open(checkpoint_path(session_id, directory), "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 書き込みの途中で終了した行
+                continue
+            record_type = record.get("type")
+            if record_type == RECORD_START:
+                checkpoint.task = record.get("task", "")
+                checkpoint.model = record.get("model", "")
+            elif record_type == RECORD_TURN:
+                apply_delta(checkpoint.messages, record)
+                checkpoint.turn = record["turn"]
+                checkpoint.usage = record.get("usage")
+                checkpoint.files.update(record.get("files") or {})
+                checkpoint.status = None
+            elif record_type == RECORD_END:
+                checkpoint.status = record.get("status")
+    return checkpoint
+
+def changed_files(files: Dict[str, Optional[str]]) -> List[str]:
+    """チェックポイントを記録した後に内容が変わった（または削除された）ファイル"""
+    return sorted(path for path, digest in files.items() if file_hash(path) != digest)
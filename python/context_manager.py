@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# 既定のトークン予算（gpt-4 の 8K コンテキストから応答分の 2000 を除いた値）
+DEFAULT_TOKEN_BUDGET = 6000
+# 予算超過時にこの割合まで削減する（毎ターン圧縮が走らないようにするため）
+DEFAULT_LOW_WATER_RATIO = 0.75
+# そのまま残す直近のターン数（1ターン = アシスタントの応答 + ツール結果）
+DEFAULT_KEEP_RECENT_TURNS = 3
+# 切り詰めたツール結果に残す先頭・末尾の文字数
+TRUNCATE_HEAD_CHARS = 600
+TRUNCATE_TAIL_CHARS = 300
+
+# 1メッセージあたりのフォーマット用オーバーヘッド（トークン）
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+# ツール結果メッセージの先頭部分（例: "[read_file Result] "）
+_TOOL_RESULT_PATTERN = re.compile(r'^\[([a-z_]+) Result\] ')
+
+_ELIDED_MARKER = "(古いツール結果のため省略しました)"
+_TRUNCATED_MARKER = "...(省略: 元の長さ {length}文字)..."
+
+@dataclass
+class CompactionReport:
+    tokens_before: int
+    tokens_after: int
+    truncated: int = 0
+    elided: int = 0
+    # 前回の圧縮までに固定した先頭部分を書き換えたかどうか（プロンプトキャッシュの一致が途切れる）
+    prefix_broken: bool = False
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+class ContextManager:
+    """
+    会話履歴のトークン数を予算内に収める
+
+    システムプロンプト、最初のタスク、直近のターンはそのまま残し、
+    それより古いツール結果を先頭・末尾だけ残して切り詰め、それでも
+    予算を超える場合は丸ごと省略する。圧縮は予算を超えたときだけ
+    低水位（予算 × low_water_ratio）まで行い、履歴は直接書き換える。
+
+    プロンプトキャッシュの一致を保つため、前回の圧縮の時点で直近のターンより
+    古かったメッセージ（固定済みの先頭部分）は書き換えず、それ以降に追加された
+    ツール結果だけを圧縮する。それだけでは低水位まで減らせない場合に限り、
+    固定済みの部分も圧縮する（CompactionReport.prefix_broken）。
+    """
+
+    def __init__(
+        self,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        keep_recent_turns: int = DEFAULT_KEEP_RECENT_TURNS,
+        low_water_ratio: float = DEFAULT_LOW_WATER_RATIO,
+        model: str = "gpt-4"
+    ):
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.low_water_ratio = low_water_ratio
+        self._encoding = None
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except Exception:
+                self._encoding = None
+        # id(message) -> (content, tokens)。内容が変わらない限り再計算しない
+        self._token_cache: Dict[int, tuple] = {}
+        # この位置より前のメッセージは固定済み（システムプロンプトと最初のタスク、前回の圧縮で対象になりえた範囲）
+        self._frozen_until = 2
+
+    @classmethod
+    def from_env(cls, model: str = "gpt-4") -> "ContextManager":
+        """環境変数から設定を読み込んで生成する"""
+        return cls(
+            token_budget=int(os.getenv("AGENT_CONTEXT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET)),
+            keep_recent_turns=int(os.getenv("AGENT_CONTEXT_KEEP_TURNS", DEFAULT_KEEP_RECENT_TURNS)),
+            model=model
+        )
+
+    def count_text_tokens(self, text: str) -> int:
+        """テキストのトークン数を数える（tiktoken が無い場合は概算）"""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        # UTF-8 で約4バイト = 1トークン（日本語は1文字 ≒ 1トークン弱）
+        return (len(text.encode("utf-8")) + 3) // 4
+
+    def count_message_tokens(self, message: Dict[str, str]) -> int:
+        """メッセージ1件のトークン数を数える"""
+        content = message.get("content") or ""
+        cached = self._token_cache.get(id(message))
+        if cached is not None and cached[0] is content:
+            return cached[1]
+        tokens = self.count_text_tokens(content) + _MESSAGE_OVERHEAD_TOKENS
+        self._token_cache[id(message)] = (content, tokens)
+        return tokens
+
+    def count_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """会話履歴全体のトークン数を数える"""
+        return sum(self.count_message_tokens(m) for m in messages)
+
+    def compact(self, messages: List[Dict[str, str]]) -> Optional[CompactionReport]:
+        """
+        会話履歴が予算を超えていれば古いツール結果を圧縮する
+
+        Args:
+            messages: 会話履歴（直接書き換える）
+
+        Returns:
+            Optional[CompactionReport]: 圧縮した場合はその結果、不要だった場合は None
+        """
+        total = self.count_tokens(messages)
+        if total <= self.token_budget:
+            return None
+
+        report = CompactionReport(tokens_before=total, tokens_after=total)
+        target = int(self.token_budget * self.low_water_ratio)
+        candidates = self._compactable_indices(messages)
+
+        # 前回の圧縮より後に追加されたツール結果だけを圧縮する
+        total = self._shrink(messages, [i for i in candidates if i >= self._frozen_until], total, target, report)
+        if total > target:
+            # それでも超えていれば固定済みの部分も圧縮する
+            frozen_before = report.truncated + report.elided
+            total = self._shrink(messages, [i for i in candidates if i < self._frozen_until], total, target, report)
+            report.prefix_broken = report.truncated + report.elided > frozen_before
+        # 今回圧縮の対象になりえた範囲は、次回以降の圧縮では書き換えない
+        self._frozen_until = max(self._frozen_until, len(messages) - self.keep_recent_turns * 2)
+
+        report.tokens_after = total
+        self._prune_cache(messages)
+        return report
+
+    def _shrink(self, messages: List[Dict[str, str]], indices: List[int], total: int, target: int,
+                report: CompactionReport) -> int:
+        """indices のツール結果を target まで圧縮し、圧縮後のトークン数を返す"""
+        # 1段階目: 古いものから先頭・末尾だけを残して切り詰める
+        for index in indices:
+            if total <= target:
+                break
+            saved = self._replace(messages, index, self._truncate(messages[index]["content"]))
+            if saved > 0:
+                total -= saved
+                report.truncated += 1
+
+        # 2段階目: それでも超えていれば古いものから丸ごと省略する
+        for index in indices:
+            if total <= target:
+                break
+            saved = self._replace(messages, index, self._elide(messages[index]["content"]))
+            if saved > 0:
+                total -= saved
+                report.elided += 1
+        return total
+
+    def _compactable_indices(self, messages: List[Dict[str, str]]) -> List[int]:
+        # システムプロンプトと最初のタスクは常に残す
+        first = 2
+        last = len(messages) - self.keep_recent_turns * 2
+        indices = []
+        for index in range(first, max(first, last)):
+            message = messages[index]
+            if message.get("role") == "user" and _TOOL_RESULT_PATTERN.match(message.get("content") or ""):
+                indices.append(index)
+        return indices
+
+    def _replace(self, messages: List[Dict[str, str]], index: int, content: str) -> int:
+        before = self.count_message_tokens(messages[index])
+        replaced = dict(messages[index], content=content)
+        after = self.count_message_tokens(replaced)
+        if after >= before:
+            return 0
+        messages[index] = replaced
+        return before - after
+
+    def _truncate(self, content: str) -> str:
+        if len(content) <= TRUNCATE_HEAD_CHARS + TRUNCATE_TAIL_CHARS:
+            return content
+        marker = _TRUNCATED_MARKER.format(length=len(content))
+        if marker[:8] in content:
+            # 切り詰め済み
+            return content
+        return f"{content[:TRUNCATE_HEAD_CHARS]}\n{marker}\n{content[-TRUNCATE_TAIL_CHARS:]}"
+
+    def _elide(self, content: str) -> str:
+        match = _TOOL_RESULT_PATTERN.match(content)
+        prefix = match.group(0) if match else ""
+        return f"{prefix}{_ELIDED_MARKER}"
+
+    def _prune_cache(self, messages: List[Dict[str, str]]):
+        alive = {id(m) for m in messages}
+        for key in list(self._token_cache):
+            if key not in alive:
+                del self._token_cache[key]
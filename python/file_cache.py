@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import mmap
+import bisect
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+# キャッシュ全体の上限（バイト）
+DEFAULT_MAX_BYTES = int(os.getenv("AGENT_FILE_CACHE_BYTES", str(64 * 1024 * 1024)))
+# 1ファイルあたりの上限（これより大きいファイルはキャッシュしない）
+MAX_ENTRY_RATIO = 0.25
+# これ以上の大きさのファイルは範囲指定の読み取りを mmap と行インデックスで行う
+MMAP_THRESHOLD = int(os.getenv("AGENT_MMAP_THRESHOLD", str(8 * 1024 * 1024)))
+# 保持する行インデックスの数
+MAX_LINE_INDEXES = 16
+# 行インデックスのチェックポイントの間隔（バイト）
+_INDEX_BLOCK_SIZE = 64 * 1024
+
+@dataclass
+class _Entry:
+    mtime_ns: int
+    size: int
+    text: str
+
+@dataclass
+class FileSlice:
+    text: str
+    total_bytes: int
+    # 行単位で読み取った場合の範囲（1始まり、両端を含む）と総行数
+    start_line: int = 0
+    end_line: int = 0
+    total_lines: int = 0
+    # 行単位の読み取りで、上限バイト数に達したため end_line で打ち切った場合は True
+    truncated: bool = False
+
+class LineIndex:
+    """
+    大きなファイルの行オフセットの疎なインデックス
+
+    約64KBごとに「その位置以降で最初に始まる行の行番号とオフセット」を記録する。
+    任意の行は直前のチェックポイントから最大64KB分だけ走査して求めるため、
+    ファイル全体の行オフセットを保持せずに先頭からの走査を避けられる。
+    """
+
+    def __init__(self, mm: mmap.mmap, size: int, mtime_ns: int):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self._lines: List[int] = [0]
+        self._offsets: List[int] = [0]
+        newlines = 0
+        pos = 0
+        while pos < size:
+            end = min(pos + _INDEX_BLOCK_SIZE, size)
+            newlines += mm[pos:end].count(b"\n")
+            last = mm.rfind(b"\n", pos, end)
+            if last != -1 and last + 1 < size:
+                self._lines.append(newlines)
+                self._offsets.append(last + 1)
+            pos = end
+        ends_with_newline = size == 0 or mm[size - 1:size] == b"\n"
+        self.total_lines = newlines if ends_with_newline else newlines + 1
+
+    def offset_of(self, mm: mmap.mmap, line: int) -> int:
+        """0始まりの行番号 line の先頭のオフセットを返す"""
+        if line >= self.total_lines:
+            return self.size
+        index = bisect.bisect_right(self._lines, line) - 1
+        current, offset = self._lines[index], self._offsets[index]
+        while current < line:
+            offset = mm.find(b"\n", offset) + 1
+            current += 1
+        return offset
+
+class FileContentCache:
+    """
+    ファイル内容のLRUキャッシュ
+
+    解決済みの絶対パスとエンコーディングをキーに、デコード済みの内容を保持する。
+    読み取りのたびに stat を取り、(st_mtime_ns, st_size) が変わっていれば
+    読み直す。合計サイズがバイト数の上限を超えたら古いものから追い出す。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._line_indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def read_text(self, path: str, encoding: str = "utf-8") -> str:
+        """
+        ファイルの内容を読み取る（変更が無ければキャッシュから返す）
+
+        Args:
+            path: ファイルのパス
+            encoding: エンコーディング
+
+        Returns:
+            str: ファイルの内容
+        """
+        resolved = os.path.realpath(path)
+        stat = os.stat(resolved)
+        key = (resolved, encoding)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.bytes_saved += entry.size
+                return entry.text
+            self.misses += 1
+
+        with open(resolved, "r", encoding=encoding) as f:
+            text = f.read()
+
+        if stat.st_size <= self.max_bytes * MAX_ENTRY_RATIO:
+            with self._lock:
+                self._remove(key)
+                self._entries[key] = _Entry(stat.st_mtime_ns, stat.st_size, text)
+                self._bytes += stat.st_size
+                while self._bytes > self.max_bytes and self._entries:
+                    self._remove(next(iter(self._entries)))
+        return text
+
+    def read_lines(self, path: str, start_line: int = 1, end_line: int = 0,
+                   max_bytes: int = 0, encoding: str = "utf-8") -> FileSlice:
+        """
+        ファイルを行単位で範囲を指定して読み取る
+
+        Args:
+            path: ファイルのパス
+            start_line: 開始行（1始まり）
+            end_line: 終了行（この行を含む）。0 の場合は最終行まで
+            max_bytes: 読み取る最大バイト数。0 の場合は無制限（最低1行は返す）
+            encoding: エンコーディング
+
+        Returns:
+            FileSlice: 読み取った範囲と総行数
+        """
+        resolved = os.path.realpath(path)
+        stat = os.stat(resolved)
+        start_line = max(1, start_line)
+        if stat.st_size < MMAP_THRESHOLD:
+            return self._read_lines_cached(resolved, stat.st_size, start_line, end_line, max_bytes, encoding)
+
+        with open(resolved, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            index = self._get_line_index(resolved, mm, stat)
+            total = index.total_lines
+            last = min(end_line, total) if end_line > 0 else total
+            begin = index.offset_of(mm, start_line - 1)
+            offset = begin
+            line = start_line - 1
+            while line < last:
+                next_newline = mm.find(b"\n", offset)
+                next_offset = stat.st_size if next_newline == -1 else next_newline + 1
+                if max_bytes and line >= start_line and next_offset - begin > max_bytes:
+                    break
+                offset = next_offset
+                line += 1
+            text = mm[begin:offset].decode(encoding, errors="replace")
+        return FileSlice(text, stat.st_size, start_line, line, total, truncated=line < last)
+
+    def read_bytes(self, path: str, offset: int, length: int, encoding: str = "utf-8") -> FileSlice:
+        """
+        ファイルをバイト単位で範囲を指定して読み取る
+
+        Args:
+            path: ファイルのパス
+            offset: 開始位置（バイト）
+            length: 読み取るバイト数
+            encoding: エンコーディング（範囲の境界で分断された文字は置換文字になる）
+
+        Returns:
+            FileSlice: 読み取った範囲とファイルの総バイト数
+        """
+        resolved = os.path.realpath(path)
+        with open(resolved, "rb") as f:
+            total = os.fstat(f.fileno()).st_size
+            f.seek(max(0, offset))
+            data = f.read(max(0, length))
+        return FileSlice(data.decode(encoding, errors="replace"), total)
+
+    def _read_lines_cached(self, path: str, size: int, start_line: int, end_line: int,
+                           max_bytes: int, encoding: str) -> FileSlice:
+        lines = self.read_text(path, encoding=encoding).split("\n")
+        if lines[-1] == "":
+            lines.pop()
+        total = len(lines)
+        last = min(end_line, total) if end_line > 0 else total
+        selected = []
+        used = 0
+        line = start_line - 1
+        while line < last:
+            length = len(lines[line].encode(encoding, errors="replace")) + 1
+            if max_bytes and selected and used + length > max_bytes:
+                break
+            selected.append(lines[line])
+            used += length
+            line += 1
+        text = "\n".join(selected) + ("\n" if selected else "")
+        return FileSlice(text, size, start_line, line, total, truncated=line < last)
+
+    def _get_line_index(self, path: str, mm: mmap.mmap, stat: os.stat_result) -> LineIndex:
+        with self._lock:
+            index = self._line_indexes.get(path)
+            if index is not None and index.mtime_ns == stat.st_mtime_ns and index.size == stat.st_size:
+                self._line_indexes.move_to_end(path)
+                return index
+        index = LineIndex(mm, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            self._line_indexes[path] = index
+            while len(self._line_indexes) > MAX_LINE_INDEXES:
+                self._line_indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, path: str):
+        """指定したファイルのキャッシュを破棄する（書き込み後に呼び出す）"""
+        resolved = os.path.realpath(path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == resolved]:
+                self._remove(key)
+            self._line_indexes.pop(resolved, None)
+
+    def clear(self):
+        """すべてのキャッシュを破棄する"""
+        with self._lock:
+            self._entries.clear()
+            self._line_indexes.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """ヒット・ミスの回数と、キャッシュにより読み取りを省略したバイト数を返す"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_saved": self.bytes_saved,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            }
+
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+# プロセス内で共有するキャッシュ
+file_cache = FileContentCache()
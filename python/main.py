@@ -4,56 +4,53 @@
 import os
 import sys
 import json
+import argparse
 import datetime
+import time
+import importlib
+import threading
 from pathlib import Path
-import openai
-from openai import OpenAI
-from typing import Dict, List, Tuple, Optional, Any
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple, Optional, Any
 from tool import (
     list_file, read_file, write_file, ask_question, 
     execute_command, complete, ToolResponse
 )
-from parser import parse_and_execute_tool, TOOL_TYPE_COMPLETE, TOOL_TYPE_ASK_QUESTION, TOOL_TYPE_EXECUTE_COMMAND
+from context_manager import ContextManager, CompactionReport
+from file_cache import file_cache
+from request_log import RequestDeltaRecorder, LOG_TYPE_REQUEST_DELTA
+from response_cache import ResponseCache, ResponseCacheMiss, make_key
+from usage import UsageTracker, usage_to_dict, SOURCE_API, SOURCE_ESTIMATED, SOURCE_CACHE
+from shell_session import shell_pool
+from session_context import DEFAULT_SHELL_KEY
+from scheduler import request_scheduler, RetryLimitExceeded
+import artifact_store
+import checkpoint
+import tracer
+from tracer import span, traced
+from parser import (
+    ToolCallParser, ToolExecutor, ToolResult, extract_tool_calls, format_tool_results,
+    TOOL_TYPE_COMPLETE, TOOL_TYPE_ASK_QUESTION, TOOL_TYPE_EXECUTE_COMMAND, TOOL_TYPE_WRITE_FILE
+)
 
-# ログを記録する関数
-def log_to_file(log_type: str, data: Any):
-    try:
-        # ログディレクトリがなければ作成
-        log_dir = Path("logs")
-        log_dir.mkdir(exist_ok=True)
-        
-        # 日付を含むログファイル名を生成
-        today = datetime.datetime.now().strftime("%Y%m%d")
-        log_file = log_dir / f"agent_log_{today}.jsonl"
-        
-        # タイムスタンプを生成
-        timestamp = datetime.datetime.now().isoformat()
-        
-        # ログエントリを作成
-        log_entry = {
-            "timestamp": timestamp,
-            "type": log_type,
-            "data": data
-        }
-        
-        # ログファイルに追記
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-    except Exception as e:
-        print(f"ログの記録中にエラーが発生しました: {str(e)}")
+if TYPE_CHECKING:
+    # openai の読み込みには時間がかかるため、実行時は API クライアントを作成するときに読み込む
+    from openai import OpenAI
 
-def main():
-    # OpenAI APIキーを環境変数から取得
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        print("OPENAI_API_KEYが設定されていません")
-        return
-    
-    # OpenAI APIクライアントを初期化
-    client = OpenAI(api_key=api_key)
-    
-    # システムプロンプトを設定
-    system_prompt = """あなたはコーディングエージェントです。以下のツールを使ってタスクを完了してください：
+# LLMへのリクエスト設定
+MODEL_NAME = "gpt-4"  # OpenAIの最新モデルを使用
+REQUEST_PARAMS = {
+    "temperature": 0.2,  # より決定論的な応答を促す
+    "max_tokens": 2000,  # 十分な長さの応答を確保
+    "top_p": 0.95        # 出力の多様性を若干制限
+}
+
+# ストリーミングモード（環境変数 AGENT_STREAM=false で無効化）
+STREAM_RESPONSES = os.getenv("AGENT_STREAM", "true").lower() == "true"
+
+# システムプロンプト
+# プロバイダー側のプロンプトキャッシュは先頭から一致する部分にだけ効くため、会話履歴の先頭に置く
+# この文字列は実行ごとに変わる値（日時やパスなど）を含めず、常に同じバイト列にする
+SYSTEM_PROMPT = """あなたはコーディングエージェントです。以下のツールを使ってタスクを完了してください：
 
 # ListFile
 ディレクトリ内のファイル一覧を取得します。
@@ -67,6 +64,32 @@ def main():
 <read_file>
 <path>ファイルのパス</path>
 </read_file>
+大きなファイルは範囲を指定して読み取れます（省略可能。行は1始まりで終了行を含みます）。
+範囲を指定すると、結果の先頭にファイルの総行数が表示されます。
+<read_file>
+<path>ファイルのパス</path>
+<start_line>開始行</start_line>
+<end_line>終了行</end_line>
+</read_file>
+バイト単位で読み取る場合は <byte_offset>開始位置</byte_offset> と <byte_length>バイト数</byte_length> を指定します。
+
+# Search
+ワークスペースのファイルを正規表現で検索し、一致した行を行番号と前後の行とともに返します。
+コードの場所を探すときは、ファイルを1つずつ読む代わりにこのツールを使用してください。
+<search>
+<pattern>正規表現</pattern>
+</search>
+次のパラメータは省略可能です: <path>検索するディレクトリ（既定は作業ディレクトリ）</path>、
+<file_pattern>対象ファイル名のパターン（例: *.py）</file_pattern>、<ignore_case>true または false</ignore_case>、
+<context_lines>前後に表示する行数（既定は2）</context_lines>、<max_results>一致した行数の上限</max_results>
+
+# FindDefinition
+Pythonのクラス・関数・メソッド・モジュール直下の変数の定義を探し、定義の行をそのまま返します。
+名前は "関数名" または "クラス名.メソッド名" の形式で指定します。
+<find_definition>
+<name>シンボル名</name>
+</find_definition>
+<references>true</references> を指定すると、呼び出し箇所とimportの行も返します。
 
 # WriteFile
 ファイルに内容を書き込みます。
@@ -76,6 +99,20 @@ def main():
 書き込む内容
 </content>
 </write_file>
+既存ファイルの一部だけを変更する場合は、<content> の代わりに <edit> を使用します。
+SEARCH にはファイル内の記述と完全に一致し、1箇所だけに一致する行を書いてください。
+<write_file>
+<path>ファイルのパス</path>
+<edit>
+<<<<<<< SEARCH
+変更前の行
+=======
+変更後の行
+>>>>>>> REPLACE
+</edit>
+</write_file>
+<edit> には SEARCH/REPLACE ブロックを複数並べることも、unified diff（@@ -開始行,行数 +開始行,行数 @@）を書くこともできます。
+結果には適用できたハンクと失敗したハンクが表示されます。
 
 # AskQuestion
 ユーザーに質問します。
@@ -90,6 +127,15 @@ def main():
 <requires_approval>true または false</requires_approval>
 </execute_command>
 
+# ReadArtifact
+結果が大きいツールの結果は全体がアーティファクトに保存され、先頭と末尾のプレビューとIDだけが返されます。
+全体が必要な場合は、IDと範囲（ReadFileと同じ <start_line>・<end_line> または <byte_offset>・<byte_length>）を指定して読み取ります。
+<read_artifact>
+<id>アーティファクトのID</id>
+<start_line>開始行</start_line>
+<end_line>終了行</end_line>
+</read_artifact>
+
 # Complete
 タスクの完了を示します。
 <complete>
@@ -99,9 +145,10 @@ def main():
 重要な指示：
 1. 必ず上記のいずれかのツールを使用してください。
 2. ツールを使わずに直接回答することは絶対に禁止です。
-3. 直接コードを提示するのではなく、WriteFileツールを使用してファイルを作成してください。
+3. 直接コードを提示するのではなく、WriteFileツールを使用してファイルを作成してください。既存の大きなファイルを修正するときは編集モード（<edit>）を使用してください。
 4. タスクが完了したらCompleteツールを使用して明示的に終了を示してください。
 5. タスクが複雑な場合は、まずAskQuestionツールを使用して詳細を確認してください。
+6. 1つの回答に複数のツールを並べることができます。特にListFile・ReadFile・Search・FindDefinition・ReadArtifactは複数まとめて使用すると並行して実行され、結果がまとめて返されます。
 
 例：電卓アプリ作成の場合は、WriteFileツールを使用してcalculator.pyなどのファイルにコードを書き込み、必要に応じてExecuteCommandでテストを実行し、最終的にCompleteで完了を示してください。
 
@@ -114,79 +161,614 @@ print("Hello World")
 </write_file>
 """
 
-    # ユーザーからのタスク入力を受け取る
-    print("コーディングエージェントにタスクを入力してください:")
-    user_task = input()
+# ログを記録する関数
+@traced(category="log")
+def log_to_file(log_type: str, data: Any):
+    try:
+        # ログディレクトリがなければ作成
+        log_dir = Path("logs")
+        log_dir.mkdir(exist_ok=True)
+        
+        # 日付を含むログファイル名を生成
+        today = datetime.datetime.now().strftime("%Y%m%d")
+        log_file = log_dir / f"agent_log_{today}.jsonl"
+        
+        # タイムスタンプを生成
+        timestamp = datetime.datetime.now().isoformat()
+        
+        # ログエントリを作成
+        log_entry = {
+            "timestamp": timestamp,
+            "type": log_type,
+            "data": data
+        }
+        
+        # ログファイルに追記
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"ログの記録中にエラーが発生しました: {str(e)}")
+
+def reserved_tokens(prompt_tokens: int) -> int:
+    """スケジューラーで予約するトークン数（プロンプト + 生成の上限）"""
+    return prompt_tokens + REQUEST_PARAMS["max_tokens"]
+
+def used_tokens(usage: Optional[Dict[str, int]]) -> Optional[int]:
+    return usage["prompt_tokens"] + usage["completion_tokens"] if usage else None
+
+# LLMにリクエストを送信してレスポンス全体を受け取る
+def request_completion(client: "OpenAI", messages: List[Dict[str, str]], prompt_tokens: int = 0) -> Tuple[str, Optional[Dict[str, int]]]:
+    reserved = reserved_tokens(prompt_tokens)
+    with span("llm.request", "llm"):
+        response = request_scheduler.call(
+            lambda: client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=messages,
+                **REQUEST_PARAMS
+            ),
+            tokens=reserved
+        )
+    usage = usage_to_dict(response.usage)
+    request_scheduler.settle(reserved, used_tokens(usage))
+    return response.choices[0].message.content or "", usage
+
+# LLMのレスポンスをストリーミングで受け取り、ツールブロックが閉じるたびに実行を開始する
+def stream_completion(
+    client: "OpenAI",
+    messages: List[Dict[str, str]],
+    executor: ToolExecutor,
+    prompt_tokens: int = 0
+) -> Tuple[str, Optional[Dict[str, int]]]:
+    """
+    レスポンスをチャンク単位で受信し、ツールの閉じタグが届くたびにそのツールを
+    executor に渡す。complete ツールが届いた時点で受信を打ち切る
+
+    Args:
+        client: OpenAI APIクライアント
+        messages: 会話履歴
+        executor: ツールの実行を受け持つ ToolExecutor
+        prompt_tokens: プロンプトのトークン数（スケジューラーで予約する量の推定に使用）
+
+    Returns:
+        Tuple[str, Optional[Dict[str, int]]]: 受信したレスポンス（complete で打ち切った場合はその閉じタグまで）と
+            トークン使用量（最後のチャンクを受信する前に打ち切った場合は None）
+    """
+    start = time.perf_counter_ns()
+    # 送り直すのはストリームを開始するまで（受信を始めた後はツールを実行しているため送り直さない）
+    reserved = reserved_tokens(prompt_tokens)
+    stream = request_scheduler.call(
+        lambda: client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=messages,
+            stream=True,
+            # 最後のチャンクでトークン使用量を受け取る
+            stream_options={"include_usage": True},
+            **REQUEST_PARAMS
+        ),
+        tokens=reserved
+    )
+    parser = ToolCallParser()
+    first_chunk = True
+    usage = None
+    try:
+        for chunk in stream:
+            if chunk.usage:
+                usage = usage_to_dict(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_chunk:
+                # 最初のチャンクが届くまでの待ち時間
+                tracer.record("llm.first_chunk", "llm", start)
+                first_chunk = False
+            with span("parse.feed", "parse"):
+                calls = parser.feed(delta)
+            for call in calls:
+                executor.submit(call)
+
+            # 生成中の進捗をコンソールに表示
+            label = parser.tool_type or "応答"
+            print(f"\r[生成中] {label} {parser.length}文字", end="", flush=True)
+
+            if executor.completed:
+                # タスクが完了したので残りの生成は待たない
+                break
+    finally:
+        stream.close()
+        print()
+        tracer.record("llm.stream", "llm", start, {"chars": parser.length})
+    request_scheduler.settle(reserved, used_tokens(usage))
+
+    text = parser.text
+    return (text[:parser.end] if executor.completed else text), usage
+
+def preload_module(name: str) -> threading.Thread:
+    """
+    モジュールをバックグラウンドのスレッドで読み込む
+
+    ユーザーがタスクを入力している間に重いモジュールの読み込みを済ませ、
+    プロンプトを表示するまでの時間を短くする。読み込みに失敗した場合は何もしない
+    （実際に使う箇所の import で改めてエラーになる）。
+    """
+    def load():
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+    thread = threading.Thread(target=load, name=f"preload-{name}", daemon=True)
+    thread.start()
+    return thread
+
+def create_client(api_key: str) -> "OpenAI":
+    """OpenAI APIクライアントを作成する（openai はここで初めて読み込む）"""
+    from openai import OpenAI
+    # 送り直しはスケジューラーで行うため、クライアントの組み込みの再試行は無効にする
+    return OpenAI(api_key=api_key, max_retries=0)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="AI Coding Agent")
+    parser.add_argument("--resume", metavar="SESSION_ID",
+                        help="チェックポイントから最後に完了したターンの次から再開するセッションID")
+    return parser.parse_args(argv)
+
+def load_checkpoint(session_id: str) -> Optional[checkpoint.Checkpoint]:
+    """再開するセッションのチェックポイントを読み込む（再開できない場合は理由を表示して None を返す）"""
+    try:
+        restored = checkpoint.load(session_id)
+    except FileNotFoundError:
+        print(f"セッション {session_id} のチェックポイントが見つかりません")
+        return None
+    if restored.status == checkpoint.STATUS_COMPLETE:
+        print(f"セッション {session_id} は完了しています")
+        return None
+    if not restored.messages:
+        print(f"セッション {session_id} には完了したターンがありません")
+        return None
+    return restored
+
+def open_checkpoint(
+    session_id: str,
+    user_task: str,
+    messages: List[Dict[str, Any]],
+    restored: Optional[checkpoint.Checkpoint]
+) -> Optional[checkpoint.CheckpointWriter]:
+    """
+    チェックポイントの記録を開始する（AGENT_CHECKPOINT=false の場合は None）
+
+    再開したセッションでチェックポイントの後に書き込んだファイルが変更されていれば、
+    警告を表示し、変更されたファイルを会話履歴に追加してモデルに伝える。
+    """
+    writer = None
+    if checkpoint.CHECKPOINT_ENABLED:
+        writer = checkpoint.CheckpointWriter(session_id)
+        if restored is None:
+            writer.start(user_task, MODEL_NAME)
+        else:
+            writer.resume(restored, messages)
+    if restored is not None:
+        changed = checkpoint.changed_files(restored.files)
+        if changed:
+            print("\n[checkpoint] チェックポイントの後に次のファイルが変更されています:")
+            for path in changed:
+                print(f"  {path}")
+            messages.append({
+                "role": "user",
+                "content": "[Resume] セッションを再開しました。チェックポイントの後に次のファイルが変更されているため、"
+                           "必要に応じて内容を確認してから続けてください:\n" + "\n".join(changed)
+            })
+    return writer
+
+def written_paths(executor: ToolExecutor) -> List[str]:
+    """ターン中に WriteFile で書き込んだファイル"""
+    return [call.params.get("path", "") for call in executor.calls
+            if call.tool_type == TOOL_TYPE_WRITE_FILE and call.params.get("path")]
+
+# 以下はエージェントのループの1ターンの処理（main と async_main.run_session で共有する）
+# log には log_to_file か、書き込みを別のスレッドで行う関数（async_main.BackgroundWriter.log）を渡す
+
+# ツールが見つからなかった場合にモデルに返すエラー
+NO_TOOL_ERROR_MESSAGE = "エラー: 有効なツールが見つかりませんでした。以下のいずれかのツールを使用してください: list_file, read_file, write_file, search, find_definition, read_artifact, ask_question, execute_command, complete。適切なXML形式で回答してください。"
+
+def compact_context(
+    context: ContextManager,
+    messages: List[Dict[str, Any]],
+    log: Callable[[str, Any], Any]
+) -> Tuple[Optional[CompactionReport], int]:
+    """
+    予算を超えていれば古いツール結果を圧縮し、会話履歴のトークン数をログに記録する
+
+    Returns:
+        Tuple[Optional[CompactionReport], int]: 圧縮の結果（圧縮しなかった場合は None）と送信するトークン数
+    """
+    with span("context.compact", "context"):
+        report = context.compact(messages)
+    if report:
+        print(f"\n[context] 古いツール結果を圧縮しました: {report.tokens_saved}トークン削減 "
+              f"({report.tokens_before} -> {report.tokens_after})")
+    prompt_tokens = report.tokens_after if report else context.count_tokens(messages)
+    log("context", {
+        "tokens": prompt_tokens,
+        "tokens_saved": report.tokens_saved if report else 0,
+        "truncated": report.truncated if report else 0,
+        "elided": report.elided if report else 0
+    })
+    return report, prompt_tokens
+
+def exceeds_budget(usage_tracker: UsageTracker, prompt_tokens: int) -> bool:
+    """送信するとセッションの上限を超えるかどうか（超える場合は理由を表示する）"""
+    if not usage_tracker.would_exceed(prompt_tokens):
+        return False
+    print(f"\n[usage] セッションのトークン数の上限（{usage_tracker.token_budget}）を超えるため終了します")
+    return True
+
+def reached_budget(usage_tracker: UsageTracker, is_complete: bool) -> bool:
+    """タスクが完了する前にセッションの上限に達したかどうか（達した場合は理由を表示する）"""
+    if is_complete or not usage_tracker.exceeded():
+        return False
+    print(f"\n[usage] セッションのトークン数の上限（{usage_tracker.token_budget}）に達したため終了します")
+    return True
+
+def record_request(
+    request_recorder: RequestDeltaRecorder,
+    messages: List[Dict[str, Any]],
+    report: Optional[CompactionReport],
+    log: Callable[[str, Any], Any]
+) -> Tuple[int, bool]:
+    """
+    リクエストデータ（前回からの差分）をログに記録する
+
+    Returns:
+        Tuple[int, bool]: 前回から変わっていない先頭のメッセージ数（プロンプトキャッシュに一致しうる範囲）と、
+            圧縮が前回の圧縮までに固定した先頭部分を書き換えたかどうか
+    """
+    delta = request_recorder.record(messages)
+    log(LOG_TYPE_REQUEST_DELTA, delta)
+    stable_prefix = delta["replaced"][0]["index"] if delta["replaced"] else delta["length"] - len(delta["appended"])
+    return stable_prefix, bool(report and report.prefix_broken)
+
+def lookup_response(
+    response_cache: Optional[ResponseCache],
+    messages: List[Dict[str, Any]]
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    保存済みのレスポンスを探す
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: キャッシュのキーと保存済みのレスポンス（キャッシュを使用しない場合や
+            保存されていない場合は None）
+
+    Raises:
+        ResponseCacheMiss: replay モードで保存されていない場合
+    """
+    if response_cache is None:
+        return None, None
+    cache_key = make_key(MODEL_NAME, REQUEST_PARAMS, messages)
+    response = response_cache.get(cache_key)
+    if response is not None:
+        print("\n[cache] 保存済みのレスポンスを使用します")
+    return cache_key, response
+
+def record_usage(
+    usage_tracker: UsageTracker,
+    context: ContextManager,
+    response_usage: Optional[Dict[str, int]],
+    cached: bool,
+    prompt_tokens: int,
+    assistant_response: str,
+    results: List[ToolResult],
+    stable_prefix: int,
+    prefix_broken: bool
+) -> Dict[str, Any]:
+    """ターンのトークン使用量を記録する（usage を受信できなかった場合は推定する）。ログに記録する内容を返す"""
+    if cached:
+        usage_source = SOURCE_CACHE
+    elif response_usage is not None:
+        usage_source = SOURCE_API
+    else:
+        usage_source = SOURCE_ESTIMATED
+        response_usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": context.count_text_tokens(assistant_response),
+            "cached_tokens": 0
+        }
+    return usage_tracker.record_turn(
+        response_usage, usage_source, [tool_type for _, tool_type, _ in results],
+        stable_prefix, prefix_broken
+    )
+
+def append_turn(messages: List[Dict[str, Any]], assistant_response: str, results: List[ToolResult]) -> bool:
+    """
+    レスポンスとツールの実行結果を会話履歴に追加し、実行結果を表示する
+
+    ツールが見つからなかった場合は、具体的なエラーと指示を返す。
+
+    Returns:
+        bool: Complete でタスクが完了した場合は True
+    """
+    messages.append({
+        "role": "assistant",
+        "content": assistant_response
+    })
+    if not results:
+        print("\n[error] 有効なツールが見つかりませんでした")
+        messages.append({
+            "role": "user",
+            "content": f"[Error] {NO_TOOL_ERROR_MESSAGE}"
+        })
+        return False
+
+    is_complete = False
+    for tool_response, tool_type, complete_flag in results:
+        if tool_type != TOOL_TYPE_ASK_QUESTION and tool_type != TOOL_TYPE_EXECUTE_COMMAND:
+            print(f"\n[{tool_type}] {tool_response.message}")
+        if complete_flag:
+            is_complete = True
+    # すべてのツールの実行結果を1つのメッセージにまとめて追加
+    messages.append({
+        "role": "user",
+        "content": format_tool_results(results)
+    })
+    return is_complete
+
+def record_turn_results(
+    results: List[ToolResult],
+    context: ContextManager,
+    usage_tracker: UsageTracker,
+    checkpoint_writer: Optional[checkpoint.CheckpointWriter],
+    messages: List[Dict[str, Any]],
+    paths: List[str]
+):
+    """
+    ツールの結果のトークン数の集計・ログと、完了したターンのチェックポイントを記録する
+
+    async_main では別のスレッドで実行するため、messages はターンの終了時点の会話履歴の複製を渡す
+    （次のターンの圧縮で書き換えられないようにする）。
+    """
+    for tool_response, tool_type, _ in results:
+        # ツールの結果として会話履歴に追加するトークン数
+        usage_tracker.record_tool_result(tool_type, context.count_text_tokens(tool_response.message))
+        log_to_file("tool_result", {
+            "tool_type": tool_type,
+            "message": tool_response.message,
+            "success": tool_response.success,
+            "artifact_id": tool_response.artifact_id
+        })
+    if not results:
+        log_to_file("tool_result", {
+            "tool_type": "",
+            "message": "有効なツールが見つかりませんでした",
+            "success": False
+        })
+    if checkpoint_writer:
+        checkpoint_writer.record_turn(
+            messages,
+            [
+                {"tool_type": tool_type, "success": tool_response.success, "artifact_id": tool_response.artifact_id}
+                for tool_response, tool_type, _ in results
+            ],
+            usage_tracker.summary(),
+            paths
+        )
+
+def end_checkpoint(
+    checkpoint_writer: Optional[checkpoint.CheckpointWriter],
+    session_id: str,
+    is_complete: bool,
+    script: str
+):
+    """セッションの終了をチェックポイントに記録する（完了していなければ --resume で再開できる）"""
+    if not checkpoint_writer:
+        return
+    checkpoint_writer.end(checkpoint.STATUS_COMPLETE if is_complete else checkpoint.STATUS_STOPPED)
+    if not is_complete:
+        print(f"\n[checkpoint] 続きは python {script} --resume {session_id} で再開できます")
+
+def report_session(
+    usage_tracker: UsageTracker,
+    response_cache: Optional[ResponseCache],
+    artifacts: artifact_store.ArtifactStore,
+    shell_key: str = DEFAULT_SHELL_KEY
+):
+    """
+    セッションの終了時にトークン使用量・キャッシュ・アーティファクトの集計を表示・記録し、
+    セッションのシェルを終了する（ファイルキャッシュとスケジューラーはプロセスで共有しているため、
+    その集計はプロセス全体の値になる）
+    """
+    # トークン使用量の集計を記録
+    usage_summary = usage_tracker.summary()
+    log_to_file("usage_summary", usage_summary)
+    print(f"\n[usage] プロンプト {usage_summary['prompt_tokens']} (キャッシュ {usage_summary['cached_tokens']}) / "
+          f"生成 {usage_summary['completion_tokens']} / 合計 {usage_summary['total_tokens']}トークン "
+          f"({usage_summary['turns']}ターン)")
+    for tool_type, tool_usage in usage_summary["tools"].items():
+        print(f"  {tool_type}: {tool_usage['calls']}回, 生成 {tool_usage['completion_tokens']}トークン, "
+              f"結果 {tool_usage['result_tokens']}トークン")
+    
+    # レスポンスキャッシュの効果を記録
+    if response_cache:
+        response_stats = response_cache.stats()
+        log_to_file("response_cache", response_stats)
+        print(f"\n[response_cache] ヒット {response_stats['hits']}回 / ミス {response_stats['misses']}回")
+    
+    # ファイルキャッシュの効果を記録
+    cache_stats = file_cache.stats()
+    log_to_file("file_cache", cache_stats)
+    print(f"\n[file_cache] ヒット {cache_stats['hits']}回 / ミス {cache_stats['misses']}回 "
+          f"(読み取りを省略したバイト数: {cache_stats['bytes_saved']})")
+    
+    # アーティファクトに保存したツールの結果を記録
+    if artifacts.stored:
+        artifact_stats = artifacts.stats()
+        log_to_file("artifacts", artifact_stats)
+        print(f"\n[artifacts] {artifact_stats['stored']}件 ({artifact_stats['stored_bytes']}バイト) を "
+              f"{artifacts.session_dir} に保存しました")
+    
+    # リクエストの待ち時間と送り直した回数を記録
+    scheduler_stats = request_scheduler.stats()
+    if scheduler_stats["requests"]:
+        log_to_file("scheduler", scheduler_stats)
+    if scheduler_stats["retries"] or scheduler_stats["max_wait_seconds"]:
+        print(f"\n[scheduler] リクエスト {scheduler_stats['requests']}回 / 再試行 {scheduler_stats['retries']}回 "
+              f"(レート制限 {scheduler_stats['rate_limited']}回) / 待ち時間 平均 {scheduler_stats['avg_wait_seconds']}秒 "
+              f"最大 {scheduler_stats['max_wait_seconds']}秒")
+    
+    # このセッションの永続的なシェルセッションを終了する（AGENT_SHELL_SESSION=true の場合のみ起動している）
+    shell_pool.close(shell_key)
+
+def shutdown():
+    """プロセスの終了時に、残っているシェルセッションを終了し、記録したスパンを書き出す"""
+    shell_pool.close_all()
+    
+    # AGENT_TRACE_FILE を指定した場合のみ
+    if tracer.is_enabled():
+        tracer.save()
+        print(f"\n[trace] {tracer.get_path()} に書き出しました")
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    
+    # 再開するセッションのチェックポイントを読み込む
+    restored = None
+    if args.resume:
+        restored = load_checkpoint(args.resume)
+        if restored is None:
+            return
+    
+    # OpenAI APIキーを環境変数から取得
+    api_key = os.getenv("OPENAI_API_KEY")
+    
+    # レスポンスのキャッシュ（AGENT_RESPONSE_CACHE=on / replay の場合のみ）
+    response_cache = ResponseCache.from_env()
+    replay_only = response_cache is not None and response_cache.read_only
+    if not api_key and not replay_only:
+        print("OPENAI_API_KEYが設定されていません")
+        return
+    
+    # タスクの入力を待つ間に openai を読み込んでおく（replay モードでは API を呼び出さない）
+    if api_key:
+        preload_module("openai")
+    
+
+    # ユーザーからのタスク入力を受け取る（再開する場合はチェックポイントのタスク）
+    if restored is None:
+        print("コーディングエージェントにタスクを入力してください:")
+        user_task = input()
+    else:
+        user_task = restored.task
+        print(f"セッション {restored.session_id} をターン {restored.turn} の次から再開します")
+        print(f"タスク: {user_task}")
+    
+    # OpenAI APIクライアントを初期化
+    client = create_client(api_key) if api_key else None
     
     # 初期化メッセージを表示
     print("\nAI Coding Agentを初期化しています...")
     print("このエージェントは与えられたタスクを解決するためにツールを使用します。")
     print("処理には少し時間がかかる場合があります。しばらくお待ちください。\n")
     
-    # 会話履歴を初期化
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_task}
-    ]
+    # 会話履歴を初期化（再開する場合は最後に完了したターンの時点の会話履歴）
+    if restored is None:
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_task}
+        ]
+    else:
+        messages = restored.messages
+    
+    # 会話履歴のトークン予算を管理
+    context = ContextManager.from_env(MODEL_NAME)
+    
+    # トークン使用量の集計とセッションの上限（AGENT_SESSION_TOKEN_BUDGET）
+    usage_tracker = UsageTracker.from_env()
+    if restored is not None and restored.usage:
+        usage_tracker.restore(restored.usage)
+    
+    # リクエストは前回からの差分だけを記録する（再開した最初のリクエストは全体を記録し直す）
+    request_recorder = RequestDeltaRecorder(restored.session_id if restored else None)
+    if restored is not None:
+        request_recorder.resume(restored.turn)
+    print(f"セッションID: {request_recorder.session_id}\n")
+    
+    # ターンが終わるたびにチェックポイントを追記する（AGENT_CHECKPOINT=false で無効化）
+    checkpoint_writer = open_checkpoint(request_recorder.session_id, user_task, messages, restored)
+    # 大きなツールの結果の保存先（AGENT_ARTIFACT_THRESHOLD を超える結果はプレビューだけを会話履歴に追加する）
+    artifacts = artifact_store.open_store(request_recorder.session_id)
     
     # メインループ
     is_complete = False
     while not is_complete:
-        # リクエストデータをログに記録
-        log_to_file("request", messages)
+        # 予算を超えていれば古いツール結果を圧縮
+        report, prompt_tokens = compact_context(context, messages, log_to_file)
         
-        # LLMにリクエストを送信
-        response = client.chat.completions.create(
-            model="gpt-4",  # OpenAIの最新モデルを使用
-            messages=messages,
-            temperature=0.2,  # より決定論的な応答を促す
-            max_tokens=2000,  # 十分な長さの応答を確保
-            top_p=0.95        # 出力の多様性を若干制限
-        )
+        # 送信するとセッションの上限を超える場合は終了
+        if exceeds_budget(usage_tracker, prompt_tokens):
+            break
         
-        # LLMのレスポンスを取得
-        assistant_response = response.choices[0].message.content
+        # リクエストデータ（前回からの差分）をログに記録
+        stable_prefix, prefix_broken = record_request(request_recorder, messages, report, log_to_file)
+        
+        # LLMにリクエストを送信してレスポンスを取得（ツールは受信しながら実行を開始）
+        executor = ToolExecutor(defer_interactive=STREAM_RESPONSES)
+        response_usage = None
+        try:
+            cache_key, assistant_response = lookup_response(response_cache, messages)
+        except ResponseCacheMiss as e:
+            print(f"\n[cache] {str(e)}。replay モードのため終了します")
+            break
+        cached = assistant_response is not None
+        if cached:
+            with span("parse", "parse"):
+                calls = extract_tool_calls(assistant_response)
+            for call in calls:
+                executor.submit(call)
+        else:
+            try:
+                if STREAM_RESPONSES:
+                    assistant_response, response_usage = stream_completion(client, messages, executor, prompt_tokens)
+                else:
+                    assistant_response, response_usage = request_completion(client, messages, prompt_tokens)
+            except RetryLimitExceeded as e:
+                print(f"\n[scheduler] {str(e)}。終了します")
+                log_to_file("error", {"message": str(e), "attempts": e.attempts})
+                break
+            if not STREAM_RESPONSES:
+                with span("parse", "parse"):
+                    calls = extract_tool_calls(assistant_response)
+                for call in calls:
+                    executor.submit(call)
+        if response_cache and not cached:
+            response_cache.put(cache_key, assistant_response, MODEL_NAME)
         
         # レスポンスデータをログに記録
         log_to_file("response", assistant_response)
         
-        # レスポンスをパースしてツールを実行
-        tool_response, tool_type, complete_flag = parse_and_execute_tool(assistant_response)
+        # すべてのツールの実行結果を出現順に取得
+        with span("tools.finish", "tool"):
+            results = executor.finish()
         
-        # ツールの実行結果をメッセージに追加
-        messages.append({
-            "role": "assistant",
-            "content": assistant_response
-        })
+        # トークン使用量を記録
+        log_to_file("usage", record_usage(
+            usage_tracker, context, response_usage, cached, prompt_tokens, assistant_response,
+            results, stable_prefix, prefix_broken
+        ))
         
-        # ツールの実行結果をユーザーに表示
-        if tool_type != TOOL_TYPE_ASK_QUESTION and tool_type != TOOL_TYPE_EXECUTE_COMMAND:
-            print(f"\n[{tool_type}] {tool_response.message}")
-        
-        # ツールの実行に失敗した場合、AIに具体的なエラーと指示を返す
-        if not tool_response.success and tool_type == "":
-            error_message = "エラー: 有効なツールが見つかりませんでした。以下のいずれかのツールを使用してください: list_file, read_file, write_file, ask_question, execute_command, complete。適切なXML形式で回答してください。"
-            messages.append({
-                "role": "user",
-                "content": f"[Error] {error_message}"
-            })
-        else:
-            # ツールの実行結果をメッセージに追加
-            messages.append({
-                "role": "user",
-                "content": f"[{tool_type} Result] {tool_response.message}"
-            })
+        # レスポンスとツールの実行結果を会話履歴に追加（Completeツールが実行された場合はループを終了）
+        is_complete = append_turn(messages, assistant_response, results)
         
-        # ツールの実行結果をログに記録
-        log_to_file("tool_result", {
-            "tool_type": tool_type,
-            "message": tool_response.message,
-            "success": tool_response.success
-        })
+        # ツールの結果をログに記録し、完了したターンをチェックポイントに追記
+        record_turn_results(results, context, usage_tracker, checkpoint_writer, messages, written_paths(executor))
         
-        # Completeツールが実行された場合はループを終了
-        if complete_flag:
-            is_complete = True
+        # セッションの上限に達した場合は終了
+        if reached_budget(usage_tracker, is_complete):
+            break
+    
+    # セッションの終了をチェックポイントに記録（完了していなければ --resume で再開できる）
+    end_checkpoint(checkpoint_writer, request_recorder.session_id, is_complete, "main.py")
+    
+    report_session(usage_tracker, response_cache, artifacts)
+    shutdown()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
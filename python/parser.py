@@ -1,15 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import re
-import xml.etree.ElementTree as ET
-from typing import Tuple, Dict, Any
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Tuple, Dict, List, Union
 from tool import (
     list_file, read_file, write_file, ask_question, 
-    execute_command, complete, ToolResponse,
+    execute_command, complete, search, find_definition, read_artifact, ToolResponse,
     ListFileParams, ReadFileParams, WriteFileParams,
-    AskQuestionParams, ExecuteCommandParams, CompleteParams
+    AskQuestionParams, ExecuteCommandParams, CompleteParams, SearchParams,
+    FindDefinitionParams, ReadArtifactParams
 )
+from artifact_store import get_store
+from tracer import span
 
 # ツールの種類を表す定数
 TOOL_TYPE_LIST_FILE = "list_file"
@@ -18,10 +24,274 @@ TOOL_TYPE_WRITE_FILE = "write_file"
 TOOL_TYPE_ASK_QUESTION = "ask_question"
 TOOL_TYPE_EXECUTE_COMMAND = "execute_command"
 TOOL_TYPE_COMPLETE = "complete"
+TOOL_TYPE_SEARCH = "search"
+TOOL_TYPE_FIND_DEFINITION = "find_definition"
+TOOL_TYPE_READ_ARTIFACT = "read_artifact"
+
+TOOL_TYPES = (
+    TOOL_TYPE_LIST_FILE,
+    TOOL_TYPE_READ_FILE,
+    TOOL_TYPE_WRITE_FILE,
+    TOOL_TYPE_ASK_QUESTION,
+    TOOL_TYPE_EXECUTE_COMMAND,
+    TOOL_TYPE_COMPLETE,
+    TOOL_TYPE_SEARCH,
+    TOOL_TYPE_FIND_DEFINITION,
+    TOOL_TYPE_READ_ARTIFACT,
+)
+
+# 副作用が無く、並行して実行できるツール
+READ_ONLY_TOOL_TYPES = frozenset((
+    TOOL_TYPE_LIST_FILE, TOOL_TYPE_READ_FILE, TOOL_TYPE_SEARCH, TOOL_TYPE_FIND_DEFINITION,
+    TOOL_TYPE_READ_ARTIFACT
+))
+# ユーザーとの対話を伴うツール（ストリーミング中は受信完了まで実行を遅らせる）
+INTERACTIVE_TOOL_TYPES = frozenset((TOOL_TYPE_ASK_QUESTION, TOOL_TYPE_EXECUTE_COMMAND))
+
+# 読み取り専用ツールを並行実行するスレッド数
+TOOL_WORKERS = int(os.getenv("AGENT_TOOL_WORKERS", "4"))
+
+# ツールの開始タグ（ツールブロックの外側ではこれだけを探す）
+_TOOL_OPEN_PATTERN = re.compile(r'<(' + '|'.join(TOOL_TYPES) + r')>')
+_MAX_OPEN_TAG_LENGTH = max(len(t) for t in TOOL_TYPES) + 2
+
+# タグ名として扱う最大文字数（これより長いものは本文として読み飛ばす）
+_MAX_TAG_NAME_LENGTH = 64
+_TAG_NAME_PATTERN = re.compile(r'[a-z_]+')
+
+# パーサーの状態
+_STATE_TEXT = 0   # ツールブロックの外側
+_STATE_TOOL = 1   # ツールブロックの内側（パラメータの外側）
+_STATE_PARAM = 2  # パラメータの値（閉じタグまで生のテキストとして扱う）
+
+@dataclass
+class ToolCall:
+    tool_type: str
+    params: Dict[str, str] = field(default_factory=dict)
+
+class ToolCallParser:
+    """
+    LLMのレスポンスからツール呼び出しを取り出すインクリメンタルパーサー
+
+    チャンクを受け取るたびに未処理の部分だけを状態機械で1回走査するため、
+    レスポンス全体に対して線形時間で動作し、ストリームから直接入力できる。
+    パラメータの値は対応する閉じタグまでを生のテキストとして扱うので、
+    <content> に "<" や "&" を含むコードがあってもパースに失敗しない。
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._length = 0
+        # 未処理のテキストと、その先頭の位置
+        self._buffer = ""
+        self._offset = 0
+        self._state = _STATE_TEXT
+        # 開いているツールブロックの種類とパラメータ
+        self.tool_type = ""
+        self._params: Dict[str, str] = {}
+        self._param = ""
+        self._param_close = ""
+        self._value = []
+        # 最後に閉じたツールブロックの終了位置（閉じタグの直後）
+        self.end = -1
+
+    def feed(self, delta: str) -> List[ToolCall]:
+        """
+        受信したチャンクを追加する
+
+        Args:
+            delta: 新しく受信したテキスト
+
+        Returns:
+            List[ToolCall]: このチャンクで閉じたツール呼び出し
+        """
+        self._chunks.append(delta)
+        self._length += len(delta)
+        buffer = self._buffer + delta
+        size = len(buffer)
+        pos = 0
+        calls = []
+
+        while pos < size:
+            if self._state == _STATE_PARAM:
+                index = buffer.find(self._param_close, pos)
+                if index == -1:
+                    # 閉じタグがチャンクの境界で分断されている可能性がある分だけ残す
+                    safe = max(pos, size - len(self._param_close) + 1)
+                    self._value.append(buffer[pos:safe])
+                    pos = safe
+                    break
+                self._value.append(buffer[pos:index])
+                self._params[self._param] = "".join(self._value).strip()
+                self._value = []
+                self._state = _STATE_TOOL
+                pos = index + len(self._param_close)
+                continue
+
+            if self._state == _STATE_TEXT:
+                match = _TOOL_OPEN_PATTERN.search(buffer, pos)
+                if not match:
+                    # 開始タグがチャンクの境界で分断されている可能性がある分だけ残す
+                    pos = max(pos, size - _MAX_OPEN_TAG_LENGTH + 1)
+                    break
+                self._state = _STATE_TOOL
+                self.tool_type = match.group(1)
+                self._params = {}
+                pos = match.end()
+                continue
+
+            lt = buffer.find("<", pos)
+            if lt == -1:
+                pos = size
+                break
+            gt = buffer.find(">", lt + 1, lt + _MAX_TAG_NAME_LENGTH + 3)
+            if gt == -1:
+                if size - lt <= _MAX_TAG_NAME_LENGTH + 2:
+                    # タグの続きがまだ届いていない
+                    pos = lt
+                    break
+                pos = lt + 1
+                continue
+
+            name = buffer[lt + 1:gt]
+            pos = gt + 1
+            if name[:1] == "/" and name[1:] == self.tool_type:
+                calls.append(ToolCall(self.tool_type, self._params))
+                self.end = self._offset + pos
+                self._state = _STATE_TEXT
+                self.tool_type = ""
+                self._params = {}
+            elif _TAG_NAME_PATTERN.fullmatch(name):
+                self._state = _STATE_PARAM
+                self._param = name
+                self._param_close = f"</{name}>"
+            else:
+                pos = lt + 1
+
+        self._buffer = buffer[pos:]
+        self._offset += pos
+        return calls
+
+    @property
+    def text(self) -> str:
+        """これまでに受信したテキスト"""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    @property
+    def length(self) -> int:
+        """これまでに受信した文字数"""
+        return self._length
+
+def extract_tool_calls(response: str) -> List[ToolCall]:
+    """
+    レスポンスに含まれるツール呼び出しを出現順にすべて取り出す
+
+    Args:
+        response: LLMからのレスポンス文字列
+
+    Returns:
+        List[ToolCall]: ツール呼び出しのリスト（閉じていないブロックは含まない）
+    """
+    return ToolCallParser().feed(response)
+
+ToolResult = Tuple[ToolResponse, str, bool]
+
+_pool = None
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+    return _pool
+
+class ToolExecutor:
+    """
+    1つのレスポンスに含まれる複数のツールを出現順の意味を保ったまま実行する
+
+    読み取り専用のツールはスレッドプールで並行して実行し、それ以外のツールは
+    先行する読み取りがすべて終わってから順番に実行する。defer_interactive が
+    True の場合、ユーザーとの対話を伴うツールとそれ以降のツールは finish() が
+    呼ばれるまで実行しない（ストリーミング中に入力待ちにならないようにするため）。
+    complete 以降のツールは実行しない。
+    """
+
+    def __init__(self, defer_interactive: bool = False):
+        self.defer_interactive = defer_interactive
+        self.completed = False
+        # 実行する（または実行を予約した）ツール呼び出し
+        self.calls: List[ToolCall] = []
+        self._slots: List[Union[Future, ToolResult, ToolCall]] = []
+        self._running: List[Future] = []
+        self._deferred_from = -1
+
+    def submit(self, call: ToolCall):
+        """ツールの実行を開始する（または実行を予約する）"""
+        if self.completed:
+            return
+        if call.tool_type == TOOL_TYPE_COMPLETE:
+            self.completed = True
+        self.calls.append(call)
+
+        if self._deferred_from == -1 and self.defer_interactive and call.tool_type in INTERACTIVE_TOOL_TYPES:
+            self._deferred_from = len(self._slots)
+        if self._deferred_from != -1:
+            self._slots.append(call)
+            return
+        self._slots.append(self._run(call))
+
+    def finish(self) -> List[ToolResult]:
+        """
+        予約されたツールを実行し、すべての結果を出現順に返す
+
+        Returns:
+            List[ToolResult]: (ツールの実行結果, ツールの種類, 完了フラグ) のリスト
+        """
+        if self._deferred_from != -1:
+            for index in range(self._deferred_from, len(self._slots)):
+                self._slots[index] = self._run(self._slots[index])
+            self._deferred_from = -1
+        return [slot.result() if isinstance(slot, Future) else slot for slot in self._slots]
+
+    def _run(self, call: ToolCall) -> Union[Future, ToolResult]:
+        if call.tool_type in READ_ONLY_TOOL_TYPES:
+            # セッションの保存先やシェルのキー（session_context）をスレッドプールに引き継ぐ
+            future = _get_pool().submit(contextvars.copy_context().run, execute_tool, call)
+            self._running.append(future)
+            return future
+        # 副作用のあるツールは先行する読み取りが終わってから実行する
+        for future in self._running:
+            future.result()
+        self._running = []
+        return execute_tool(call)
+
+def format_tool_results(results: List[ToolResult]) -> str:
+    """ツールの実行結果を1つのメッセージにまとめる"""
+    return "\n\n".join(
+        f"[{tool_type} Result] {tool_response.message}"
+        for tool_response, tool_type, _ in results
+    )
+
+def parse_and_execute_tools(response: str) -> List[ToolResult]:
+    """
+    LLMのレスポンスに含まれるツールをすべて実行する
+
+    Args:
+        response: LLMからのレスポンス文字列
+
+    Returns:
+        List[ToolResult]: (ツールの実行結果, ツールの種類, 完了フラグ) のリスト。
+        ツールが見つからない場合は空のリスト
+    """
+    executor = ToolExecutor()
+    for call in extract_tool_calls(response):
+        executor.submit(call)
+    return executor.finish()
 
 def parse_and_execute_tool(response: str) -> Tuple[ToolResponse, str, bool]:
     """
-    LLMのレスポンスをパースしてツールを実行する
+    LLMのレスポンスをパースして最初のツールを実行する
     
     Args:
         response: LLMからのレスポンス文字列
@@ -29,32 +299,41 @@ def parse_and_execute_tool(response: str) -> Tuple[ToolResponse, str, bool]:
     Returns:
         Tuple[ToolResponse, str, bool]: ツールの実行結果、ツールの種類、完了フラグ
     """
-    # XMLタグを抽出する正規表現
-    pattern = r'<([a-z_]+)>([\s\S]*?)</\1>'
-    match = re.search(pattern, response)
+    calls = extract_tool_calls(response)
     
-    if not match:
+    if not calls:
         return ToolResponse(
             success=False,
             message="有効なツールが見つかりませんでした"
         ), "", False
     
-    tool_type = match.group(1)
-    tool_content = match.group(2)
+    return execute_tool(calls[0])
+
+def execute_tool(call: ToolCall) -> Tuple[ToolResponse, str, bool]:
+    """
+    ツール呼び出しを実行する
     
-    # XMLのパースを補助する関数
-    def parse_xml(content: str, tool_type: str) -> Dict[str, Any]:
-        try:
-            root = ET.fromstring(f"<{tool_type}>{content}</{tool_type}>")
-            result = {}
-            for child in root:
-                result[child.tag] = child.text.strip() if child.text else ""
-            return result
-        except Exception as e:
-            return {}
+    Args:
+        call: ツール呼び出し
+        
+    Returns:
+        Tuple[ToolResponse, str, bool]: ツールの実行結果、ツールの種類、完了フラグ
+    """
+    with span(call.tool_type, "tool"):
+        tool_response, tool_type, complete_flag = _execute_tool(call)
+        # 大きな結果はアーティファクトに保存してプレビューに置き換える（ReadArtifact の結果は上限以下）
+        store = get_store()
+        if store is not None and tool_type != TOOL_TYPE_READ_ARTIFACT:
+            message, artifact = store.offload(tool_type, tool_response.message)
+            if artifact is not None:
+                tool_response = ToolResponse(tool_response.success, message, artifact.artifact_id)
+        return tool_response, tool_type, complete_flag
+
+def _execute_tool(call: ToolCall) -> Tuple[ToolResponse, str, bool]:
+    tool_type = call.tool_type
+    params_dict = call.params
     
     if tool_type == TOOL_TYPE_LIST_FILE:
-        params_dict = parse_xml(tool_content, tool_type)
         params = ListFileParams(
             path=params_dict.get("path", ""),
             recursive=params_dict.get("recursive", "false")
@@ -62,29 +341,30 @@ def parse_and_execute_tool(response: str) -> Tuple[ToolResponse, str, bool]:
         return list_file(params), tool_type, False
     
     elif tool_type == TOOL_TYPE_READ_FILE:
-        params_dict = parse_xml(tool_content, tool_type)
         params = ReadFileParams(
-            path=params_dict.get("path", "")
+            path=params_dict.get("path", ""),
+            start_line=params_dict.get("start_line", ""),
+            end_line=params_dict.get("end_line", ""),
+            byte_offset=params_dict.get("byte_offset", ""),
+            byte_length=params_dict.get("byte_length", "")
         )
         return read_file(params), tool_type, False
     
     elif tool_type == TOOL_TYPE_WRITE_FILE:
-        params_dict = parse_xml(tool_content, tool_type)
         params = WriteFileParams(
             path=params_dict.get("path", ""),
-            content=params_dict.get("content", "")
+            content=params_dict.get("content", ""),
+            edit=params_dict.get("edit", "")
         )
         return write_file(params), tool_type, False
     
     elif tool_type == TOOL_TYPE_ASK_QUESTION:
-        params_dict = parse_xml(tool_content, tool_type)
         params = AskQuestionParams(
             question=params_dict.get("question", "")
         )
         return ask_question(params), tool_type, False
     
     elif tool_type == TOOL_TYPE_EXECUTE_COMMAND:
-        params_dict = parse_xml(tool_content, tool_type)
         params = ExecuteCommandParams(
             command=params_dict.get("command", ""),
             requires_approval=params_dict.get("requires_approval", "true")
@@ -92,12 +372,39 @@ def parse_and_execute_tool(response: str) -> Tuple[ToolResponse, str, bool]:
         return execute_command(params), tool_type, False
     
     elif tool_type == TOOL_TYPE_COMPLETE:
-        params_dict = parse_xml(tool_content, tool_type)
         params = CompleteParams(
             result=params_dict.get("result", "")
         )
         return complete(params), tool_type, True
     
+    elif tool_type == TOOL_TYPE_SEARCH:
+        params = SearchParams(
+            pattern=params_dict.get("pattern", ""),
+            path=params_dict.get("path", ""),
+            file_pattern=params_dict.get("file_pattern", ""),
+            ignore_case=params_dict.get("ignore_case", ""),
+            context_lines=params_dict.get("context_lines", ""),
+            max_results=params_dict.get("max_results", "")
+        )
+        return search(params), tool_type, False
+    
+    elif tool_type == TOOL_TYPE_FIND_DEFINITION:
+        params = FindDefinitionParams(
+            name=params_dict.get("name", ""),
+            references=params_dict.get("references", "")
+        )
+        return find_definition(params), tool_type, False
+    
+    elif tool_type == TOOL_TYPE_READ_ARTIFACT:
+        params = ReadArtifactParams(
+            id=params_dict.get("id", ""),
+            start_line=params_dict.get("start_line", ""),
+            end_line=params_dict.get("end_line", ""),
+            byte_offset=params_dict.get("byte_offset", ""),
+            byte_length=params_dict.get("byte_length", "")
+        )
+        return read_artifact(params), tool_type, False
+    
     else:
         return ToolResponse(
             success=False,
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ファイルの部分編集
+
+WriteFile の編集モードで受け取った SEARCH/REPLACE ブロック、または unified diff を
+ファイルの内容に適用し、一時ファイルと os.replace で置き換える。
+
+SEARCH/REPLACE ブロックの形式:
+    <<<<<<< SEARCH
+    変更前の内容
+    =======
+    変更後の内容
+    >>>>>>> REPLACE
+"""
+
+import os
+import re
+import shutil
+import secrets
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+SEARCH_MARKER = re.compile(r'^<{5,9} ?SEARCH\s*$')
+DIVIDER_MARKER = re.compile(r'^={5,9}\s*$')
+REPLACE_MARKER = re.compile(r'^>{5,9} ?REPLACE\s*$')
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+# 一時ファイルを作成するフラグ（既存のファイルは開かない。Windows では改行を変換しない）
+_TEMP_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+
+@dataclass
+class HunkResult:
+    index: int
+    applied: bool
+    message: str = ""
+
+@dataclass
+class PatchResult:
+    content: str
+    hunks: List[HunkResult] = field(default_factory=list)
+    error: str = ""
+
+    @property
+    def applied(self) -> List[HunkResult]:
+        return [h for h in self.hunks if h.applied]
+
+    @property
+    def failed(self) -> List[HunkResult]:
+        return [h for h in self.hunks if not h.applied]
+
+    def summary(self) -> str:
+        """適用結果を人間（とLLM）が読める形式にする"""
+        lines = [f"適用 {len(self.applied)}/{len(self.hunks)} ハンク"]
+        for hunk in self.hunks:
+            status = "適用" if hunk.applied else f"失敗: {hunk.message}"
+            lines.append(f"- ハンク{hunk.index}: {status}")
+        return "\n".join(lines)
+
+def is_unified_diff(edit: str) -> bool:
+    """編集内容が unified diff 形式かどうかを判定する"""
+    return any(HUNK_HEADER.match(line) for line in edit.splitlines())
+
+def parse_search_replace(edit: str) -> Tuple[List[Tuple[str, str]], str]:
+    """
+    SEARCH/REPLACE ブロックを取り出す
+
+    Returns:
+        Tuple[List[Tuple[str, str]], str]: (変更前, 変更後) のリストとエラーメッセージ
+    """
+    blocks = []
+    lines = edit.split("\n")
+    i = 0
+    while i < len(lines):
+        if not SEARCH_MARKER.match(lines[i]):
+            i += 1
+            continue
+        search, replace = [], []
+        i += 1
+        while i < len(lines) and not DIVIDER_MARKER.match(lines[i]):
+            search.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            return blocks, f"ブロック{len(blocks) + 1}に ======= がありません"
+        i += 1
+        while i < len(lines) and not REPLACE_MARKER.match(lines[i]):
+            replace.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            return blocks, f"ブロック{len(blocks) + 1}に >>>>>>> REPLACE がありません"
+        i += 1
+        blocks.append(("\n".join(search), "\n".join(replace)))
+    if not blocks:
+        return blocks, "SEARCH/REPLACE ブロックまたは unified diff が見つかりません"
+    return blocks, ""
+
+def _find_loose(content: str, search: str) -> Optional[Tuple[int, int]]:
+    """行末の空白の違いを無視して一致する範囲を探す（一致が1箇所の場合のみ）"""
+    search_lines = [line.rstrip() for line in search.split("\n")]
+    lines = content.split("\n")
+    stripped = [line.rstrip() for line in lines]
+    found = None
+    for start in range(len(lines) - len(search_lines) + 1):
+        if stripped[start:start + len(search_lines)] == search_lines:
+            if found is not None:
+                return None
+            found = start
+    if found is None:
+        return None
+    begin = sum(len(line) + 1 for line in lines[:found])
+    end = begin + sum(len(line) + 1 for line in lines[found:found + len(search_lines)]) - 1
+    return begin, end
+
+def apply_search_replace(content: str, blocks: List[Tuple[str, str]]) -> PatchResult:
+    """SEARCH/REPLACE ブロックを順に適用する"""
+    result = PatchResult(content)
+    for index, (search, replace) in enumerate(blocks, start=1):
+        if search == "":
+            # 変更前が空の場合は末尾に追加する
+            separator = "" if not result.content or result.content.endswith("\n") else "\n"
+            result.content += separator + replace + "\n"
+            result.hunks.append(HunkResult(index, True))
+            continue
+
+        count = result.content.count(search)
+        if count == 1:
+            result.content = result.content.replace(search, replace, 1)
+            result.hunks.append(HunkResult(index, True))
+            continue
+        if count > 1:
+            result.hunks.append(HunkResult(index, False, f"{count}箇所に一致したため特定できません。前後の行を含めてください"))
+            continue
+
+        span = _find_loose(result.content, search)
+        if span is None:
+            result.hunks.append(HunkResult(index, False, "一致する箇所が見つかりません"))
+            continue
+        begin, end = span
+        result.content = result.content[:begin] + replace + result.content[end:]
+        result.hunks.append(HunkResult(index, True))
+    return result
+
+def apply_unified_diff(content: str, diff: str) -> PatchResult:
+    """
+    unified diff を適用する
+
+    各ハンクは、ヘッダーの行番号（それまでのハンクによるずれを補正した位置）から
+    近い順に、変更前の行の並びと完全に一致する位置を探して適用する。
+    ハンクの中の "--- " / "+++" で始まる行は、ファイルのヘッダーではなく削除・追加する行として扱う:
+
+    >>> apply_unified_diff("a\\n-- old\\nb", "--- a/f.sql\\n+++ b/f.sql\\n@@ -1,3 +1,2 @@\\n a\\n--- old\\n b").content
+    'a\\nb'
+    >>> apply_unified_diff("i = 0;", "@@ -1 +1,2 @@\\n i = 0;\\n+++i;").content
+    'i = 0;\\n++i;'
+    """
+    result = PatchResult(content)
+    lines = content.split("\n")
+    hunks: List[Tuple[int, List[str], List[str]]] = []
+    current = None
+    # ヘッダーの行数のうち、まだ読んでいない変更前と変更後の行数
+    old_left = new_left = 0
+    for line in diff.split("\n"):
+        header = HUNK_HEADER.match(line)
+        if header:
+            current = (int(header.group(1)), [], [])
+            hunks.append(current)
+            old_left = int(header.group(2) or "1")
+            new_left = int(header.group(4) or "1")
+        elif current is None:
+            # 最初のハンクより前の行（--- / +++ のファイルのヘッダーなど）
+            continue
+        elif old_left <= 0 and new_left <= 0 and line.startswith(("---", "+++")):
+            # ハンクの行数を読み終えた後の --- / +++ は次のファイルのヘッダー
+            # （ハンクの中では "-- コメント" の削除や "++i;" の追加なので、行として扱う）
+            current = None
+        elif line.startswith("+"):
+            current[2].append(line[1:])
+            new_left -= 1
+        elif line.startswith("-"):
+            current[1].append(line[1:])
+            old_left -= 1
+        elif line.startswith(" ") or line == "":
+            current[1].append(line[1:])
+            current[2].append(line[1:])
+            old_left -= 1
+            new_left -= 1
+        elif line.startswith("\\"):
+            # "\ No newline at end of file"
+            continue
+
+    if not hunks:
+        result.error = "unified diff のハンクが見つかりません"
+        return result
+
+    shift = 0
+    for index, (old_start, old_lines, new_lines) in enumerate(hunks, start=1):
+        # 末尾の空行は diff の区切りとして現れることが多いので、一致しなければ外して探す
+        while old_lines and new_lines and old_lines[-1] == "" and new_lines[-1] == "" \
+                and _locate(lines, old_lines, old_start - 1 + shift) is None:
+            old_lines = old_lines[:-1]
+            new_lines = new_lines[:-1]
+        position = _locate(lines, old_lines, old_start - 1 + shift)
+        if position is None:
+            result.hunks.append(HunkResult(index, False, f"{old_start}行目付近に変更前の行と一致する箇所が見つかりません"))
+            continue
+        lines[position:position + len(old_lines)] = new_lines
+        shift += len(new_lines) - len(old_lines)
+        result.hunks.append(HunkResult(index, True))
+    result.content = "\n".join(lines)
+    return result
+
+def _locate(lines: List[str], block: List[str], expected: int) -> Optional[int]:
+    """expected に近い順に block と一致する位置を探す"""
+    if not block:
+        return min(max(expected, 0), len(lines))
+    last = len(lines) - len(block)
+    expected = min(max(expected, 0), max(last, 0))
+    for distance in range(max(expected, last - expected) + 1):
+        for position in (expected - distance, expected + distance):
+            if 0 <= position <= last and lines[position:position + len(block)] == block:
+                return position
+    return None
+
+def apply_edit(content: str, edit: str) -> PatchResult:
+    """編集内容の形式を判定して適用する"""
+    if is_unified_diff(edit):
+        return apply_unified_diff(content, edit)
+    blocks, error = parse_search_replace(edit)
+    if error and not blocks:
+        return PatchResult(content, error=error)
+    result = apply_search_replace(content, blocks)
+    result.error = error
+    return result
+
+def read_text_preserving_newlines(path: str, encoding: str = "utf-8") -> Tuple[str, str]:
+    """
+    ファイルを読み取り、改行を "\\n" に揃えた内容と元の改行コードを返す
+    """
+    with open(path, "r", encoding=encoding, newline="") as f:
+        raw = f.read()
+    newline = "\r\n" if "\r\n" in raw else "\n"
+    return raw.replace("\r\n", "\n"), newline
+
+def _create_temp(directory: str, name: str) -> Tuple[int, str]:
+    """
+    directory に一時ファイルを作成し、ファイル記述子とパスを返す
+
+    mkstemp は所有者だけが読み書きできる権限で作成するため、0o666 で作成して
+    通常の新規ファイルと同じく umask を適用させる。
+    """
+    while True:
+        temp_path = os.path.join(directory, f".tmp-{secrets.token_hex(8)}{name}")
+        try:
+            return os.open(temp_path, _TEMP_FLAGS, 0o666), temp_path
+        except FileExistsError:
+            continue
+
+def atomic_write(path: str, content: str, encoding: str = "utf-8", newline: str = "\n"):
+    """
+    同じディレクトリの一時ファイルに書き込んでから os.replace で置き換える
+
+    書き込みの途中で失敗しても、元のファイルが壊れた状態で残ることはない。
+    シンボリックリンクの場合はリンク先のファイルを置き換え、元のファイルの権限を引き継ぐ。
+    ハードリンクが複数あるファイルは、置き換えるとリンクが切れるため一時ファイルを経由せずに上書きする。
+    """
+    # シンボリックリンクはリンク自体ではなくリンク先を置き換える
+    path = os.path.realpath(path)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        stat = None
+    if stat is not None and stat.st_nlink > 1:
+        # 置き換えると他のハードリンクと別のファイルになるため、そのまま上書きする
+        with open(path, "w", encoding=encoding, newline=newline) as f:
+            f.write(content)
+        return
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = _create_temp(directory, os.path.basename(path))
+    try:
+        with os.fdopen(fd, "w", encoding=encoding, newline=newline) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if stat is not None:
+            shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
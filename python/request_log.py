@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+リクエストの差分ログ
+
+毎ターン会話履歴全体を記録する代わりに、前回記録した時点からの差分
+（追加されたメッセージと書き換えられたメッセージ）だけを記録する。
+任意のターンのリクエストは、そのターンまでの差分を順に適用して復元する。
+
+使用例:
+    python request_log.py logs/agent_log_20250329.jsonl --session <セッションID> --turn 3
+"""
+
+import argparse
+import json
+import sys
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# ログエントリの種類
+LOG_TYPE_REQUEST_DELTA = "request_delta"
+
+def new_session_id() -> str:
+    """新しいセッションIDを生成する"""
+    return uuid.uuid4().hex
+
+class RequestDeltaRecorder:
+    """
+    会話履歴の差分を計算する
+
+    前回記録したメッセージの参照を保持し、同一オブジェクトかどうかで
+    変更の有無を判定するため、比較のためにメッセージ本文を走査しない。
+    """
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id or new_session_id()
+        self.turn = 0
+        # 前回記録した (メッセージ, 本文) の組
+        self._logged: List[tuple] = []
+        # 次の差分で会話履歴全体を記録し直す（再開したセッションで前回の記録がない場合）
+        self._reset = False
+
+    def resume(self, turn: int, messages: Optional[List[Dict[str, Any]]] = None):
+        """
+        再開したセッションのターン番号から続けて記録する
+
+        Args:
+            turn: 最後に記録したターン番号
+            messages: 前回記録した時点の会話履歴。省略した場合は次の差分で全体を記録し直す
+        """
+        self.turn = turn
+        if messages is None:
+            self._logged = []
+            self._reset = True
+        else:
+            self._logged = [(m, m.get("content")) for m in messages]
+
+    def record(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        前回からの差分を計算してログに書き込むデータを返す
+
+        Args:
+            messages: 今回送信する会話履歴
+
+        Returns:
+            Dict[str, Any]: 差分ログのデータ
+        """
+        self.turn += 1
+        replaced = []
+        common = min(len(self._logged), len(messages))
+        for index in range(common):
+            message = messages[index]
+            logged_message, logged_content = self._logged[index]
+            if message is not logged_message or message.get("content") is not logged_content:
+                replaced.append({"index": index, "message": message})
+
+        appended = messages[common:]
+        self._logged = [(m, m.get("content")) for m in messages]
+
+        delta = {
+            "session_id": self.session_id,
+            "turn": self.turn,
+            "length": len(messages),
+            "replaced": replaced,
+            "appended": appended
+        }
+        if self._reset:
+            delta["reset"] = True
+            self._reset = False
+        return delta
+
+def apply_delta(messages: List[Dict[str, Any]], delta: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """差分を会話履歴に適用する"""
+    if delta.get("reset"):
+        messages.clear()
+    for item in delta.get("replaced", []):
+        messages[item["index"]] = item["message"]
+    messages.extend(delta.get("appended", []))
+    del messages[delta["length"]:]
+    return messages
+
+def iter_deltas(lines: Iterable[str], session_id: str) -> Iterator[Dict[str, Any]]:
+    """ログの各行から指定セッションの差分を順に取り出す"""
+    for line in lines:
+        if LOG_TYPE_REQUEST_DELTA not in line or session_id not in line:
+            # JSONとして解析する前に無関係な行を読み飛ばす
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if entry.get("type") != LOG_TYPE_REQUEST_DELTA:
+            continue
+        data = entry.get("data") or {}
+        if data.get("session_id") == session_id:
+            yield data
+
+def rebuild_request(log_paths: Iterable[str], session_id: str, turn: int) -> List[Dict[str, Any]]:
+    """
+    指定したターンで送信したリクエストを復元する
+
+    Args:
+        log_paths: ログファイルのパス（日付をまたぐセッションは複数を日付順に指定）
+        session_id: セッションID
+        turn: ターン番号（1始まり）
+
+    Returns:
+        List[Dict[str, Any]]: そのターンで送信した会話履歴
+    """
+    messages: List[Dict[str, Any]] = []
+    for path in log_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for delta in iter_deltas(f, session_id):
+                if delta["turn"] > turn:
+                    return messages
+                apply_delta(messages, delta)
+                if delta["turn"] == turn:
+                    return messages
+    raise ValueError(f"セッション {session_id} のターン {turn} が見つかりません")
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="差分ログから任意のターンのリクエストを復元します")
+    parser.add_argument("log_files", nargs="+", help="ログファイル（日付順）")
+    parser.add_argument("--session", required=True, help="セッションID")
+    parser.add_argument("--turn", type=int, required=True, help="ターン番号（1始まり）")
+    args = parser.parse_args(argv)
+
+    try:
+        messages = rebuild_request(args.log_files, args.session, args.turn)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(messages, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+LLM のレスポンスのディスクキャッシュ
+
+モデル名、サンプリングパラメータ、会話履歴から安定したハッシュ（sha256）を計算し、
+それをキーにレスポンスをファイルに保存する。同じタスクを再実行したときに、
+同じリクエストは API を呼び出さずに保存済みのレスポンスを返す。
+
+モード（環境変数 AGENT_RESPONSE_CACHE）:
+    off    : 使用しない（既定）
+    on     : キャッシュにあれば使い、無ければ API を呼び出して保存する
+    replay : 読み取り専用。キャッシュに無いリクエストはエラーにする（API は呼び出さない）
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from patcher import atomic_write
+
+CACHE_MODE_OFF = "off"
+CACHE_MODE_ON = "on"
+CACHE_MODE_REPLAY = "replay"
+
+DEFAULT_CACHE_DIR = os.path.join(".agent_cache", "responses")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 上限を超えたときにこの割合まで削除する（保存のたびに削除が走らないようにするため）
+_EVICT_TO_RATIO = 0.9
+# キーの計算方法を変えたときに古いエントリを使わないようにするための版数
+_KEY_VERSION = 1
+
+class ResponseCacheMiss(Exception):
+    """replay モードでキャッシュに無いリクエストを送ろうとした"""
+
+def make_key(model: str, params: Dict[str, Any], messages: List[Dict[str, str]]) -> str:
+    """
+    リクエストのキーを計算する
+
+    メッセージは role と content だけを使い、キーの順序に依存しない JSON にしてからハッシュする。
+
+    Args:
+        model: モデル名
+        params: サンプリングパラメータ（temperature など）
+        messages: 会話履歴
+
+    Returns:
+        str: sha256 の16進文字列
+    """
+    payload = {
+        "version": _KEY_VERSION,
+        "model": model,
+        "params": params,
+        "messages": [{"role": m.get("role"), "content": m.get("content")} for m in messages]
+    }
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    レスポンスのディスクキャッシュ
+
+    1つのレスポンスを1つのファイル（<ディレクトリ>/<キーの先頭2文字>/<キー>.json）に保存する。
+    合計サイズが上限を超えたら、最後に使われた日時（ファイルの更新日時）が古いものから削除する。
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 read_only: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        # パス -> サイズ（最初に保存するときに読み込む）
+        self._sizes: Optional[Dict[str, int]] = None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """環境変数から設定を読み込んで生成する（off の場合は None）"""
+        mode = os.getenv("AGENT_RESPONSE_CACHE", CACHE_MODE_OFF).lower()
+        if mode not in (CACHE_MODE_ON, CACHE_MODE_REPLAY):
+            return None
+        return cls(
+            directory=os.getenv("AGENT_RESPONSE_CACHE_DIR", DEFAULT_CACHE_DIR),
+            max_bytes=int(os.getenv("AGENT_RESPONSE_CACHE_BYTES", str(DEFAULT_MAX_BYTES))),
+            read_only=mode == CACHE_MODE_REPLAY
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        保存済みのレスポンスを返す
+
+        Args:
+            key: make_key で計算したキー
+
+        Returns:
+            Optional[str]: レスポンス。無い場合は None
+
+        Raises:
+            ResponseCacheMiss: replay モードでキャッシュに無い場合
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        with self._lock:
+            if entry is None or entry.get("key") != key:
+                self.misses += 1
+                if self.read_only:
+                    raise ResponseCacheMiss(f"キャッシュに無いリクエストです（キー: {key}）")
+                return None
+            self.hits += 1
+        if not self.read_only:
+            # 削除の順序を決めるため、使った日時を更新日時として記録する
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return entry["response"]
+
+    def put(self, key: str, response: str, model: str = ""):
+        """
+        レスポンスを保存する（replay モードでは何もしない）
+
+        Args:
+            key: make_key で計算したキー
+            response: レスポンス
+            model: モデル名（確認用に記録する）
+        """
+        if self.read_only:
+            return
+        path = self._path(key)
+        data = json.dumps({
+            "key": key,
+            "model": model,
+            "created": time.time(),
+            "response": response
+        }, ensure_ascii=False)
+        atomic_write(path, data)
+        with self._lock:
+            sizes = self._load_sizes()
+            sizes[path] = len(data.encode("utf-8"))
+            if sum(sizes.values()) > self.max_bytes:
+                self._evict(sizes)
+
+    def _load_sizes(self) -> Dict[str, int]:
+        if self._sizes is None:
+            self._sizes = {}
+            for current, _, names in os.walk(self.directory):
+                for name in names:
+                    if name.endswith(".json"):
+                        path = os.path.join(current, name)
+                        try:
+                            self._sizes[path] = os.path.getsize(path)
+                        except OSError:
+                            pass
+        return self._sizes
+
+    def _evict(self, sizes: Dict[str, int]):
+        """使われた日時が古いものから、上限の9割に収まるまで削除する"""
+        entries = []
+        for path in sizes:
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                entries.append((0.0, path))
+        total = sum(sizes.values())
+        target = self.max_bytes * _EVICT_TO_RATIO
+        for _, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= sizes.pop(path)
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・ミスの回数を返す"""
+        with self._lock:
+            return {
+                "mode": CACHE_MODE_REPLAY if self.read_only else CACHE_MODE_ON,
+                "hits": self.hits,
+                "misses": self.misses
+            }
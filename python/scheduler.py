@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+LLM へのリクエストのスケジューラー
+
+モデルの呼び出しの前に次の2つのトークンバケットで送信を待たせ、複数のセッションの合計が
+1分あたりのリクエスト数（AGENT_RATE_LIMIT_RPM）とトークン数（AGENT_RATE_LIMIT_TPM）を超えないようにする。
+送信を待っているリクエストは、セッションごとの順番（各セッションの何番目のリクエストか）が小さいものから
+送信するため、リクエストの多いセッションが他のセッションを待たせ続けることはない。
+
+429（レート制限）・408・409・5xx と接続エラーは、Retry-After（retry-after-ms）を優先し、
+なければジッター付きの指数バックオフで待って送り直す（最大 AGENT_MAX_RETRIES 回）。429 の場合は
+同じクォータを使う他のセッションも同じ時間だけ送信を止める。送り直しは API クライアントの
+組み込みの再試行と重ならないよう、クライアントは max_retries=0 で作成する。
+
+トークン数は送信前に推定値（プロンプト + max_tokens）で予約し、応答の usage を受信したら実際の値で精算する。
+失敗した送信の予約は送り直す前に戻す。
+待ち行列の長さ・待ち時間・再試行の回数は stats() で取得できる。
+"""
+
+import os
+import time
+import random
+import asyncio
+import datetime
+import threading
+import itertools
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 送り直すステータスコード（5xx も送り直す）
+RETRYABLE_STATUS = {408, 409, 429}
+# 待ち行列の先頭でないリクエストが状態を確認し直す間隔（秒。asyncio 版のみ）
+_POLL_INTERVAL = 0.05
+
+class RetryLimitExceeded(Exception):
+    """送り直しても成功しなかったことを示す例外（最後のエラーを error に保持する）"""
+
+    def __init__(self, attempts: int, error: BaseException):
+        super().__init__(f"{attempts}回送信しても成功しませんでした: {str(error)}")
+        self.attempts = attempts
+        self.error = error
+
+class TokenBucket:
+    """
+    1分あたりの量を上限とするトークンバケット（rate_per_minute が 0 の場合は無制限）
+
+    容量は1分ぶん。take() は残量を超えて消費でき、不足分は以降の補充で返す。
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """amount を消費できるまでの秒数（容量を超える量は容量まで待つ）"""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        needed = min(amount, self.capacity) - self.level
+        return needed / self.rate if needed > 0 else 0.0
+
+    def take(self, amount: float, now: float):
+        if not self.unlimited:
+            self._refill(now)
+            self.level -= amount
+
+    def give_back(self, amount: float):
+        """予約した量のうち使わなかった分を戻す（負の値の場合は追加で消費する）"""
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + amount)
+
+@dataclass(order=True)
+class _Ticket:
+    # セッションの中での順番（小さいものから送信する）と到着順
+    round: int
+    seq: int
+    key: str = field(compare=False)
+    tokens: int = field(compare=False)
+    enqueued: float = field(compare=False)
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """エラーの応答の Retry-After（retry-after-ms）ヘッダーの秒数（ない場合は None）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (date - datetime.datetime.now(date.tzinfo)).total_seconds())
+
+def is_retryable(error: BaseException) -> bool:
+    """送り直すエラーかどうか（レート制限・一時的なサーバーエラー・接続エラー）"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    # openai の APIConnectionError（APITimeoutError を含む）。openai は呼び出し元で読み込み済み
+    try:
+        from openai import APIConnectionError
+    except ImportError:
+        return False
+    return isinstance(error, APIConnectionError)
+
+class RequestScheduler:
+    """
+    リクエストの送信を待たせ、失敗したリクエストを送り直す
+
+    同期版の call() と asyncio 版の call_async() のどちらも同じ待ち行列とバケットを使用する。
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._queue: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._rounds: Dict[str, int] = {}
+        self._current_round = 0
+        # 429 を受け取った場合に、すべてのセッションの送信を止める期限
+        self._paused_until = 0.0
+        self._stats = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failed": 0,
+            "max_queue_depth": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "backoff_seconds": 0.0
+        }
+
+    @classmethod
+    def from_env(cls) -> "RequestScheduler":
+        """環境変数から設定を読み込んで生成する"""
+        return cls(
+            requests_per_minute=float(os.getenv("AGENT_RATE_LIMIT_RPM", "0")),
+            tokens_per_minute=float(os.getenv("AGENT_RATE_LIMIT_TPM", "0")),
+            max_retries=int(os.getenv("AGENT_MAX_RETRIES", "5")),
+            base_delay=float(os.getenv("AGENT_RETRY_BASE_DELAY", "1.0")),
+            max_delay=float(os.getenv("AGENT_RETRY_MAX_DELAY", "60"))
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        """送信を待っているリクエストの数"""
+        with self._lock:
+            return len(self._queue)
+
+    def _enqueue(self, key: str, tokens: int) -> _Ticket:
+        with self._lock:
+            # しばらく送信していなかったセッションが溜めた順番で割り込まないよう、現在の順番から始める
+            round_ = max(self._rounds.get(key, 0), self._current_round)
+            self._rounds[key] = round_ + 1
+            ticket = _Ticket(round_, next(self._seq), key, tokens, time.monotonic())
+            self._queue.append(ticket)
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._queue))
+            return ticket
+
+    def _try_dispatch(self, ticket: _Ticket) -> Optional[float]:
+        """
+        ticket を送信できれば予約して None を、できなければ待つ秒数を返す（ロックを取得して呼び出す）
+
+        待ち行列の先頭でない場合は、先頭が送信されるまでの秒数が分からないため 0 を返す。
+        """
+        if min(self._queue) is not ticket:
+            return 0.0
+        now = time.monotonic()
+        wait = max(
+            self._paused_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(ticket.tokens, now)
+        )
+        if wait > 0:
+            return wait
+        self.requests.take(1, now)
+        self.tokens.take(ticket.tokens, now)
+        self._queue.remove(ticket)
+        self._current_round = ticket.round
+        waited = now - ticket.enqueued
+        self._stats["requests"] += 1
+        self._stats["wait_seconds"] += waited
+        self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        self._changed.notify_all()
+        return None
+
+    def _cancel(self, ticket: _Ticket):
+        with self._lock:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                self._changed.notify_all()
+
+    def acquire(self, key: str = "default", tokens: int = 0):
+        """送信できるまで待ってからトークン数を予約する"""
+        ticket = self._enqueue(key, tokens)
+        try:
+            with self._lock:
+                while True:
+                    wait = self._try_dispatch(ticket)
+                    if wait is None:
+                        return
+                    self._changed.wait(timeout=wait or None)
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+    async def acquire_async(self, key: str = "default", tokens: int = 0):
+        """acquire() の asyncio 版（先頭でない間は一定の間隔で確認し直す）"""
+        ticket = self._enqueue(key, tokens)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_dispatch(ticket)
+                if wait is None:
+                    return
+                await asyncio.sleep(wait or _POLL_INTERVAL)
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+    def settle(self, reserved: int, actual: Optional[int]):
+        """予約したトークン数を実際の使用量で精算する（使用量が分からない場合は何もしない）"""
+        if actual is None:
+            return
+        with self._lock:
+            self.tokens.give_back(reserved - actual)
+            self._changed.notify_all()
+
+    def _refund(self, reserved: int):
+        """失敗した送信の予約を戻す（送り直すたびに予約し直すため、戻さないと二重に消費する）"""
+        with self._lock:
+            self.tokens.give_back(reserved)
+            self._changed.notify_all()
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        """
+        送り直すまでの秒数
+
+        Retry-After があればその秒数（複数のセッションが同時に送り直さないよう最大10%のジッターを加える）、
+        なければ上限付きの指数バックオフの半分から全体までの乱数。429 の場合はすべてのセッションの送信を止める。
+        """
+        delay = retry_after(error)
+        if delay is not None:
+            delay *= 1 + random.random() * 0.1
+        else:
+            ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+            delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+        with self._lock:
+            self._stats["retries"] += 1
+            self._stats["backoff_seconds"] += delay
+            if getattr(error, "status_code", None) == 429:
+                self._stats["rate_limited"] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def _give_up(self, attempt: int, error: BaseException) -> bool:
+        """送り直さずにエラーにするかどうか"""
+        if is_retryable(error) and attempt < self.max_retries:
+            return False
+        with self._lock:
+            self._stats["failed"] += 1
+        return True
+
+    def call(self, func: Callable[[], T], key: str = "default", tokens: int = 0) -> T:
+        """
+        送信できるまで待ってから func を呼び出し、一時的なエラーの場合は送り直す
+
+        Args:
+            func: API を呼び出す関数
+            key: セッションのキー（公平に送信する単位）
+            tokens: 予約するトークン数の推定値
+
+        Returns:
+            func の戻り値
+
+        Raises:
+            RetryLimitExceeded: 送り直しても成功しなかった場合（送り直さないエラーはそのまま送出する）
+        """
+        for attempt in itertools.count():
+            self.acquire(key, tokens)
+            try:
+                return func()
+            except Exception as e:
+                self._refund(tokens)
+                if self._give_up(attempt, e):
+                    if attempt > 0:
+                        raise RetryLimitExceeded(attempt + 1, e) from e
+                    raise
+                time.sleep(self._backoff(attempt, e))
+
+    async def call_async(self, func: Callable[[], Awaitable[T]], key: str = "default", tokens: int = 0) -> T:
+        """call() の asyncio 版（func はコルーチンを返す関数）"""
+        for attempt in itertools.count():
+            await self.acquire_async(key, tokens)
+            try:
+                return await func()
+            except Exception as e:
+                self._refund(tokens)
+                if self._give_up(attempt, e):
+                    if attempt > 0:
+                        raise RetryLimitExceeded(attempt + 1, e) from e
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+
+    def stats(self) -> Dict[str, Any]:
+        """待ち行列の長さ・待ち時間・再試行の回数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._queue)
+        stats["avg_wait_seconds"] = stats["wait_seconds"] / stats["requests"] if stats["requests"] else 0.0
+        for name in ("wait_seconds", "max_wait_seconds", "backoff_seconds", "avg_wait_seconds"):
+            stats[name] = round(stats[name], 3)
+        return stats
+
+# プロセスで共有するスケジューラー（同じ API キーのクォータを使うすべてのセッションで共有する）
+request_scheduler = RequestScheduler.from_env()
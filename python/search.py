@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ワークスペースの全文検索
+
+ワークスペースインデックスから対象ファイルを取り出し（.gitignore で除外されたものは含まない）、
+ファイルをまとまりごとにプロセスプールへ渡して、コンパイル済みの正規表現で検索する。
+結果はファイルの順に1ファイルずつ返し、一致した行数が上限に達したら残りの検索を取り消す。
+"""
+
+import fnmatch
+import os
+import re
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+
+from workspace_index import list_directory
+
+# 返す一致行数の上限（既定値）
+SEARCH_MAX_RESULTS = int(os.getenv("AGENT_SEARCH_MAX_RESULTS", "100"))
+# 検索に使うプロセス数
+SEARCH_WORKERS = int(os.getenv("AGENT_SEARCH_WORKERS", str(os.cpu_count() or 1)))
+# これより大きいファイルは検索しない（バイト）
+SEARCH_MAX_FILE_BYTES = 4 * 1024 * 1024
+# ファイル数がこれ未満の場合はプロセスプールを使わずにその場で検索する
+_PARALLEL_MIN_FILES = 200
+# 1つのタスクで検索するファイル数の下限
+_MIN_CHUNK_FILES = 16
+# この長さを超える行は切り詰めて表示する（圧縮された JS などで結果が膨らまないように）
+_MAX_LINE_CHARS = 300
+# 先頭のこのバイト数に NUL を含むファイルはバイナリとみなす
+_BINARY_CHECK_BYTES = 8192
+
+@dataclass
+class FileMatches:
+    path: str
+    # 連続する行のまとまり。各行は (行番号, 一致した行かどうか, 内容)
+    blocks: List[List[Tuple[int, bool, str]]] = field(default_factory=list)
+    count: int = 0
+
+@dataclass
+class SearchResult:
+    files: List[FileMatches] = field(default_factory=list)
+    total_matches: int = 0
+    files_searched: int = 0
+    # 上限に達したため検索を打ち切った場合は True
+    truncated: bool = False
+
+    def format(self, pattern: str) -> str:
+        """grep と同じ形式（一致行は "パス:行番号:"、前後の行は "パス-行番号-"）で整形する"""
+        if not self.files:
+            return f"パターン '{pattern}' に一致する行は見つかりませんでした（{self.files_searched}ファイルを検索）"
+        lines = [f"パターン '{pattern}' の検索結果: {self.total_matches}行（{len(self.files)}ファイル）"]
+        for matches in self.files:
+            for block in matches.blocks:
+                for number, is_match, text in block:
+                    separator = ":" if is_match else "-"
+                    lines.append(f"{matches.path}{separator}{number}{separator} {text}")
+                lines.append("--")
+        if self.truncated:
+            lines.append(f"上限の{self.total_matches}行に達したため検索を打ち切りました。パターンやパスを絞り込んでください")
+        return "\n".join(lines)
+
+@lru_cache(maxsize=32)
+def _compile(pattern: str, flags: int) -> "re.Pattern":
+    return re.compile(pattern, flags)
+
+def _prefilter(pattern: str, flags: int) -> Optional["re.Pattern"]:
+    """ファイル全体に対して一致を確かめる正規表現（行ごとに照合する ^ と $ が各行で一致するよう MULTILINE を付ける）
+
+    \\A と \\Z は MULTILINE でもファイルの先頭と末尾にしか一致しないため、その場合は使わない（None）。
+    """
+    if "\\A" in pattern or "\\Z" in pattern:
+        return None
+    return _compile(pattern, flags | re.MULTILINE)
+
+def _search_file(regex: "re.Pattern", prefilter: Optional["re.Pattern"], path: str, context: int,
+                 limit: int) -> Optional[FileMatches]:
+    try:
+        with open(path, "rb") as f:
+            data = f.read(SEARCH_MAX_FILE_BYTES + 1)
+    except OSError:
+        return None
+    if len(data) > SEARCH_MAX_FILE_BYTES or b"\0" in data[:_BINARY_CHECK_BYTES]:
+        return None
+    # 行は read_file と同じく \n で区切る（CRLF の \r は取り除き、$ が行末に一致するようにする）
+    text = data.decode("utf-8", errors="replace").replace("\r\n", "\n")
+    # 一致しないファイルは行に分割せずに読み飛ばす
+    if prefilter is not None and prefilter.search(text) is None:
+        return None
+
+    lines = text.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    hits = []
+    for number, line in enumerate(lines):
+        if regex.search(line):
+            hits.append(number)
+            if len(hits) >= limit:
+                break
+    if not hits:
+        return None
+
+    matches = FileMatches(path, count=len(hits))
+    hit_set = set(hits)
+    block_end = -1
+    for number in hits:
+        start = max(0, number - context)
+        end = min(len(lines), number + context + 1)
+        if start > block_end:
+            matches.blocks.append([])
+        else:
+            start = block_end
+        block = matches.blocks[-1]
+        for index in range(start, end):
+            line = lines[index]
+            if len(line) > _MAX_LINE_CHARS:
+                line = line[:_MAX_LINE_CHARS] + "..."
+            block.append((index + 1, index in hit_set, line))
+        block_end = end
+    return matches
+
+def _search_chunk(pattern: str, flags: int, paths: List[str], context: int, limit: int) -> List[FileMatches]:
+    """プロセスプールで実行する（ファイルのまとまりを検索し、一致したファイルだけを返す）"""
+    regex = _compile(pattern, flags)
+    prefilter = _prefilter(pattern, flags)
+    results = []
+    for path in paths:
+        matches = _search_file(regex, prefilter, path, context, limit)
+        if matches is not None:
+            results.append(matches)
+            limit -= matches.count
+            if limit <= 0:
+                break
+    return results
+
+_pool: Optional[Executor] = None
+
+def _get_pool() -> Executor:
+    global _pool
+    if _pool is None:
+        # multiprocessing の読み込みは起動時間に響くため、初めて並列に検索するときに読み込む
+        from concurrent.futures import ProcessPoolExecutor
+        _pool = ProcessPoolExecutor(max_workers=max(1, SEARCH_WORKERS))
+    return _pool
+
+def _collect_files(path: str, file_pattern: str) -> List[str]:
+    _, files = list_directory(path, recursive=True)
+    if file_pattern:
+        patterns = [p.strip() for p in file_pattern.split(",") if p.strip()]
+        files = [f for f in files if any(
+            fnmatch.fnmatch(f.replace(os.sep, "/") if "/" in p else os.path.basename(f), p) for p in patterns
+        )]
+    return [os.path.join(path, f) for f in files]
+
+def iter_search(pattern: str, path: str = ".", file_pattern: str = "", ignore_case: bool = False,
+                context: int = 2, limit: int = SEARCH_MAX_RESULTS) -> Iterator[FileMatches]:
+    """
+    一致したファイルをファイルの順に1つずつ返す
+
+    Args:
+        pattern: 正規表現
+        path: 検索するディレクトリ
+        file_pattern: 対象ファイル名のパターン（例: "*.py"。カンマ区切りで複数指定可能）
+        ignore_case: 大文字と小文字を区別しないかどうか
+        context: 一致した行の前後に表示する行数
+        limit: 一致した行数の上限
+
+    Returns:
+        Iterator[FileMatches]: 一致したファイルと行（ファイルの順）
+    """
+    flags = re.IGNORECASE if ignore_case else 0
+    # パターンの誤りはプロセスプールに渡す前にここで例外にする
+    _compile(pattern, flags)
+    files = _collect_files(path, file_pattern)
+    return _iter_matches(pattern, flags, files, context, limit)
+
+def _iter_matches(pattern: str, flags: int, files: List[str], context: int, limit: int) -> Iterator[FileMatches]:
+    if len(files) < _PARALLEL_MIN_FILES or SEARCH_WORKERS <= 1:
+        yield from _search_chunk(pattern, flags, files, context, limit)
+        return
+
+    chunk_size = max(_MIN_CHUNK_FILES, -(-len(files) // (SEARCH_WORKERS * 4)))
+    futures = [
+        _get_pool().submit(_search_chunk, pattern, flags, files[i:i + chunk_size], context, limit)
+        for i in range(0, len(files), chunk_size)
+    ]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        # 上限に達して途中で終了した場合は、まだ始まっていない検索を取り消す
+        for future in futures:
+            future.cancel()
+
+def search(pattern: str, path: str = ".", file_pattern: str = "", ignore_case: bool = False,
+           context: int = 2, limit: int = SEARCH_MAX_RESULTS) -> SearchResult:
+    """
+    ワークスペースを検索し、一致した行が limit 行に達したところで打ち切る
+
+    引数は iter_search と同じ。
+
+    Returns:
+        SearchResult: 検索結果
+    """
+    flags = re.IGNORECASE if ignore_case else 0
+    _compile(pattern, flags)
+    files = _collect_files(path, file_pattern)
+    limit = max(1, limit)
+    result = SearchResult(files_searched=len(files))
+    # 上限を超える一致が残っているかどうかを判定するため、1行多く探す
+    matches_iter = _iter_matches(pattern, flags, files, context, limit + 1)
+    try:
+        for matches in matches_iter:
+            remaining = limit - result.total_matches
+            if remaining <= 0:
+                # 上限ちょうどに達した後にも一致したファイルがある
+                result.truncated = True
+                break
+            if matches.count > remaining:
+                _trim(matches, remaining)
+                result.files.append(matches)
+                result.total_matches += matches.count
+                result.truncated = True
+                break
+            result.files.append(matches)
+            result.total_matches += matches.count
+    finally:
+        matches_iter.close()
+    return result
+
+def _trim(matches: FileMatches, keep: int):
+    """一致した行が keep 行になるように後ろのまとまりを削る"""
+    seen = 0
+    for block_index, block in enumerate(matches.blocks):
+        for line_index, (_, is_match, _) in enumerate(block):
+            if is_match:
+                seen += 1
+                if seen == keep:
+                    matches.blocks[block_index] = block[:line_index + 1]
+                    del matches.blocks[block_index + 1:]
+                    matches.count = keep
+                    return
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+セッションの実行コンテキスト
+
+async_main.py では1つのプロセスで複数のセッションを並行して実行するため、アーティファクトの保存先と
+シェルセッションのキーをモジュールの変数ではなく contextvars でセッションごとに保持する。
+asyncio のタスクと asyncio.to_thread は呼び出し元のコンテキストを引き継ぐ。スレッドプールに
+渡すときは contextvars.copy_context() で引き継ぐ（parser.ToolExecutor を参照）。
+
+session_scope の外（main.py）では artifact_store.open_store で開いた保存先と
+"default" のシェルセッションを使う。
+"""
+
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterator, Optional
+
+if TYPE_CHECKING:
+    from artifact_store import ArtifactStore
+
+# session_scope の外で使うシェルセッションのキー
+DEFAULT_SHELL_KEY = "default"
+
+@dataclass
+class SessionContext:
+    """実行中のセッションの情報"""
+    session_id: str
+    # 大きなツールの結果の保存先
+    artifacts: "ArtifactStore"
+
+_current: "contextvars.ContextVar[Optional[SessionContext]]" = contextvars.ContextVar("session_context", default=None)
+
+def current_session() -> Optional[SessionContext]:
+    """実行中のセッション（session_scope の外では None）"""
+    return _current.get()
+
+@contextmanager
+def session_scope(context: SessionContext) -> Iterator[SessionContext]:
+    """ブロックの中をセッションのコンテキストで実行する"""
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+def shell_key() -> str:
+    """実行中のセッションのシェルセッションのキー"""
+    context = _current.get()
+    return context.session_id if context is not None else DEFAULT_SHELL_KEY
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+永続的なシェルセッション
+
+ExecuteCommand のたびにシェルを起動する代わりに、長時間動作する1つのシェルにパイプ経由で
+コマンドを送り、標準出力と標準エラー出力に書き出した区切り文字（セッションごとの乱数とコマンドの
+通し番号）までをそのコマンドの出力として読み取る。`cd` や環境変数の変更は次のコマンドに引き継がれる。
+
+シェルが終了した場合（コマンド中の `exit` など）は、次のコマンドを実行するときに自動的に
+起動し直す（作業ディレクトリと環境変数は起動時の状態に戻る）。
+
+環境変数 AGENT_SHELL_SESSION=true の場合だけ使用する。
+"""
+
+import os
+import sys
+import uuid
+import queue
+import time
+import signal
+import base64
+import shutil
+import threading
+import subprocess
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# 永続的なシェルセッションを使用するかどうか
+SHELL_SESSION_ENABLED = os.getenv("AGENT_SHELL_SESSION", "false").lower() == "true"
+# 同時に保持するシェルセッションの最大数
+SHELL_POOL_SIZE = int(os.getenv("AGENT_SHELL_POOL_SIZE", "4"))
+
+_WINDOWS = sys.platform.startswith("win")
+_READ_CHUNK_SIZE = 64 * 1024
+
+@dataclass
+class ShellResult:
+    returncode: int
+    stdout: str
+    stderr: str
+    # コマンドの途中でシェルが終了した（次のコマンドでは起動し直したシェルを使用する）
+    shell_exited: bool = False
+
+def _shell_command() -> List[str]:
+    if _WINDOWS:
+        return ["powershell.exe", "-NoLogo", "-NoProfile", "-NonInteractive", "-Command", "-"]
+    bash = shutil.which("bash")
+    if bash:
+        return [bash, "--noprofile", "--norc"]
+    return ["/bin/sh"]
+
+def _wrap_posix(command: str, marker: str) -> str:
+    """
+    コマンドを区切り文字の出力で囲む（sh / bash）
+
+    コマンドは引用符で囲まないヒアドキュメントで渡して eval するため、複数行のコマンドや
+    引用符を含むコマンドもそのまま実行できる。標準入力はシェルへのパイプを読まないよう /dev/null にする。
+    """
+    delimiter = f"__AGENT_CMD_{uuid.uuid4().hex}"
+    return (
+        f"eval \"$(cat <<'{delimiter}'\n{command}\n{delimiter}\n)\" < /dev/null\n"
+        f"__agent_rc=$?\n"
+        f"printf '\\n%s %d\\n' '{marker}' \"$__agent_rc\"\n"
+        f"printf '\\n%s\\n' '{marker}' >&2\n"
+    )
+
+def _wrap_powershell(command: str, marker: str) -> str:
+    """コマンドを区切り文字の出力で囲む（PowerShell。コマンドは Base64 で渡して1行にする）"""
+    encoded = base64.b64encode(command.encode("utf-8")).decode("ascii")
+    return (
+        f"$__agent_cmd = [Text.Encoding]::UTF8.GetString([Convert]::FromBase64String('{encoded}')); "
+        "$global:LASTEXITCODE = 0; $__agent_ok = $true; "
+        "try { Invoke-Expression $__agent_cmd | Out-String -Stream } "
+        "catch { $__agent_ok = $false; [Console]::Error.WriteLine($_.ToString()) }; "
+        "$__agent_rc = if ($LASTEXITCODE) { $LASTEXITCODE } elseif ($__agent_ok) { 0 } else { 1 }; "
+        f"[Console]::Out.WriteLine(''); [Console]::Out.WriteLine('{marker} ' + $__agent_rc); "
+        f"[Console]::Error.WriteLine(''); [Console]::Error.WriteLine('{marker}')\n"
+    )
+
+def _kill_tree(process: subprocess.Popen):
+    """シェルとシェルから起動したプロセスを終了する"""
+    try:
+        if _WINDOWS:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    if process.poll() is None:
+        process.kill()
+
+class _MarkerScanner:
+    """
+    ストリームから区切り文字の行までを読み取る
+
+    区切り文字は行頭にだけ現れるよう改行を前に付けて出力するため、その改行も区切り文字の一部として
+    取り除く（コマンドの出力が改行で終わらない場合も元の出力のままになる）。
+    """
+
+    def __init__(self, marker: bytes):
+        self.marker = b"\n" + marker
+        self.output = bytearray()
+        self.status: Optional[bytes] = None
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> bool:
+        """読み取ったデータを追加し、区切り文字の行まで読み取った場合は True を返す"""
+        data = self._pending + chunk
+        index = data.find(self.marker)
+        if index >= 0:
+            end = data.find(b"\n", index + len(self.marker))
+            if end < 0:
+                self._pending = data
+                return False
+            self.output += data[:index]
+            self.status = data[index + len(self.marker):end].strip()
+            self._pending = b""
+            return True
+        # 区切り文字の途中で切れている可能性がある末尾は次のデータと合わせて調べる
+        keep = len(self.marker) - 1
+        self.output += data[:-keep] if len(data) > keep else b""
+        self._pending = data[-keep:] if len(data) > keep else data
+        return False
+
+    def finish(self) -> bytes:
+        """区切り文字を読み取る前にストリームが終了した場合の出力"""
+        return bytes(self.output + self._pending)
+
+    def text(self) -> str:
+        output = bytes(self.output)
+        if output.endswith(b"\r"):
+            output = output[:-1]
+        return output.decode("utf-8", errors="replace")
+
+class ShellSession:
+    """
+    1つの長時間動作するシェル
+
+    標準出力と標準エラー出力はスレッドで読み取ってキューに入れ、run() が区切り文字まで取り出す。
+    同じセッションでは一度に1つのコマンドだけを実行する。
+    """
+
+    def __init__(self, cwd: Optional[str] = None):
+        self.cwd = cwd or os.getcwd()
+        self._token = uuid.uuid4().hex
+        self._counter = 0
+        self._process: Optional[subprocess.Popen] = None
+        self._chunks: "queue.Queue[Tuple[int, Optional[bytes]]]" = queue.Queue()
+        self.lock = threading.Lock()
+        # 起動した回数（2回目以降は自動的に起動し直したことを示す）
+        self.starts = 0
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def _start(self):
+        self._chunks = queue.Queue()
+        self._process = subprocess.Popen(
+            _shell_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+            # タイムアウトしたときにシェルから起動したプロセスもまとめて終了できるようにする
+            start_new_session=not _WINDOWS,
+        )
+        self.starts += 1
+        for index, stream in enumerate((self._process.stdout, self._process.stderr)):
+            threading.Thread(
+                target=self._read_stream, args=(stream, index, self._chunks),
+                name=f"shell-reader-{index}", daemon=True
+            ).start()
+        if _WINDOWS:
+            self._send("[Console]::OutputEncoding = [Text.Encoding]::UTF8; $OutputEncoding = [Text.Encoding]::UTF8\n")
+
+    @staticmethod
+    def _read_stream(stream, index: int, chunks: queue.Queue):
+        while True:
+            chunk = stream.read1(_READ_CHUNK_SIZE) if hasattr(stream, "read1") else stream.read(_READ_CHUNK_SIZE)
+            chunks.put((index, chunk or None))
+            if not chunk:
+                return
+
+    def _send(self, script: str):
+        self._process.stdin.write(script.encode("utf-8"))
+        self._process.stdin.flush()
+
+    def run(self, command: str, timeout: Optional[float] = None) -> ShellResult:
+        """
+        コマンドを実行して終了を待つ
+
+        Args:
+            command: 実行するコマンド
+            timeout: 待機する最大秒数（None の場合は無制限）。超えた場合はシェルを終了して TimeoutExpired を送出する
+
+        Returns:
+            ShellResult: 終了コードと出力
+        """
+        with self.lock:
+            if not self.is_alive():
+                self._start()
+            self._counter += 1
+            marker = f"__AGENT_DONE_{self._token}_{self._counter}__"
+            wrap = _wrap_powershell if _WINDOWS else _wrap_posix
+            try:
+                self._send(wrap(command, marker))
+            except OSError:
+                # 前のコマンドの後でシェルが終了していた場合は起動し直して1回だけ送り直す
+                self.close()
+                self._start()
+                self._send(wrap(command, marker))
+            return self._collect(command, marker.encode("ascii"), timeout)
+
+    def _collect(self, command: str, marker: bytes, timeout: Optional[float]) -> ShellResult:
+        scanners = (_MarkerScanner(marker), _MarkerScanner(marker))
+        done = [False, False]
+        closed = [False, False]
+        # timeout はコマンド全体の上限（出力が続いていても期限を過ぎれば打ち切る）
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not all(done[i] or closed[i] for i in range(2)):
+            try:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                index, chunk = self._chunks.get(timeout=remaining)
+            except queue.Empty:
+                self.close()
+                raise subprocess.TimeoutExpired(command, timeout)
+            if chunk is None:
+                closed[index] = True
+            elif not done[index]:
+                done[index] = scanners[index].feed(chunk)
+
+        stdout, stderr = scanners
+        if all(done):
+            return ShellResult(int(stdout.status or b"0"), stdout.text(), stderr.text())
+        # 区切り文字を出力する前にシェルが終了した
+        returncode = self._process.wait()
+        self._process = None
+        return ShellResult(
+            returncode if returncode != 0 else 1,
+            stdout.finish().decode("utf-8", errors="replace"),
+            stderr.finish().decode("utf-8", errors="replace"),
+            shell_exited=True
+        )
+
+    def close(self):
+        """シェルを終了する（次の run() で起動し直す）"""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        if process.poll() is None:
+            _kill_tree(process)
+        process.wait()
+
+class ShellSessionPool:
+    """
+    キー（エージェントのセッション）ごとのシェルセッションを保持する
+
+    最大数を超えた場合は、コマンドを実行していないセッションのうち最後に使われた日時が最も古いものを
+    終了する（すべて実行中の場合は一時的に最大数を超えて作成する）。
+    """
+
+    def __init__(self, max_sessions: int = SHELL_POOL_SIZE):
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, ShellSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str = "default", cwd: Optional[str] = None) -> ShellSession:
+        """キーに対応するセッションを取得する（ない場合は作成する）"""
+        evicted = []
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                while len(self._sessions) >= self.max_sessions:
+                    idle = next((k for k, s in self._sessions.items() if not s.lock.locked()), None)
+                    if idle is None:
+                        break
+                    evicted.append(self._sessions.pop(idle))
+                session = ShellSession(cwd)
+                self._sessions[key] = session
+            self._sessions.move_to_end(key)
+        for old in evicted:
+            old.close()
+        return session
+
+    def close(self, key: str):
+        """キーに対応するセッションを終了する"""
+        with self._lock:
+            session = self._sessions.pop(key, None)
+        if session is not None:
+            session.close()
+
+    def close_all(self):
+        """すべてのセッションを終了する"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+shell_pool = ShellSessionPool()
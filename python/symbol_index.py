@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Python のシンボルインデックス
+
+ワークスペースの .py ファイルを ast で解析し、定義（クラス・関数・メソッド・
+モジュール直下の変数）、import、呼び出し箇所を行番号付きで記録する。
+インデックスは .agent_cache/symbol_index.json に保存し、更新日時とサイズが
+変わったファイルだけを解析し直す。解析するファイルが多い場合はプロセスプールで並列に解析する。
+"""
+
+import ast
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from patcher import atomic_write
+from search import SEARCH_WORKERS
+from workspace_index import INDEX_DIR_NAME, list_directory
+
+INDEX_FILE_NAME = "symbol_index.json"
+INDEX_VERSION = 1
+# 解析するファイル数がこれ未満の場合はプロセスプールを使わずにその場で解析する
+_PARALLEL_MIN_FILES = 50
+# 1つのタスクで解析するファイル数の下限
+_MIN_CHUNK_FILES = 8
+
+@dataclass
+class Definition:
+    path: str
+    # クラス内の定義は "Class.method" のように外側の名前を付ける
+    qualname: str
+    # class / function / method / variable
+    kind: str
+    start_line: int
+    end_line: int
+
+@dataclass
+class Reference:
+    path: str
+    line: int
+    # call（呼び出し）/ import
+    kind: str
+
+class _SymbolVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.definitions: List[list] = []
+        self.imports: List[list] = []
+        # 呼び出す名前 -> 行番号のリスト
+        self.calls: Dict[str, List[int]] = {}
+        self._scope: List[Tuple[str, bool]] = []
+
+    def _define(self, node, kind: str):
+        qualname = ".".join([name for name, _ in self._scope] + [node.name])
+        # デコレーターも定義の行に含める
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        self.definitions.append([qualname, kind, start, getattr(node, "end_lineno", node.lineno)])
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self._define(node, "class")
+        self._scope.append((node.name, True))
+        self.generic_visit(node)
+        self._scope.pop()
+
+    def visit_FunctionDef(self, node):
+        in_class = bool(self._scope) and self._scope[-1][1]
+        self._define(node, "method" if in_class else "function")
+        self._scope.append((node.name, False))
+        self.generic_visit(node)
+        self._scope.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Assign(self, node: ast.Assign):
+        if not self._scope:
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    self.definitions.append([target.id, "variable", node.lineno, getattr(node, "end_lineno", node.lineno)])
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign):
+        if not self._scope and isinstance(node.target, ast.Name):
+            self.definitions.append([node.target.id, "variable", node.lineno, getattr(node, "end_lineno", node.lineno)])
+        self.generic_visit(node)
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self.imports.append([alias.name, "", alias.asname or "", node.lineno])
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        module = "." * node.level + (node.module or "")
+        for alias in node.names:
+            self.imports.append([module, alias.name, alias.asname or "", node.lineno])
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        if isinstance(func, ast.Name):
+            self.calls.setdefault(func.id, []).append(node.lineno)
+        elif isinstance(func, ast.Attribute):
+            self.calls.setdefault(func.attr, []).append(node.lineno)
+        self.generic_visit(node)
+
+def _parse_file(path: str) -> Optional[Dict[str, Any]]:
+    """1ファイルを解析する（読み取れない場合は None、構文エラーの場合は空の記録）"""
+    try:
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            source = f.read()
+    except OSError:
+        return None
+    record = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "definitions": [], "imports": [], "calls": {}}
+    try:
+        tree = ast.parse(source, filename=path)
+    except (SyntaxError, ValueError):
+        # 解析できないファイルも記録し、変更されるまで解析し直さない
+        record["error"] = True
+        return record
+    visitor = _SymbolVisitor()
+    visitor.visit(tree)
+    record["definitions"] = visitor.definitions
+    record["imports"] = visitor.imports
+    record["calls"] = visitor.calls
+    return record
+
+def _parse_files(paths: List[str]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """プロセスプールで実行する（ファイルのまとまりを解析する）"""
+    return [(path, _parse_file(path)) for path in paths]
+
+class SymbolIndex:
+    """
+    ワークスペースの .py ファイルのシンボルインデックス
+
+    パスはルートからの "/" 区切りの相対パスで扱う。
+    """
+
+    def __init__(self, root: str, workers: int = SEARCH_WORKERS):
+        self.root = os.path.realpath(root)
+        self.index_path = os.path.join(self.root, INDEX_DIR_NAME, INDEX_FILE_NAME)
+        self.workers = max(1, workers)
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.parsed = 0
+        self._load()
+
+    @property
+    def file_count(self) -> int:
+        return len(self._files)
+
+    def refresh(self) -> int:
+        """
+        追加・変更されたファイルを解析し、削除されたファイルを取り除く
+
+        Returns:
+            int: 解析したファイル数
+        """
+        _, files = list_directory(self.root, recursive=True)
+        current = {f.replace(os.sep, "/") for f in files if f.endswith(".py")}
+        changed = False
+        for rel in list(self._files):
+            if rel not in current:
+                del self._files[rel]
+                changed = True
+
+        stale = []
+        for rel in sorted(current):
+            record = self._files.get(rel)
+            try:
+                stat = os.stat(os.path.join(self.root, rel))
+            except OSError:
+                continue
+            if record is None or record["mtime_ns"] != stat.st_mtime_ns or record["size"] != stat.st_size:
+                stale.append(rel)
+
+        for rel, record in self._parse(stale):
+            if record is None:
+                self._files.pop(rel, None)
+            else:
+                self._files[rel] = record
+            changed = True
+        self.parsed += len(stale)
+        if changed:
+            self._save()
+        return len(stale)
+
+    def _parse(self, rels: List[str]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        paths = [os.path.join(self.root, rel) for rel in rels]
+        if len(paths) < _PARALLEL_MIN_FILES or self.workers <= 1:
+            parsed = _parse_files(paths)
+        else:
+            # 初回の構築など、解析するファイルが多いときだけプロセスを起動する
+            chunk_size = max(_MIN_CHUNK_FILES, -(-len(paths) // (self.workers * 4)))
+            chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+            parsed = []
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                for result in pool.map(_parse_files, chunks):
+                    parsed.extend(result)
+        return [(rel, record) for rel, (_, record) in zip(rels, parsed)]
+
+    def find_definitions(self, name: str) -> List[Definition]:
+        """
+        名前に一致する定義を探す
+
+        "Class.method" のような修飾名、または末尾の名前（"method"）で指定できる。
+        修飾名が完全に一致するものを先に返す。
+
+        Args:
+            name: シンボル名
+
+        Returns:
+            List[Definition]: 一致した定義
+        """
+        with self._lock:
+            self.refresh()
+            exact, partial = [], []
+            for rel, record in sorted(self._files.items()):
+                for qualname, kind, start, end in record["definitions"]:
+                    if qualname == name:
+                        exact.append(Definition(rel, qualname, kind, start, end))
+                    elif qualname.endswith("." + name):
+                        partial.append(Definition(rel, qualname, kind, start, end))
+            return exact + partial
+
+    def find_references(self, name: str) -> List[Reference]:
+        """
+        名前の呼び出し箇所と import を探す
+
+        Args:
+            name: シンボル名（修飾名の場合は末尾の名前で探す）
+
+        Returns:
+            List[Reference]: 呼び出し・import の箇所
+        """
+        short = name.rsplit(".", 1)[-1]
+        with self._lock:
+            self.refresh()
+            references = []
+            for rel, record in sorted(self._files.items()):
+                for module, imported, alias, line in record["imports"]:
+                    if short in (imported, alias) or (not imported and module.rsplit(".", 1)[-1] == short):
+                        references.append(Reference(rel, line, "import"))
+                for line in record["calls"].get(short, ()):
+                    references.append(Reference(rel, line, "call"))
+            return sorted(references, key=lambda r: (r.path, r.line))
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION and data.get("root") == self.root:
+            self._files = data.get("files", {})
+
+    def _save(self):
+        data = {"version": INDEX_VERSION, "root": self.root, "files": self._files}
+        try:
+            atomic_write(self.index_path, json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        except OSError:
+            # 保存できなくてもメモリ上のインデックスは使える
+            pass
+
+_index: Optional[SymbolIndex] = None
+_index_lock = threading.Lock()
+
+def get_symbol_index() -> SymbolIndex:
+    """作業ディレクトリのシンボルインデックスを返す"""
+    global _index
+    with _index_lock:
+        root = os.path.realpath(os.getcwd())
+        if _index is None or _index.root != root:
+            _index = SymbolIndex(root)
+        return _index
@@ -2,10 +2,33 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import subprocess
-import glob
 from dataclasses import dataclass
 from typing import List, Optional
+from file_cache import file_cache
+from patcher import apply_edit, atomic_write, read_text_preserving_newlines
+from workspace_index import list_directory
+from search import SEARCH_MAX_RESULTS, search as search_workspace
+from symbol_index import get_symbol_index
+from shell_session import SHELL_SESSION_ENABLED, shell_pool
+from session_context import shell_key
+from artifact_store import DEFAULT_THRESHOLD, get_store
+
+# 範囲を指定せずに読み取るときの最大バイト数（超える場合は先頭部分だけを返す）
+READ_MAX_BYTES = int(os.getenv("AGENT_READ_MAX_BYTES", str(256 * 1024)))
+# FindDefinition で返す定義の数と、1つの定義で返す最大行数
+MAX_DEFINITIONS = 10
+MAX_DEFINITION_LINES = 200
+# FindDefinition で返す参照箇所の最大数
+MAX_REFERENCES = 50
+
+# 数値パラメータを変換する（空文字列や不正な値は default）
+def _to_int(value: str, default: int = 0) -> int:
+    try:
+        return int(value.strip()) if value and value.strip() else default
+    except ValueError:
+        return default
 
 # データクラスの定義
 @dataclass
@@ -16,11 +39,18 @@ class ListFileParams:
 @dataclass
 class ReadFileParams:
     path: str
+    # 範囲指定（いずれも省略可能。行は1始まりで終了行を含む）
+    start_line: str = ""
+    end_line: str = ""
+    byte_offset: str = ""
+    byte_length: str = ""
 
 @dataclass
 class WriteFileParams:
     path: str
     content: str
+    # 編集モード（SEARCH/REPLACE ブロックまたは unified diff）。指定時は content を使わない
+    edit: str = ""
 
 @dataclass
 class AskQuestionParams:
@@ -35,10 +65,37 @@ class ExecuteCommandParams:
 class CompleteParams:
     result: str
 
+@dataclass
+class SearchParams:
+    pattern: str
+    # いずれも省略可能
+    path: str = ""
+    file_pattern: str = ""
+    ignore_case: str = ""
+    context_lines: str = ""
+    max_results: str = ""
+
+@dataclass
+class FindDefinitionParams:
+    name: str
+    # "true" の場合は呼び出し箇所と import も返す
+    references: str = ""
+
+@dataclass
+class ReadArtifactParams:
+    id: str
+    # 範囲指定（ReadFile と同じ。省略した場合は先頭から）
+    start_line: str = ""
+    end_line: str = ""
+    byte_offset: str = ""
+    byte_length: str = ""
+
 @dataclass
 class ToolResponse:
     success: bool
     message: str
+    # 結果をアーティファクトに保存した場合の ID（message はプレビュー）
+    artifact_id: str = ""
 
 # 1. ListFile - ディレクトリ内のファイル一覧を取得
 def list_file(params: ListFileParams) -> ToolResponse:
@@ -46,17 +103,12 @@ def list_file(params: ListFileParams) -> ToolResponse:
     recursive = params.recursive.lower() == "true"
     
     try:
-        files = []
-        if recursive:
-            for file_path in glob.glob(os.path.join(path, "**"), recursive=True):
-                files.append(file_path)
-        else:
-            for file_path in glob.glob(os.path.join(path, "*")):
-                files.append(file_path)
+        # 作業ディレクトリ以下はインデックスから返す（.gitignore で除外されたものは含まない）
+        dirs, files = list_directory(path, recursive)
+        entries = sorted([os.path.join(path, d) + os.sep for d in dirs] + [os.path.join(path, f) for f in files])
         
         result = f"ディレクトリ {path} のファイル一覧:\n"
-        for file in files:
-            result += f"- {file}\n"
+        result += "".join(f"- {entry}\n" for entry in entries)
         
         return ToolResponse(
             success=True,
@@ -71,12 +123,50 @@ def list_file(params: ListFileParams) -> ToolResponse:
 # 2. ReadFile - ファイルの内容を読み取る
 def read_file(params: ReadFileParams) -> ToolResponse:
     try:
-        with open(params.path, "r", encoding="utf-8") as f:
-            content = f.read()
+        start_line = _to_int(params.start_line)
+        end_line = _to_int(params.end_line)
+        byte_length = _to_int(params.byte_length)
+        
+        # バイト単位の範囲指定（1回に返す大きさは READ_MAX_BYTES まで）
+        if byte_length > 0:
+            offset = _to_int(params.byte_offset)
+            length = min(byte_length, READ_MAX_BYTES)
+            piece = file_cache.read_bytes(params.path, offset, length)
+            end = min(offset + length, piece.total_bytes)
+            header = f"ファイル {params.path} の {offset}-{end}バイト目（全{piece.total_bytes}バイト）"
+            if byte_length > READ_MAX_BYTES:
+                header += f"。{READ_MAX_BYTES}バイトまでを表示しています"
+            return ToolResponse(
+                success=True,
+                message=f"{header}:\n{piece.text}"
+            )
+        
+        # 範囲指定が無く、大きすぎないファイルは全体を返す（変更されていなければキャッシュから）
+        if start_line <= 0 and end_line <= 0 and os.path.getsize(params.path) <= READ_MAX_BYTES:
+            content = file_cache.read_text(params.path, encoding="utf-8")
+            return ToolResponse(
+                success=True,
+                message=content
+            )
         
+        # 行単位の範囲指定（範囲指定が無い大きなファイルは先頭から。どちらも上限バイト数まで）
+        piece = file_cache.read_lines(params.path, start_line or 1, end_line, max_bytes=READ_MAX_BYTES)
+        if piece.end_line < piece.start_line:
+            return ToolResponse(
+                success=False,
+                message=f"開始行 {piece.start_line} はファイルの行数（{piece.total_lines}行）を超えています"
+            )
+        header = f"ファイル {params.path} の {piece.start_line}-{piece.end_line}行目（全{piece.total_lines}行）"
+        text = piece.text
+        if len(text) * 4 > READ_MAX_BYTES and len(text.encode("utf-8")) > READ_MAX_BYTES:
+            # 1行だけで上限を超える場合は、行の途中までを返す
+            text = text.encode("utf-8")[:READ_MAX_BYTES].decode("utf-8", errors="ignore")
+            header += f"。行が長いため先頭の{READ_MAX_BYTES}バイトまでを表示しています。続きは byte_offset と byte_length を指定して読み取ってください"
+        elif piece.truncated:
+            header += f"。大きいため {piece.end_line}行目までを表示しています。続きは start_line と end_line を指定して読み取ってください"
         return ToolResponse(
             success=True,
-            message=content
+            message=f"{header}:\n{text}"
         )
     except Exception as e:
         return ToolResponse(
@@ -86,12 +176,12 @@ def read_file(params: ReadFileParams) -> ToolResponse:
 
 # 3. WriteFile - ファイルに内容を書き込む
 def write_file(params: WriteFileParams) -> ToolResponse:
+    if params.edit:
+        return _edit_file(params)
     try:
-        # ディレクトリが存在しない場合は作成
-        os.makedirs(os.path.dirname(params.path), exist_ok=True)
-        
-        with open(params.path, "w", encoding="utf-8") as f:
-            f.write(params.content)
+        # 一時ファイルに書き込んでから置き換える（ディレクトリが存在しない場合は作成）
+        atomic_write(params.path, params.content)
+        file_cache.invalidate(params.path)
         
         return ToolResponse(
             success=True,
@@ -103,6 +193,40 @@ def write_file(params: WriteFileParams) -> ToolResponse:
             message=f"ファイルの書き込みに失敗しました: {str(e)}"
         )
 
+# 編集モード: 既存ファイルに差分を適用し、適用できたハンクだけを書き込む
+def _edit_file(params: WriteFileParams) -> ToolResponse:
+    try:
+        if not os.path.isfile(params.path):
+            return ToolResponse(
+                success=False,
+                message=f"ファイル {params.path} が存在しません。新規作成には <content> を使用してください"
+            )
+        original, newline = read_text_preserving_newlines(params.path)
+        result = apply_edit(original, params.edit)
+        if result.error and not result.hunks:
+            return ToolResponse(success=False, message=f"編集内容を解釈できません: {result.error}")
+        
+        summary = result.summary()
+        if result.error:
+            summary += f"\n警告: {result.error}"
+        if not result.applied:
+            return ToolResponse(
+                success=False,
+                message=f"ファイル {params.path} を編集できませんでした（変更なし）\n{summary}"
+            )
+        
+        atomic_write(params.path, result.content, newline=newline)
+        file_cache.invalidate(params.path)
+        return ToolResponse(
+            success=not result.failed,
+            message=f"ファイル {params.path} を編集しました\n{summary}"
+        )
+    except Exception as e:
+        return ToolResponse(
+            success=False,
+            message=f"ファイルの編集に失敗しました: {str(e)}"
+        )
+
 # 4. AskQuestion - ユーザーに質問する
 def ask_question(params: AskQuestionParams) -> ToolResponse:
     print(f"\n質問: {params.question}")
@@ -131,6 +255,9 @@ def execute_command(params: ExecuteCommandParams) -> ToolResponse:
                 message="コマンドの実行がキャンセルされました"
             )
     
+    if SHELL_SESSION_ENABLED:
+        return _execute_in_session(params.command)
+
     try:
         # PowerShell上でコマンドを実行
         process = subprocess.Popen(
@@ -158,9 +285,150 @@ def execute_command(params: ExecuteCommandParams) -> ToolResponse:
             message=f"コマンドの実行中にエラーが発生しました: {str(e)}"
         )
 
+# 永続的なシェルセッションでコマンドを実行する（作業ディレクトリと環境変数を次のコマンドに引き継ぐ）
+def _execute_in_session(command: str) -> ToolResponse:
+    try:
+        result = shell_pool.get(shell_key()).run(command)
+    except Exception as e:
+        return ToolResponse(
+            success=False,
+            message=f"コマンドの実行中にエラーが発生しました: {str(e)}"
+        )
+
+    if result.shell_exited:
+        return ToolResponse(
+            success=False,
+            message=f"コマンドの実行中にシェルが終了しました: 終了コード {result.returncode}\n"
+                    f"出力: {result.stdout}\nエラー: {result.stderr}\n"
+                    "次のコマンドは新しいシェルで実行します（作業ディレクトリと環境変数は初期状態に戻ります）"
+        )
+    if result.returncode != 0:
+        return ToolResponse(
+            success=False,
+            message=f"コマンドの実行に失敗しました: 終了コード {result.returncode}\n出力: {result.stdout}\nエラー: {result.stderr}"
+        )
+    return ToolResponse(
+        success=True,
+        message=f"コマンドの実行結果:\n{result.stdout}"
+    )
+
 # 6. Complete - タスクの完了を示す
 def complete(params: CompleteParams) -> ToolResponse:
     return ToolResponse(
         success=True,
         message=f"タスク完了: {params.result}"
-    ) 
\ No newline at end of file
+    )
+
+# 7. Search - ワークスペースのファイルを正規表現で検索する
+def search(params: SearchParams) -> ToolResponse:
+    if not params.pattern:
+        return ToolResponse(success=False, message="検索パターンを指定してください")
+    try:
+        result = search_workspace(
+            params.pattern,
+            path=params.path or ".",
+            file_pattern=params.file_pattern,
+            ignore_case=params.ignore_case.lower() == "true",
+            context=max(0, _to_int(params.context_lines, 2)),
+            limit=_to_int(params.max_results, SEARCH_MAX_RESULTS)
+        )
+        return ToolResponse(
+            success=True,
+            message=result.format(params.pattern)
+        )
+    except re.error as e:
+        return ToolResponse(
+            success=False,
+            message=f"正規表現が正しくありません: {str(e)}"
+        )
+    except Exception as e:
+        return ToolResponse(
+            success=False,
+            message=f"検索に失敗しました: {str(e)}"
+        )
+
+# 8. FindDefinition - Python のクラス・関数などの定義を探す
+def find_definition(params: FindDefinitionParams) -> ToolResponse:
+    name = params.name.strip()
+    if not name:
+        return ToolResponse(success=False, message="シンボル名を指定してください")
+    try:
+        index = get_symbol_index()
+        definitions = index.find_definitions(name)
+        if not definitions:
+            message = f"'{name}' の定義は見つかりませんでした（{index.file_count}ファイルを検索）"
+        else:
+            parts = [f"'{name}' の定義: {len(definitions)}件"]
+            for definition in definitions[:MAX_DEFINITIONS]:
+                end_line = min(definition.end_line, definition.start_line + MAX_DEFINITION_LINES - 1)
+                piece = file_cache.read_lines(
+                    os.path.join(index.root, definition.path), definition.start_line, end_line
+                )
+                header = f"## {definition.path}:{definition.start_line}-{definition.end_line} ({definition.kind} {definition.qualname})"
+                parts.append(f"{header}\n{piece.text.rstrip()}")
+                if end_line < definition.end_line:
+                    parts.append(f"(先頭の{MAX_DEFINITION_LINES}行のみ表示しました。続きはReadFileで範囲を指定して読み取ってください)")
+            if len(definitions) > MAX_DEFINITIONS:
+                parts.append(f"(ほかに{len(definitions) - MAX_DEFINITIONS}件の定義があります。修飾名（例: Class.method）で絞り込んでください)")
+            message = "\n\n".join(parts)
+
+        if params.references.lower() == "true":
+            message += "\n\n" + _format_references(index, name)
+        return ToolResponse(success=bool(definitions), message=message)
+    except Exception as e:
+        return ToolResponse(
+            success=False,
+            message=f"定義の検索に失敗しました: {str(e)}"
+        )
+
+def _format_references(index, name: str) -> str:
+    references = index.find_references(name)
+    if not references:
+        return f"'{name}' の呼び出し・importは見つかりませんでした"
+    lines = [f"'{name}' の呼び出し・import: {len(references)}件"]
+    for reference in references[:MAX_REFERENCES]:
+        piece = file_cache.read_lines(os.path.join(index.root, reference.path), reference.line, reference.line)
+        lines.append(f"{reference.path}:{reference.line}: {piece.text.strip()}")
+    if len(references) > MAX_REFERENCES:
+        lines.append(f"(ほかに{len(references) - MAX_REFERENCES}件あります)")
+    return "\n".join(lines)
+
+# 9. ReadArtifact - アーティファクトに保存した大きな結果を範囲を指定して読み取る
+def read_artifact(params: ReadArtifactParams) -> ToolResponse:
+    store = get_store()
+    path = store.path(params.id) if store is not None else None
+    if path is None:
+        return ToolResponse(success=False, message=f"アーティファクト {params.id} が見つかりません")
+    # 1回に返す大きさはアーティファクトに保存する上限まで（結果がまたアーティファクトにならないように）
+    max_bytes = store.threshold if store.threshold > 0 else DEFAULT_THRESHOLD
+    try:
+        byte_length = _to_int(params.byte_length)
+        if byte_length > 0:
+            offset = _to_int(params.byte_offset)
+            piece = file_cache.read_bytes(path, offset, min(byte_length, max_bytes))
+            end = min(offset + min(byte_length, max_bytes), piece.total_bytes)
+            header = f"アーティファクト {params.id} の {offset}-{end}バイト目（全{piece.total_bytes}バイト）"
+            if byte_length > max_bytes:
+                header += f"。{max_bytes}バイトまでを表示しています"
+            return ToolResponse(success=True, message=f"{header}:\n{piece.text}")
+
+        piece = file_cache.read_lines(path, _to_int(params.start_line) or 1, _to_int(params.end_line), max_bytes=max_bytes)
+        if piece.end_line < piece.start_line:
+            return ToolResponse(
+                success=False,
+                message=f"開始行 {piece.start_line} はアーティファクトの行数（{piece.total_lines}行）を超えています"
+            )
+        header = f"アーティファクト {params.id} の {piece.start_line}-{piece.end_line}行目（全{piece.total_lines}行）"
+        text = piece.text
+        if len(text) * 4 > max_bytes and len(text.encode("utf-8")) > max_bytes:
+            # 1行だけで上限を超える場合は、行の途中までを返す
+            text = text.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")
+            header += f"。行が長いため先頭の{max_bytes}バイトまでを表示しています。続きは byte_offset と byte_length を指定して読み取ってください"
+        elif piece.truncated:
+            header += f"。大きいため {piece.end_line}行目までを表示しています。続きは start_line と end_line を指定して読み取ってください"
+        return ToolResponse(success=True, message=f"{header}:\n{text}")
+    except Exception as e:
+        return ToolResponse(
+            success=False,
+            message=f"アーティファクトの読み取りに失敗しました: {str(e)}"
+        )
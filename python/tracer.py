@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+処理時間のスパンの記録
+
+LLM の呼び出し、ツール呼び出しの解析、ツールの実行、ログの書き込みなどの区間（スパン）を
+記録し、Chrome のトレースイベント形式（JSON）で書き出す。書き出したファイルは
+Perfetto（https://ui.perfetto.dev）や chrome://tracing で開ける。
+
+環境変数 AGENT_TRACE_FILE に書き出し先を指定した場合だけ記録する。指定しない場合、
+span() は何もしない共有のオブジェクトを返すだけなので、計測のための処理はほとんど発生しない。
+"""
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from patcher import atomic_write
+
+class _NullSpan:
+    """記録しないときに返すスパン（何もしない）"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: Optional[Dict[str, Any]]):
+        self._tracer = tracer
+        self._name = name
+        self._category = category
+        self._args = args
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.set(error=exc_type.__name__)
+        self._tracer.add(self._name, self._category, self._start, end - self._start, self._args)
+        return False
+
+    def set(self, **args):
+        """スパンに引数（トレースの表示で確認できる値）を追加する"""
+        if self._args is None:
+            self._args = {}
+        self._args.update(args)
+
+class Tracer:
+    """
+    スパンをメモリに記録し、終了時に Chrome のトレースイベント形式で書き出す
+
+    スパンはスレッドごとの行（tid）に表示される。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._origin = time.perf_counter_ns()
+        self._pid = os.getpid()
+        self._events: List[Dict[str, Any]] = []
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, category: str = "", args: Optional[Dict[str, Any]] = None) -> _Span:
+        return _Span(self, name, category, args)
+
+    def add(self, name: str, category: str, start_ns: int, duration_ns: int, args: Optional[Dict[str, Any]] = None):
+        """完了したスパンを記録する（時刻は time.perf_counter_ns() の値）"""
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start_ns - self._origin) / 1000,
+            "dur": duration_ns / 1000,
+            "pid": self._pid,
+            "tid": thread.ident,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self._events.append(event)
+            if thread.ident not in self._threads:
+                self._threads[thread.ident] = thread.name
+
+    def save(self):
+        """記録したスパンをファイルに書き出す（一時ファイルを経由して置き換える）"""
+        with self._lock:
+            metadata = [
+                {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+                for tid, name in self._threads.items()
+            ]
+            data = {"traceEvents": metadata + self._events, "displayTimeUnit": "ms"}
+        atomic_write(self.path, json.dumps(data, ensure_ascii=False, default=str))
+
+def _create_tracer() -> Optional[Tracer]:
+    path = os.getenv("AGENT_TRACE_FILE", "")
+    if not path:
+        return None
+    tracer = Tracer(path)
+    atexit.register(tracer.save)
+    return tracer
+
+_tracer = _create_tracer()
+
+def is_enabled() -> bool:
+    return _tracer is not None
+
+def get_path() -> Optional[str]:
+    """書き出し先のファイル（記録していない場合は None）"""
+    return _tracer.path if _tracer is not None else None
+
+def span(name: str, category: str = "", args: Optional[Dict[str, Any]] = None):
+    """
+    区間を記録するコンテキストマネージャーを返す
+
+    Args:
+        name: スパンの名前
+        category: 分類（llm / parse / tool / log など）
+        args: トレースの表示で確認できる値
+
+    Returns:
+        with 文で使うスパン（記録しない場合は何もしないオブジェクト）
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, category, args)
+
+def traced(name: Optional[str] = None, category: str = "") -> Callable[[Callable], Callable]:
+    """関数の呼び出しをスパンとして記録するデコレーター"""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record(name: str, category: str, start_ns: int, args: Optional[Dict[str, Any]] = None):
+    """
+    start_ns（time.perf_counter_ns() の値）から現在までをスパンとして記録する
+
+    with 文で囲めない区間（ストリーミングで最初のチャンクが届くまでの時間など）に使う。
+    """
+    if _tracer is not None:
+        _tracer.add(name, category, start_ns, time.perf_counter_ns() - start_ns, args)
+
+def save():
+    """記録したスパンを書き出す（記録していない場合は何もしない）"""
+    if _tracer is not None:
+        _tracer.save()
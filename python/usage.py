@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+トークン使用量の集計
+
+LLM のレスポンスの usage（プロンプト・生成・プロンプトキャッシュに一致したトークン数）を
+ターンごとに記録し、セッション全体とツールの種類ごとに集計する。
+ツールの種類ごとの値は、そのツールを呼び出した応答の生成トークン（1つの応答で複数のツールを
+呼び出した場合は等分）と、ツールの結果として会話履歴に追加したトークン数。
+
+環境変数 AGENT_SESSION_TOKEN_BUDGET でセッション全体のトークン数の上限を指定できる。
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+# セッション全体のトークン数の上限（0 の場合は無制限）
+DEFAULT_SESSION_TOKEN_BUDGET = 0
+
+# usage の取得元
+SOURCE_API = "api"              # レスポンスの usage
+SOURCE_ESTIMATED = "estimated"  # usage を受信できなかったため tiktoken で推定（ストリーミングの打ち切りなど）
+SOURCE_CACHE = "cache"          # レスポンスキャッシュを使用（API を呼び出していない）
+
+def usage_to_dict(usage: Any) -> Optional[Dict[str, int]]:
+    """
+    OpenAI のレスポンスの usage を辞書に変換する
+
+    Args:
+        usage: CompletionUsage（None の場合は None を返す）
+
+    Returns:
+        prompt_tokens / completion_tokens / cached_tokens の辞書
+    """
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens or 0,
+        "completion_tokens": usage.completion_tokens or 0,
+        "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+    }
+
+@dataclass
+class ToolUsage:
+    calls: int = 0
+    completion_tokens: float = 0.0
+    result_tokens: int = 0
+
+class UsageTracker:
+    """
+    ターンごとのトークン使用量を記録し、セッションの上限を判定する
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_SESSION_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.turns: List[Dict[str, Any]] = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        # 前回のリクエストから書き換えられたメッセージがあったターン数（プロンプトキャッシュが途中から外れる）
+        self.prefix_breaks = 0
+        self.tools: Dict[str, ToolUsage] = {}
+        # 再開したセッションで、再開する前に記録したターン数
+        self._turn_offset = 0
+
+    @classmethod
+    def from_env(cls) -> "UsageTracker":
+        """環境変数から設定を読み込んで生成する"""
+        return cls(token_budget=int(os.getenv("AGENT_SESSION_TOKEN_BUDGET", DEFAULT_SESSION_TOKEN_BUDGET)))
+
+    def restore(self, summary: Dict[str, Any]):
+        """
+        チェックポイントに保存した集計（summary() の戻り値）から再開する
+
+        Args:
+            summary: 再開するセッションの集計
+        """
+        self._turn_offset = summary.get("turns", 0)
+        self.prompt_tokens = summary.get("prompt_tokens", 0)
+        self.completion_tokens = summary.get("completion_tokens", 0)
+        self.cached_tokens = summary.get("cached_tokens", 0)
+        self.prefix_breaks = summary.get("prefix_breaks", 0)
+        self.tools = {
+            tool_type: ToolUsage(tool["calls"], float(tool["completion_tokens"]), tool["result_tokens"])
+            for tool_type, tool in summary.get("tools", {}).items()
+        }
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def exceeded(self) -> bool:
+        """上限に達したかどうか"""
+        return self.token_budget > 0 and self.total_tokens >= self.token_budget
+
+    def would_exceed(self, prompt_tokens: int) -> bool:
+        """
+        次のリクエストで上限を超えるかどうか（プロンプトだけで超える場合に True）
+
+        Args:
+            prompt_tokens: 次に送信する会話履歴のトークン数（推定値）
+        """
+        return self.token_budget > 0 and self.total_tokens + prompt_tokens > self.token_budget
+
+    def record_turn(
+        self,
+        usage: Optional[Dict[str, int]],
+        source: str,
+        tool_types: List[str],
+        stable_prefix: int,
+        prefix_broken: bool
+    ) -> Dict[str, Any]:
+        """
+        1ターン分の使用量を記録する
+
+        Args:
+            usage: usage_to_dict の戻り値（レスポンスキャッシュを使用した場合は None）
+            source: usage の取得元（SOURCE_*）
+            tool_types: 応答で呼び出したツールの種類（出現順）
+            stable_prefix: 前回のリクエストから変わっていない先頭のメッセージ数
+            prefix_broken: 会話履歴の圧縮で固定済みの先頭部分（前回の圧縮より前の履歴）を書き換えたかどうか
+
+        Returns:
+            Dict[str, Any]: ログに書き込むデータ
+        """
+        usage = usage or {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        self.prompt_tokens += usage["prompt_tokens"]
+        self.completion_tokens += usage["completion_tokens"]
+        self.cached_tokens += usage["cached_tokens"]
+        if prefix_broken:
+            self.prefix_breaks += 1
+
+        if tool_types:
+            share = usage["completion_tokens"] / len(tool_types)
+            for tool_type in tool_types:
+                tool = self.tools.setdefault(tool_type, ToolUsage())
+                tool.calls += 1
+                tool.completion_tokens += share
+
+        record = dict(usage)
+        record.update({
+            "turn": self._turn_offset + len(self.turns) + 1,
+            "source": source,
+            "tool_types": tool_types,
+            "stable_prefix": stable_prefix,
+            "prefix_broken": prefix_broken,
+            "session_total_tokens": self.total_tokens
+        })
+        self.turns.append(record)
+        return record
+
+    def record_tool_result(self, tool_type: str, tokens: int):
+        """ツールの結果として会話履歴に追加したトークン数を記録する"""
+        self.tools.setdefault(tool_type, ToolUsage()).result_tokens += tokens
+
+    def summary(self) -> Dict[str, Any]:
+        """セッション全体の集計"""
+        return {
+            "turns": self._turn_offset + len(self.turns),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "total_tokens": self.total_tokens,
+            "token_budget": self.token_budget,
+            "budget_exceeded": self.exceeded(),
+            "prefix_breaks": self.prefix_breaks,
+            "tools": {
+                tool_type: {
+                    "calls": tool.calls,
+                    "completion_tokens": round(tool.completion_tokens),
+                    "result_tokens": tool.result_tokens
+                }
+                for tool_type, tool in sorted(self.tools.items())
+            }
+        }